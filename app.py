@@ -1,10 +1,47 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import json
+import argparse
 import os
-from datetime import datetime
+import threading
+from tracker import TrackerStore
+from tracker import instrument
+from tracker.events import describe
+from tracker.lookup import add_foods, open_lookup
+from widgets import PagedTree, TrendChart, VirtualList
 
 JSON_FOLDER = "json"
+# "json" keeps one file per collection; "sqlite" stores everything in
+# json/tracker.db, migrating the JSON files the first time it is used.
+STORAGE_BACKEND = os.environ.get("MACRO_TRACKER_BACKEND", "json")
+# Append consumption and events to json/daily.journal instead of rewriting
+# json/daily.json on every entry.
+DAILY_JOURNAL = True
+# Write JSON collections on a background thread so large files never block
+# the UI, and how often to check it for write errors.
+BACKGROUND_WRITES = True
+WRITE_ERROR_POLL_MS = 1000
+# Read collections and the search indexes from json/snapshot.bin at startup
+# while it matches the JSON files; it is rewritten on exit.
+STARTUP_SNAPSHOT = True
+# Delay between the last keystroke and running a search, and the number of
+# ranked matches shown for a non-empty query.
+SEARCH_DEBOUNCE_MS = 150
+SEARCH_LIMIT = 500
+# Days of records shown per page in the History, Measurements and Profile
+# tables.
+HISTORY_PAGE_DAYS = 90
+BODY_PAGE_DAYS = 365
+# How often to check whether the day has changed while the app is open.
+ROLLOVER_CHECK_MS = 60 * 1000
+# Suggestions listed on the Today tab for filling the rest of the goals.
+SUGGESTION_LIMIT = 10
+# Product file or http:// URL of a product server to look foods up in by
+# name or barcode from the Foods tab (see tracker/lookup.py); unset hides
+# the button. How often to check for the answer.
+LOOKUP_SOURCE = os.environ.get("MACRO_TRACKER_LOOKUP")
+LOOKUP_POLL_MS = 100
+# With instrumentation on, where a cProfile capture is saved.
+PROFILE_PATH = "tracker.prof"
 
 class MacroTrackerApp(tk.Tk):
     def __init__(self):
@@ -21,42 +58,15 @@ class MacroTrackerApp(tk.Tk):
         style.map("TButton", background=[("active", "#555555")])
         style.configure("Treeview", background="#2e2e2e", fieldbackground="#2e2e2e", foreground="white")
 
-        # Load persistent data from JSON files
-        self.foods = self.load_data(os.path.join(JSON_FOLDER, "foods.json"))
-        self.drinks = self.load_data(os.path.join(JSON_FOLDER, "drinks.json"))
-        self.history = self.load_history(os.path.join(JSON_FOLDER, "history.json"))
-        self.profile_history = self.load_profile_history(os.path.join(JSON_FOLDER, "profile_history.json"))
-        self.profile_settings = self.load_profile_settings(os.path.join(JSON_FOLDER, "profile_settings.json"))
-        self.goals = self.load_goals(os.path.join(JSON_FOLDER, "goals.json"))
-        self.saved_meals = self.load_meals(os.path.join(JSON_FOLDER, "meals.json"))
-        self.measurements = self.load_measurements(os.path.join(JSON_FOLDER, "measurements.json"))
-
-        # Load or initialize daily data (including events)
-        self.daily_data = self.load_daily_data(os.path.join(JSON_FOLDER, "daily.json"))
-        today = datetime.now().strftime("%m/%d/%Y")
-        if self.daily_data["date"] != today:
-            if any(self.daily_data["totals"].values()):
-                record = {
-                    "date": self.daily_data["date"],
-                    "calories": round(self.daily_data["totals"]["calories"], 1),
-                    "protein": round(self.daily_data["totals"]["protein"], 1),
-                    "carbs": round(self.daily_data["totals"]["carbs"], 1),
-                    "fats": round(self.daily_data["totals"]["fats"], 1),
-                    "calories_goal": self.goals["calories"],
-                    "protein_goal": self.goals["protein"],
-                    "carbs_goal": self.goals["carbs"],
-                    "fats_goal": self.goals["fats"]
-                }
-                self.history.append(record)
-                self.save_history(os.path.join(JSON_FOLDER, "history.json"))
-            self.daily_data["date"] = today
-            self.daily_data["totals"] = {"calories": 0, "protein": 0, "carbs": 0, "fats": 0}
-            self.daily_data["events"] = []
-            self.save_daily_data(os.path.join(JSON_FOLDER, "daily.json"))
-        self.daily_totals = self.daily_data["totals"]
+        self.store = TrackerStore(JSON_FOLDER, STORAGE_BACKEND, journal=DAILY_JOURNAL,
+                                  on_error=lambda message: messagebox.showerror("Error", message),
+                                  background=BACKGROUND_WRITES, snapshot=STARTUP_SNAPSHOT)
+        self.search_jobs = {}
+        self.lookup = open_lookup(LOOKUP_SOURCE, JSON_FOLDER) if LOOKUP_SOURCE else None
 
         notebook = ttk.Notebook(self)
         notebook.pack(expand=True, fill="both")
+        self.notebook = notebook
 
         # Tab Creation
         self.home_tab = ttk.Frame(notebook)
@@ -76,145 +86,63 @@ class MacroTrackerApp(tk.Tk):
         notebook.add(self.history_tab, text="History")
         notebook.add(self.measurements_tab, text="Measurements")
         notebook.add(self.profile_tab, text="Profile")
-
-        self.create_home_tab()
-        self.create_today_tab()
-        self.create_foods_tab()
-        self.create_meals_tab()
-        self.create_drinks_tab()
-        self.create_history_tab()
-        self.create_measurements_tab()
-        self.create_profile_tab()
-
-    # ----- Daily Data Persistence -----
-    def load_daily_data(self, filename):
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r") as f:
-                    data = json.load(f)
-                if "events" not in data:
-                    data["events"] = []
-                return data
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load daily data: {e}")
-                return {"date": datetime.now().strftime("%m/%d/%Y"),
-                        "totals": {"calories": 0, "protein": 0, "carbs": 0, "fats": 0},
-                        "events": []}
-        else:
-            return {"date": datetime.now().strftime("%m/%d/%Y"),
-                    "totals": {"calories": 0, "protein": 0, "carbs": 0, "fats": 0},
-                    "events": []}
-
-    def save_daily_data(self, filename):
-        try:
-            with open(filename, "w") as f:
-                json.dump(self.daily_data, f, indent=4)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save daily data: {e}")
-
-    # ----- Other Data Persistence Methods -----
-    def load_data(self, filename):
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r") as f:
-                    return json.load(f)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load {filename}: {e}")
-                return []
-        else:
-            return []
-
-    def load_history(self, filename):
-        return self.load_data(filename)
-
-    def save_history(self, filename):
-        try:
-            with open(filename, "w") as f:
-                json.dump(self.history, f, indent=4)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save history: {e}")
-
-    def load_profile_history(self, filename):
-        return self.load_data(filename)
-
-    def save_profile_history(self, filename):
-        try:
-            with open(filename, "w") as f:
-                json.dump(self.profile_history, f, indent=4)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save profile history: {e}")
-
-    def load_profile_settings(self, filename):
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r") as f:
-                    return json.load(f)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load profile settings: {e}")
-                return {}
-        else:
-            return {}
-
-    def save_profile_settings(self, filename):
-        try:
-            with open(filename, "w") as f:
-                json.dump(self.profile_settings, f, indent=4)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save profile settings: {e}")
-
-    def load_goals(self, filename):
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r") as f:
-                    return json.load(f)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load goals from {filename}: {e}")
-                return {"calories": 2000, "protein": 150, "carbs": 250, "fats": 70}
-        else:
-            return {"calories": 2000, "protein": 150, "carbs": 250, "fats": 70}
-
-    def save_goals_to_file(self, filename):
-        try:
-            with open(filename, "w") as f:
-                json.dump(self.goals, f, indent=4)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save goals to {filename}: {e}")
-
-    def load_meals(self, filename):
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r") as f:
-                    return json.load(f)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load meals from {filename}: {e}")
-                return []
-        else:
-            return []
-
-    def save_meals_to_file(self, filename):
-        try:
-            with open(filename, "w") as f:
-                json.dump(self.saved_meals, f, indent=4)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save meals to {filename}: {e}")
-
-    def load_measurements(self, filename):
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r") as f:
-                    return json.load(f)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load measurements from {filename}: {e}")
-                return []
-        else:
-            return []
-
-    def save_measurements(self, filename):
-        try:
-            with open(filename, "w") as f:
-                json.dump(self.measurements, f, indent=4)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save measurements to {filename}: {e}")
+        if instrument.stats.enabled:
+            self.diagnostics_tab = ttk.Frame(notebook)
+            notebook.add(self.diagnostics_tab, text="Diagnostics")
+
+        # Tabs are built the first time they are shown, so startup only pays
+        # for Home and the data it needs.
+        self.tab_builders = {
+            str(self.home_tab): self.create_home_tab,
+            str(self.today_tab): self.create_today_tab,
+            str(self.foods_tab): self.create_foods_tab,
+            str(self.meals_tab): self.create_meals_tab,
+            str(self.drinks_tab): self.create_drinks_tab,
+            str(self.history_tab): self.create_history_tab,
+            str(self.measurements_tab): self.create_measurements_tab,
+            str(self.profile_tab): self.create_profile_tab,
+        }
+        if instrument.stats.enabled:
+            self.tab_builders[str(self.diagnostics_tab)] = self.create_diagnostics_tab
+        self.built_tabs = set()
+        self.analytics = None
+        self.build_tab(self.home_tab)
+        notebook.bind("<<NotebookTabChanged>>", lambda event: self.build_tab(notebook.select()))
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(WRITE_ERROR_POLL_MS, self.poll_write_errors)
+        self.after(ROLLOVER_CHECK_MS, self.check_rollover)
+
+    def check_rollover(self):
+        # Start a new day at midnight without restarting the app.
+        if self.store.rollover():
+            self.refresh_daily_views()
+            self.update_long_term_stats()
+            if self.tab_built(self.history_tab):
+                self.update_history_tab()
+                self.analytics.load_history(self.store.history)
+                self.update_trends()
+        self.after(ROLLOVER_CHECK_MS, self.check_rollover)
+
+    def poll_write_errors(self):
+        self.store.poll_errors()
+        self.after(WRITE_ERROR_POLL_MS, self.poll_write_errors)
+
+    def on_close(self):
+        # Write out anything still waiting in the background writer.
+        self.store.close()
+        if self.lookup is not None:
+            self.lookup.close()
+        self.destroy()
+
+    def build_tab(self, tab):
+        builder = self.tab_builders.pop(str(tab), None)
+        if builder is not None:
+            builder()
+            self.built_tabs.add(str(tab))
+
+    def tab_built(self, tab):
+        return str(tab) in self.built_tabs
 
     # ----- Today Tab -----
     def create_today_tab(self):
@@ -224,16 +152,72 @@ class MacroTrackerApp(tk.Tk):
         self.today_listbox = tk.Listbox(frame)
         self.today_listbox.pack(fill="both", expand=True, padx=10, pady=10)
         self.update_today_history_display()
-
-    def log_event(self, event_str):
-        self.daily_data["events"].append(event_str)
-        self.save_daily_data(os.path.join(JSON_FOLDER, "daily.json"))
-        self.update_today_history_display()
+        suggest_frame = ttk.LabelFrame(frame, text="Fill the Gap", padding=10)
+        suggest_frame.pack(padx=10, pady=10, fill="both", expand=True)
+        controls_frame = ttk.Frame(suggest_frame)
+        controls_frame.pack(fill="x")
+        self.prefer_familiar_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(controls_frame, text="Prefer things I've had before",
+                        variable=self.prefer_familiar_var).pack(side="left", padx=5)
+        ttk.Button(controls_frame, text="Suggest", command=self.update_suggestions).pack(side="left", padx=5)
+        ttk.Button(controls_frame, text="Log Selected", command=self.record_suggestion).pack(side="left", padx=5)
+        columns = ("item", "amount", "calories", "protein", "carbs", "fats")
+        self.suggestions_tree = ttk.Treeview(suggest_frame, columns=columns, show="headings", height=6)
+        for col in columns:
+            self.suggestions_tree.heading(col, text=col.capitalize())
+            self.suggestions_tree.column(col, width=300 if col == "item" else 100)
+        self.suggestions_tree.pack(fill="both", expand=True, pady=5)
+        self.suggestions_tree.bind("<Double-1>", lambda event: self.record_suggestion())
+        self.suggestions = {}
 
     def update_today_history_display(self):
         self.today_listbox.delete(0, tk.END)
-        for event in self.daily_data["events"]:
-            self.today_listbox.insert(tk.END, event)
+        for event in self.store.daily_data["events"]:
+            self.today_listbox.insert(tk.END, describe(event))
+
+    def update_suggestions(self):
+        for row in self.suggestions_tree.get_children():
+            self.suggestions_tree.delete(row)
+        self.suggestions = {}
+        for i, suggestion in enumerate(self.store.suggestions(SUGGESTION_LIMIT, self.prefer_familiar_var.get())):
+            if suggestion["kind"] == "food":
+                food = self.store.foods_by_id[suggestion["item_id"]]
+                unit = " unit(s)" if food.get("per_unit", False) else "g"
+                amount = f"{suggestion['quantity']:g}{unit}"
+            else:
+                amount = suggestion["kind"]
+            macros = suggestion["macros"]
+            self.suggestions_tree.insert("", "end", iid=str(i), values=(
+                suggestion["name"], amount,
+                f"{macros['calories']:.1f}", f"{macros['protein']:.1f}",
+                f"{macros['carbs']:.1f}", f"{macros['fats']:.1f}"))
+            self.suggestions[str(i)] = suggestion
+
+    def record_suggestion(self):
+        selected = self.suggestions_tree.selection()
+        if not selected:
+            return
+        suggestion = self.suggestions[selected[0]]
+        item_id = suggestion["item_id"]
+        # The item may have been removed since the list was built; then the
+        # suggestions are just refreshed.
+        if suggestion["kind"] == "food":
+            item = self.store.foods_by_id.get(item_id)
+        elif suggestion["kind"] == "drink":
+            item = self.store.drinks_by_id.get(item_id)
+        else:
+            item = next((m for m in self.store.saved_meals if m.get("id") == item_id), None)
+        if item is None:
+            self.update_suggestions()
+            return
+        if suggestion["kind"] == "food":
+            self.store.record_food(item, suggestion["quantity"])
+        elif suggestion["kind"] == "drink":
+            self.store.record_drink(item)
+        else:
+            self.store.record_meal(item)
+        self.refresh_daily_views()
+        self.update_suggestions()
 
     # ----- Home Tab -----
     def create_home_tab(self):
@@ -244,13 +228,12 @@ class MacroTrackerApp(tk.Tk):
         row = 0
         for macro in ["calories", "protein", "carbs", "fats"]:
             ttk.Label(goals_frame, text=f"{macro.capitalize()}:").grid(row=row, column=0, sticky="w", padx=5, pady=5)
-            var = tk.StringVar(value=str(self.goals[macro]))
+            var = tk.StringVar(value=str(self.store.goals[macro]))
             entry = ttk.Entry(goals_frame, textvariable=var, width=10)
             entry.grid(row=row, column=1, padx=5, pady=5)
             self.goal_vars[macro] = var
             row += 1
-        save_button = ttk.Button(goals_frame, text="Save Goals", 
-                                 command=lambda: self.save_goals_to_file(os.path.join(JSON_FOLDER, "goals.json")) or self.save_goals())
+        save_button = ttk.Button(goals_frame, text="Save Goals", command=self.save_goals)
         save_button.grid(row=row, column=0, columnspan=2, pady=10)
         totals_frame = ttk.LabelFrame(frame, text="Today's Intake", padding=10)
         totals_frame.pack(padx=10, pady=10, fill="x")
@@ -258,31 +241,50 @@ class MacroTrackerApp(tk.Tk):
         row = 0
         for macro in ["calories", "protein", "carbs", "fats"]:
             ttk.Label(totals_frame, text=f"{macro.capitalize()}:").grid(row=row, column=0, sticky="w", padx=5, pady=5)
-            label = ttk.Label(totals_frame, text=f"{self.daily_totals[macro]:.1f}")
+            label = ttk.Label(totals_frame, text=f"{self.store.daily_totals[macro]:.1f}")
             label.grid(row=row, column=1, padx=5, pady=5)
             self.totals_labels[macro] = label
             row += 1
+        stats_frame = ttk.LabelFrame(frame, text="Long-Term Stats", padding=10)
+        stats_frame.pack(padx=10, pady=10, fill="x")
+        self.long_term_label = ttk.Label(stats_frame, justify="left")
+        self.long_term_label.pack(anchor="w", padx=5)
+        self.update_long_term_stats()
 
     def save_goals(self):
+        goals = {}
         for macro, var in self.goal_vars.items():
             try:
-                self.goals[macro] = float(var.get())
+                goals[macro] = float(var.get())
             except ValueError:
                 messagebox.showerror("Invalid Input", f"Please enter a valid number for {macro}.")
                 return
-        self.save_goals_to_file(os.path.join(JSON_FOLDER, "goals.json"))
+        self.store.update_goals(goals)
         messagebox.showinfo("Goals Saved", "Daily goals updated and saved successfully.")
 
+    def update_long_term_stats(self):
+        stats = self.store.long_term_stats()
+        if not stats["days"]:
+            self.long_term_label.config(text="No finished days yet.")
+            return
+        lines = [f"{stats['days']} days logged, {stats['missed_days']} missed"]
+        for macro, values in stats["macros"].items():
+            lines.append(f"{macro.capitalize()}: {values['mean']:.1f} avg (\u00b1{values['std']:.1f})")
+        lines.append(f"Logging streak: {stats['streak']} days (best {stats['best_streak']})")
+        lines.append(f"Calorie goal streak: {stats['goal_streak']} days (best {stats['best_goal_streak']}), "
+                     f"{stats['goal_rate']:.0%} of days on target")
+        if stats["weight_ema"] is not None:
+            lines.append(f"Weight trend: {stats['weight_ema']:.1f} kg")
+        self.long_term_label.config(text="\n".join(lines))
+
     def update_totals_display(self):
         for macro, label in self.totals_labels.items():
-            label.config(text=f"{self.daily_totals[macro]:.1f}")
+            label.config(text=f"{self.store.daily_totals[macro]:.1f}")
 
-    def add_consumption(self, consumption):
-        for macro in self.daily_totals:
-            self.daily_totals[macro] += consumption.get(macro, 0)
-            self.daily_data["totals"][macro] = self.daily_totals[macro]
+    def refresh_daily_views(self):
         self.update_totals_display()
-        self.save_daily_data(os.path.join(JSON_FOLDER, "daily.json"))
+        if self.tab_built(self.today_tab):
+            self.update_today_history_display()
 
     # ----- Foods Tab -----
     def create_foods_tab(self):
@@ -293,71 +295,93 @@ class MacroTrackerApp(tk.Tk):
         self.foods_search_var = tk.StringVar()
         search_entry = ttk.Entry(search_frame, textvariable=self.foods_search_var)
         search_entry.pack(side="left", padx=5, fill="x", expand=True)
-        search_entry.bind("<KeyRelease>", lambda event: self.update_foods_list())
-        self.foods_canvas = tk.Canvas(frame, bg="#2e2e2e", highlightthickness=0)
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.foods_canvas.yview)
-        self.foods_canvas.configure(yscrollcommand=scrollbar.set)
-        scrollbar.pack(side="right", fill="y")
-        self.foods_canvas.pack(side="left", fill="both", expand=True)
-        self.foods_scrollable_frame = ttk.Frame(self.foods_canvas)
-        self.foods_canvas.create_window((0, 0), window=self.foods_scrollable_frame, anchor="nw")
-        self.foods_scrollable_frame.bind("<Configure>",
-            lambda e: self.foods_canvas.configure(scrollregion=self.foods_canvas.bbox("all")))
+        search_entry.bind("<KeyRelease>", lambda event: self.schedule_search("foods", self.update_foods_list))
+        if self.lookup is not None:
+            self.lookup_button = ttk.Button(search_frame, text="Look Up", command=self.lookup_foods)
+            self.lookup_button.pack(side="left", padx=5)
+        self.foods_list = VirtualList(frame, self.format_food, "I ate this", self.record_food)
+        self.foods_list.pack(fill="both", expand=True)
+        self.foods_canvas = self.foods_list.canvas
         self.update_foods_list()
 
+    def schedule_search(self, name, update):
+        # Debounce: restart the timer on every keystroke so fast typing runs
+        # one search once the user pauses.
+        job = self.search_jobs.pop(name, None)
+        if job is not None:
+            self.after_cancel(job)
+        self.search_jobs[name] = self.after(SEARCH_DEBOUNCE_MS, lambda: self.run_search(name, update))
+
+    def run_search(self, name, update):
+        self.search_jobs.pop(name, None)
+        update()
+
     def update_foods_list(self):
-        for widget in self.foods_scrollable_frame.winfo_children():
-            widget.destroy()
-        query = self.foods_search_var.get().lower()
-        for food in self.foods:
-            if query and query not in food.get("name", "").lower():
-                continue
-            food_frame = ttk.Frame(self.foods_scrollable_frame, padding=10)
-            food_frame.pack(fill="x", padx=5, pady=5)
-            name = food.get("name", "Unknown")
-            calories = food.get("calories", 0)
-            protein = food.get("protein", 0)
-            carbs = food.get("carbs", 0)
-            fats = food.get("fats", 0)
-            if food.get("per_unit", False):
-                info = f"{name} - per unit: {calories} kcal, {protein}g protein, {carbs}g carbs, {fats}g fats"
-            else:
-                info = f"{name} - per 100g: {calories} kcal, {protein}g protein, {carbs}g carbs, {fats}g fats"
-            ttk.Label(food_frame, text=info).pack(side="left", padx=5)
-            action_button = ttk.Button(food_frame, text="I ate this",
-                                       command=lambda f=food: self.record_food(f))
-            action_button.pack(side="right", padx=5)
+        query = self.foods_search_var.get()
+        limit = SEARCH_LIMIT if query.strip() else None
+        self.foods_list.set_items(self.store.search_foods(query, limit))
+
+    def lookup_foods(self):
+        # The source may be slow or remote, so it is asked on a thread and
+        # the answer picked up by polling from the UI thread.
+        query = self.foods_search_var.get().strip()
+        if not query:
+            return
+        result = {}
+
+        def run():
+            try:
+                result["products"] = self.lookup.find(query)
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.lookup_button.config(state="disabled")
+        self.after(LOOKUP_POLL_MS, lambda: self.finish_lookup(thread, query, result))
+
+    def finish_lookup(self, thread, query, result):
+        if thread.is_alive():
+            self.after(LOOKUP_POLL_MS, lambda: self.finish_lookup(thread, query, result))
+            return
+        self.lookup_button.config(state="normal")
+        if "error" in result:
+            messagebox.showerror("Error", f"Lookup failed: {result['error']}")
+            return
+        products = result["products"]
+        if not products:
+            messagebox.showinfo("Look Up", f"Nothing found for {query!r}.")
+            return
+        names = "\n".join(self.format_food(p) for p in products)
+        if not messagebox.askyesno("Look Up", f"Add these foods to the catalog?\n\n{names}"):
+            return
+        added = add_foods(self.store, products)
+        self.update_foods_list()
+        messagebox.showinfo("Look Up", f"Added {len(added)} foods; {len(products) - len(added)} were already in the catalog.")
+
+    def format_food(self, food):
+        name = food.get("name", "Unknown")
+        calories = food.get("calories", 0)
+        protein = food.get("protein", 0)
+        carbs = food.get("carbs", 0)
+        fats = food.get("fats", 0)
+        if food.get("per_unit", False):
+            return f"{name} - per unit: {calories} kcal, {protein}g protein, {carbs}g carbs, {fats}g fats"
+        return f"{name} - per 100g: {calories} kcal, {protein}g protein, {carbs}g carbs, {fats}g fats"
 
     def record_food(self, food):
         if food.get("per_unit", False):
             amount = simpledialog.askfloat("Food Quantity",
                                            f"Enter quantity (units) for {food.get('name', 'food')}:",
                                            minvalue=1, initialvalue=1)
-            if amount is None:
-                return
-            consumption = {
-                "calories": food.get("calories", 0) * amount,
-                "protein": food.get("protein", 0) * amount,
-                "carbs": food.get("carbs", 0) * amount,
-                "fats": food.get("fats", 0) * amount,
-            }
-            event = f"Ate {amount:.1f} unit(s) of {food.get('name')}"
         else:
             amount = simpledialog.askfloat("Food Quantity",
                                            f"Enter amount (in grams) for {food.get('name', 'food')}:",
                                            minvalue=1, initialvalue=100)
-            if amount is None:
-                return
-            factor = amount / 100.0
-            consumption = {
-                "calories": food.get("calories", 0) * factor,
-                "protein": food.get("protein", 0) * factor,
-                "carbs": food.get("carbs", 0) * factor,
-                "fats": food.get("fats", 0) * factor,
-            }
-            event = f"Ate {amount:.1f}g of {food.get('name')}"
-        self.add_consumption(consumption)
-        self.log_event(event)
+        if amount is None:
+            return
+        self.store.record_food(food, amount)
+        self.refresh_daily_views()
         messagebox.showinfo("Recorded", f"Recorded consumption for {food.get('name', 'food')}.")
 
     # ----- Meals Tab -----
@@ -387,7 +411,7 @@ class MacroTrackerApp(tk.Tk):
     def add_meal_row(self):
         row_frame = ttk.Frame(self.meal_builder_frame)
         row_frame.pack(fill="x", pady=2)
-        food_names = [food.get("name", "Unknown") for food in self.foods]
+        food_names = [food.get("name", "Unknown") for food in self.store.foods]
         food_cb = ttk.Combobox(row_frame, values=food_names, state="readonly", width=25)
         food_cb.grid(row=0, column=0, padx=5)
         food_cb.set(food_names[0] if food_names else "")
@@ -407,12 +431,6 @@ class MacroTrackerApp(tk.Tk):
 
     def save_current_meal(self):
         meal_name = self.meal_name_var.get().strip()
-        if not meal_name:
-            messagebox.showerror("Error", "Please enter a meal name.")
-            return
-        if not self.meal_rows:
-            messagebox.showerror("Error", "Please add at least one food to the meal.")
-            return
         items = []
         for row in self.meal_rows:
             food_name = row["food_cb"].get()
@@ -421,14 +439,12 @@ class MacroTrackerApp(tk.Tk):
             except ValueError:
                 messagebox.showerror("Error", f"Invalid quantity for {food_name}.")
                 return
-            food = next((f for f in self.foods if f.get("name") == food_name), None)
-            if not food:
-                messagebox.showerror("Error", f"Food '{food_name}' not found.")
-                return
-            items.append({"food": food, "quantity": qty})
-        meal = {"name": meal_name, "items": items}
-        self.saved_meals.append(meal)
-        self.save_meals_to_file(os.path.join(JSON_FOLDER, "meals.json"))
+            items.append((food_name, qty))
+        try:
+            self.store.add_meal(meal_name, items)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
         messagebox.showinfo("Meal Saved", f"Meal '{meal_name}' saved successfully.")
         self.clear_meal_builder()
         self.update_saved_meals_display()
@@ -442,10 +458,10 @@ class MacroTrackerApp(tk.Tk):
     def update_saved_meals_display(self):
         for widget in self.meals_list_frame.winfo_children():
             widget.destroy()
-        if not self.saved_meals:
+        if not self.store.saved_meals:
             ttk.Label(self.meals_list_frame, text="No saved meals.").pack(padx=5, pady=5)
             return
-        for meal in self.saved_meals:
+        for meal in self.store.saved_meals:
             meal_frame = ttk.Frame(self.meals_list_frame, padding=5)
             meal_frame.pack(fill="x", pady=2)
             meal_label = ttk.Label(meal_frame, text=meal["name"], font=("TkDefaultFont", 10, "bold"))
@@ -457,28 +473,21 @@ class MacroTrackerApp(tk.Tk):
 
     def show_meal_details(self, meal):
         details = f"Meal: {meal['name']}\n"
-        for item in meal["items"]:
-            food = item["food"]
-            qty = item["quantity"]
+        for food, qty in self.store.meal_items(meal):
+            if food is None:
+                details += f"- Unknown food: {qty}\n"
+                continue
             unit = "unit" if food.get("per_unit", False) else "g"
             details += f"- {food.get('name')}: {qty} {unit}\n"
         messagebox.showinfo("Meal Details", details)
 
     def record_meal(self, meal):
-        total = {"calories": 0, "protein": 0, "carbs": 0, "fats": 0}
-        for item in meal["items"]:
-            food = item["food"]
-            qty = item["quantity"]
-            factor = qty if food.get("per_unit", False) else qty / 100.0
-            total["calories"] += food.get("calories", 0) * factor
-            total["protein"]  += food.get("protein", 0) * factor
-            total["carbs"]    += food.get("carbs", 0) * factor
-            total["fats"]     += food.get("fats", 0) * factor
-        self.add_consumption(total)
-        event = (f"Ate meal '{meal['name']}' (Cal: {round(total['calories'],1)}, "
-                 f"Prot: {round(total['protein'],1)}, Carbs: {round(total['carbs'],1)}, "
-                 f"Fats: {round(total['fats'],1)})")
-        self.log_event(event)
+        try:
+            total = self.store.record_meal(meal)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.refresh_daily_views()
         messagebox.showinfo("Meal Recorded", f"Recorded meal '{meal['name']}' with totals:\n"
                                               f"Calories: {round(total['calories'],1)}\n"
                                               f"Protein: {round(total['protein'],1)}\n"
@@ -494,55 +503,36 @@ class MacroTrackerApp(tk.Tk):
         self.drinks_search_var = tk.StringVar()
         search_entry = ttk.Entry(search_frame, textvariable=self.drinks_search_var)
         search_entry.pack(side="left", padx=5, fill="x", expand=True)
-        search_entry.bind("<KeyRelease>", lambda event: self.update_drinks_list())
-        self.drinks_canvas = tk.Canvas(frame, bg="#2e2e2e", highlightthickness=0)
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.drinks_canvas.yview)
-        self.drinks_canvas.configure(yscrollcommand=scrollbar.set)
-        scrollbar.pack(side="right", fill="y")
-        self.drinks_canvas.pack(side="left", fill="both", expand=True)
-        self.drinks_scrollable_frame = ttk.Frame(self.drinks_canvas)
-        self.drinks_canvas.create_window((0, 0), window=self.drinks_scrollable_frame, anchor="nw")
-        self.drinks_scrollable_frame.bind("<Configure>",
-            lambda e: self.drinks_canvas.configure(scrollregion=self.drinks_canvas.bbox("all")))
+        search_entry.bind("<KeyRelease>", lambda event: self.schedule_search("drinks", self.update_drinks_list))
+        self.drinks_list = VirtualList(frame, self.format_drink, "I drank this", self.record_drink)
+        self.drinks_list.pack(fill="both", expand=True)
+        self.drinks_canvas = self.drinks_list.canvas
         self.update_drinks_list()
 
     def update_drinks_list(self):
-        for widget in self.drinks_scrollable_frame.winfo_children():
-            widget.destroy()
-        query = self.drinks_search_var.get().lower()
-        for drink in self.drinks:
-            if query and query not in drink.get("name", "").lower():
-                continue
-            drink_frame = ttk.Frame(self.drinks_scrollable_frame, padding=10)
-            drink_frame.pack(fill="x", padx=5, pady=5)
-            name = drink.get("name", "Unknown")
-            calories = drink.get("calories", 0)
-            protein = drink.get("protein", 0)
-            carbs = drink.get("carbs", 0)
-            fats = drink.get("fats", 0)
-            info = f"{name} - per serving: {calories} kcal, {protein}g protein, {carbs}g carbs, {fats}g fats"
-            ttk.Label(drink_frame, text=info).pack(side="left", padx=5)
-            action_button = ttk.Button(drink_frame, text="I drank this",
-                                       command=lambda d=drink: self.record_drink(d))
-            action_button.pack(side="right", padx=5)
+        query = self.drinks_search_var.get()
+        limit = SEARCH_LIMIT if query.strip() else None
+        self.drinks_list.set_items(self.store.search_drinks(query, limit))
+
+    def format_drink(self, drink):
+        name = drink.get("name", "Unknown")
+        calories = drink.get("calories", 0)
+        protein = drink.get("protein", 0)
+        carbs = drink.get("carbs", 0)
+        fats = drink.get("fats", 0)
+        return f"{name} - per serving: {calories} kcal, {protein}g protein, {carbs}g carbs, {fats}g fats"
 
     def record_drink(self, drink):
-        consumption = {
-            "calories": drink.get("calories", 0),
-            "protein": drink.get("protein", 0),
-            "carbs": drink.get("carbs", 0),
-            "fats": drink.get("fats", 0),
-        }
-        self.add_consumption(consumption)
-        event = f"Drank 1 serving of {drink.get('name')}"
-        self.log_event(event)
+        self.store.record_drink(drink)
+        self.refresh_daily_views()
         messagebox.showinfo("Recorded", f"Recorded 1 serving of {drink.get('name', 'drink')}.")
 
     # ----- History Tab -----
     def create_history_tab(self):
         frame = self.history_tab
         columns = ("date", "calories", "protein", "carbs", "fats")
-        self.history_tree = ttk.Treeview(frame, columns=columns, show="headings")
+        self.history_view = PagedTree(frame, columns, self.format_history_record, HISTORY_PAGE_DAYS)
+        self.history_tree = self.history_view.tree
         self.history_tree.heading("date", text="Date")
         self.history_tree.heading("calories", text="Calories")
         self.history_tree.heading("protein", text="Protein")
@@ -553,24 +543,71 @@ class MacroTrackerApp(tk.Tk):
         self.history_tree.column("protein", width=120)
         self.history_tree.column("carbs", width=120)
         self.history_tree.column("fats", width=120)
-        self.history_tree.pack(fill="both", expand=True, padx=10, pady=10)
+        self.history_view.pack(fill="both", expand=True, padx=10, pady=10)
+        chart_frame = ttk.LabelFrame(frame, text="Calories vs Goal", padding=10)
+        chart_frame.pack(padx=10, pady=10, fill="both", expand=True)
+        self.calories_chart = TrendChart(chart_frame, [("calories", "Calories", "#4fc3f7"),
+                                                       ("calories_goal", "Goal", "#ffb74d", (4, 2))])
+        self.calories_chart.pack(fill="both", expand=True)
         self.update_history_tab()
+        trends_frame = ttk.LabelFrame(frame, text="Trends", padding=10)
+        trends_frame.pack(padx=10, pady=10, fill="both", expand=True)
+        controls_frame = ttk.Frame(trends_frame)
+        controls_frame.pack(fill="x")
+        ttk.Label(controls_frame, text="Group by:").pack(side="left", padx=5)
+        self.trend_period_var = tk.StringVar(value="week")
+        period_cb = ttk.Combobox(controls_frame, textvariable=self.trend_period_var,
+                                 values=["week", "month"], state="readonly", width=8)
+        period_cb.pack(side="left", padx=5)
+        period_cb.bind("<<ComboboxSelected>>", lambda event: self.update_trends())
+        self.trend_summary_label = ttk.Label(controls_frame)
+        self.trend_summary_label.pack(side="left", padx=15)
+        columns = ("period", "days", "calories", "protein", "carbs", "fats", "adherence")
+        self.trends_tree = ttk.Treeview(trends_frame, columns=columns, show="headings", height=6)
+        for col in columns:
+            self.trends_tree.heading(col, text=col.capitalize())
+            self.trends_tree.column(col, width=110)
+        self.trends_tree.pack(fill="both", expand=True, pady=5)
+        # NumPy is only imported once the History tab is opened.
+        from tracker.analytics import Analytics
+        self.analytics = Analytics(self.store.history, self.store.profile_history, self.store.measurements)
+        self.update_trends()
 
     def update_history_tab(self):
-        for row in self.history_tree.get_children():
-            self.history_tree.delete(row)
-        for record in self.history:
-            calories_str = f"{record.get('calories', 0):.1f} / {record.get('calories_goal', 0):.1f}"
-            protein_str  = f"{record.get('protein', 0):.1f} / {record.get('protein_goal', 0):.1f}"
-            carbs_str    = f"{record.get('carbs', 0):.1f} / {record.get('carbs_goal', 0):.1f}"
-            fats_str     = f"{record.get('fats', 0):.1f} / {record.get('fats_goal', 0):.1f}"
-            self.history_tree.insert("", "end", values=(
-                record.get("date", ""),
-                calories_str,
-                protein_str,
-                carbs_str,
-                fats_str
+        self.history_view.refresh(self.store.history)
+        self.calories_chart.refresh(self.store.series("history"))
+
+    def format_history_record(self, record):
+        calories_str = f"{record.get('calories', 0):.1f} / {record.get('calories_goal', 0):.1f}"
+        protein_str  = f"{record.get('protein', 0):.1f} / {record.get('protein_goal', 0):.1f}"
+        carbs_str    = f"{record.get('carbs', 0):.1f} / {record.get('carbs_goal', 0):.1f}"
+        fats_str     = f"{record.get('fats', 0):.1f} / {record.get('fats_goal', 0):.1f}"
+        return (record.get("date", ""), calories_str, protein_str, carbs_str, fats_str)
+
+    def update_trends(self):
+        for row in self.trends_tree.get_children():
+            self.trends_tree.delete(row)
+        for rollup in reversed(self.analytics.history_rollup(self.trend_period_var.get())):
+            self.trends_tree.insert("", "end", values=(
+                rollup["start"].strftime("%m/%d/%Y"),
+                rollup["count"],
+                f"{rollup['calories']:.1f}",
+                f"{rollup['protein']:.1f}",
+                f"{rollup['carbs']:.1f}",
+                f"{rollup['fats']:.1f}",
+                f"{rollup['adherence']:.0%}"
             ))
+        summary = []
+        average = self.analytics.rolling_average("calories", 7)
+        if average is not None:
+            summary.append(f"7-day avg: {average:.0f} kcal")
+        adherence = self.analytics.adherence_rate("calories", days=30)
+        if adherence is not None:
+            summary.append(f"30-day calorie adherence: {adherence:.0%}")
+        trend = self.analytics.weight_trend()
+        if trend:
+            summary.append(f"Weight trend: {trend[-1][1]:.1f} kg")
+        self.trend_summary_label.config(text="   |   ".join(summary))
 
     # ----- Measurements Tab -----
     def create_measurements_tab(self):
@@ -602,61 +639,60 @@ class MacroTrackerApp(tk.Tk):
         history_frame = ttk.LabelFrame(frame, text="Measurements History", padding=10)
         history_frame.pack(padx=10, pady=10, fill="both", expand=True)
         columns = ("date", "left_bicep", "right_bicep", "shoulders", "chest", "waist", "left_thigh", "right_thigh", "left_calf", "right_calf")
-        self.measurements_tree = ttk.Treeview(history_frame, columns=columns, show="headings")
+        self.measurements_view = PagedTree(history_frame, columns, self.format_measurement_record, BODY_PAGE_DAYS)
+        self.measurements_tree = self.measurements_view.tree
         for col in columns:
             self.measurements_tree.heading(col, text=col.replace("_", " ").capitalize())
             self.measurements_tree.column(col, width=100)
-        self.measurements_tree.pack(fill="both", expand=True, padx=5, pady=5)
+        self.measurements_view.pack(fill="both", expand=True, padx=5, pady=5)
+        chart_frame = ttk.LabelFrame(frame, text="Measurement Trend", padding=10)
+        chart_frame.pack(padx=10, pady=10, fill="both", expand=True)
+        self.measurement_labels = {label: key for label, key in measurement_fields}
+        self.measurement_chart_var = tk.StringVar(value="Waist (cm)")
+        field_cb = ttk.Combobox(chart_frame, textvariable=self.measurement_chart_var,
+                                values=list(self.measurement_labels), state="readonly", width=16)
+        field_cb.pack(anchor="w")
+        field_cb.bind("<<ComboboxSelected>>", lambda event: self.select_measurement_chart())
+        self.measurements_chart = TrendChart(chart_frame, [])
+        self.measurements_chart.pack(fill="both", expand=True)
+        self.select_measurement_chart()
         self.update_measurements_tree()
 
     def record_measurements(self):
-        date_str = datetime.now().strftime("%m/%d/%Y")
+        values = {}
         try:
-            left_bicep = float(self.measurements_vars["left_bicep"].get())
-            right_bicep = float(self.measurements_vars["right_bicep"].get())
-            shoulders = float(self.measurements_vars["shoulders"].get())
-            chest = float(self.measurements_vars["chest"].get())
-            waist = float(self.measurements_vars["waist"].get())
-            left_thigh = float(self.measurements_vars["left_thigh"].get())
-            right_thigh = float(self.measurements_vars["right_thigh"].get())
-            left_calf = float(self.measurements_vars["left_calf"].get())
-            right_calf = float(self.measurements_vars["right_calf"].get())
+            for key, var in self.measurements_vars.items():
+                values[key] = float(var.get())
         except ValueError:
             messagebox.showerror("Invalid Input", "Please enter valid numbers for all measurements.")
             return
-        record = {
-            "date": date_str,
-            "left_bicep": round(left_bicep, 1),
-            "right_bicep": round(right_bicep, 1),
-            "shoulders": round(shoulders, 1),
-            "chest": round(chest, 1),
-            "waist": round(waist, 1),
-            "left_thigh": round(left_thigh, 1),
-            "right_thigh": round(right_thigh, 1),
-            "left_calf": round(left_calf, 1),
-            "right_calf": round(right_calf, 1)
-        }
-        self.measurements.append(record)
-        self.save_measurements(os.path.join(JSON_FOLDER, "measurements.json"))
+        self.store.record_measurements(values)
         self.update_measurements_tree()
+        if self.analytics is not None:
+            self.analytics.load_measurements(self.store.measurements)
         messagebox.showinfo("Measurements Recorded", "Your measurements have been recorded.")
 
     def update_measurements_tree(self):
-        for row in self.measurements_tree.get_children():
-            self.measurements_tree.delete(row)
-        for record in self.measurements:
-            self.measurements_tree.insert("", "end", values=(
-                record.get("date", ""),
-                f"{record.get('left_bicep', 0):.1f}",
-                f"{record.get('right_bicep', 0):.1f}",
-                f"{record.get('shoulders', 0):.1f}",
-                f"{record.get('chest', 0):.1f}",
-                f"{record.get('waist', 0):.1f}",
-                f"{record.get('left_thigh', 0):.1f}",
-                f"{record.get('right_thigh', 0):.1f}",
-                f"{record.get('left_calf', 0):.1f}",
-                f"{record.get('right_calf', 0):.1f}"
-            ))
+        self.measurements_view.refresh(self.store.measurements)
+        self.measurements_chart.refresh(self.store.series("measurements"))
+
+    def select_measurement_chart(self):
+        label = self.measurement_chart_var.get()
+        self.measurements_chart.set_lines([(self.measurement_labels[label], label, "#81c784")])
+
+    def format_measurement_record(self, record):
+        return (
+            record.get("date", ""),
+            f"{record.get('left_bicep', 0):.1f}",
+            f"{record.get('right_bicep', 0):.1f}",
+            f"{record.get('shoulders', 0):.1f}",
+            f"{record.get('chest', 0):.1f}",
+            f"{record.get('waist', 0):.1f}",
+            f"{record.get('left_thigh', 0):.1f}",
+            f"{record.get('right_thigh', 0):.1f}",
+            f"{record.get('left_calf', 0):.1f}",
+            f"{record.get('right_calf', 0):.1f}"
+        )
 
     # ----- Profile Tab -----
     def create_profile_tab(self):
@@ -667,13 +703,12 @@ class MacroTrackerApp(tk.Tk):
         row = 0
         for label_text, key in [("Age", "age"), ("Height (cm)", "height")]:
             ttk.Label(settings_frame, text=f"{label_text}:").grid(row=row, column=0, sticky="w", padx=5, pady=5)
-            var = tk.StringVar(value=str(self.profile_settings.get(key, "")))
+            var = tk.StringVar(value=str(self.store.profile_settings.get(key, "")))
             entry = ttk.Entry(settings_frame, textvariable=var, width=10)
             entry.grid(row=row, column=1, padx=5, pady=5)
             self.settings_vars[key] = var
             row += 1
-        save_settings_button = ttk.Button(settings_frame, text="Save Settings", 
-                                          command=lambda: self.save_profile_settings(os.path.join(JSON_FOLDER, "profile_settings.json")) or self.save_profile_settings_ui())
+        save_settings_button = ttk.Button(settings_frame, text="Save Settings", command=self.save_profile_settings_ui)
         save_settings_button.grid(row=row, column=0, columnspan=2, pady=10)
         dynamic_frame = ttk.LabelFrame(frame, text="Daily Update", padding=10)
         dynamic_frame.pack(padx=10, pady=10, fill="x")
@@ -691,14 +726,19 @@ class MacroTrackerApp(tk.Tk):
         history_frame = ttk.LabelFrame(frame, text="Profile History (Weight & Bodyfat)", padding=10)
         history_frame.pack(padx=10, pady=10, fill="both", expand=True)
         columns = ("date", "weight", "bodyfat")
-        self.profile_tree = ttk.Treeview(history_frame, columns=columns, show="headings")
+        self.profile_view = PagedTree(history_frame, columns, self.format_profile_record, BODY_PAGE_DAYS)
+        self.profile_tree = self.profile_view.tree
         self.profile_tree.heading("date", text="Date")
         self.profile_tree.heading("weight", text="Weight (kg)")
         self.profile_tree.heading("bodyfat", text="Bodyfat (%)")
         self.profile_tree.column("date", width=160)
         self.profile_tree.column("weight", width=100)
         self.profile_tree.column("bodyfat", width=100)
-        self.profile_tree.pack(fill="both", expand=True, padx=5, pady=5)
+        self.profile_view.pack(fill="both", expand=True, padx=5, pady=5)
+        chart_frame = ttk.LabelFrame(frame, text="Weight Trend", padding=10)
+        chart_frame.pack(padx=10, pady=10, fill="both", expand=True)
+        self.weight_chart = TrendChart(chart_frame, [("weight", "Weight (kg)", "#ba68c8")])
+        self.weight_chart.pack(fill="both", expand=True)
         self.update_profile_tree()
 
     def save_profile_settings_ui(self):
@@ -708,9 +748,7 @@ class MacroTrackerApp(tk.Tk):
         except ValueError:
             messagebox.showerror("Invalid Input", "Please enter valid numbers for age and height.")
             return
-        self.profile_settings["age"] = age
-        self.profile_settings["height"] = height
-        self.save_profile_settings(os.path.join(JSON_FOLDER, "profile_settings.json"))
+        self.store.update_profile_settings(age, height)
         messagebox.showinfo("Settings Saved", "Profile settings saved successfully.")
 
     def record_profile_update(self):
@@ -721,26 +759,102 @@ class MacroTrackerApp(tk.Tk):
         except ValueError:
             messagebox.showerror("Invalid Input", "Please enter valid numbers for weight and bodyfat.")
             return
-        record = {
-            "date": datetime.now().strftime("%m/%d/%Y"),
-            "weight": weight,
-            "bodyfat": bodyfat if bodyfat is not None else ""
-        }
-        self.profile_history.append(record)
-        self.save_profile_history(os.path.join(JSON_FOLDER, "profile_history.json"))
+        self.store.record_profile_update(weight, bodyfat)
         self.update_profile_tree()
+        self.update_long_term_stats()
+        if self.analytics is not None:
+            self.analytics.load_profile(self.store.profile_history)
+            self.update_trends()
         messagebox.showinfo("Update Recorded", "Profile update recorded successfully.")
 
     def update_profile_tree(self):
-        for row in self.profile_tree.get_children():
-            self.profile_tree.delete(row)
-        for record in self.profile_history:
-            self.profile_tree.insert("", "end", values=(
-                record.get("date", ""),
-                record.get("weight", ""),
-                record.get("bodyfat", "")
+        self.profile_view.refresh(self.store.profile_history)
+        self.weight_chart.refresh(self.store.series("profile_history"))
+
+    def format_profile_record(self, record):
+        return (
+            record.get("date", ""),
+            record.get("weight", ""),
+            record.get("bodyfat", "")
+        )
+
+    # ----- Diagnostics Tab -----
+    def create_diagnostics_tab(self):
+        frame = self.diagnostics_tab
+        controls_frame = ttk.Frame(frame)
+        controls_frame.pack(fill="x", padx=10, pady=10)
+        ttk.Button(controls_frame, text="Refresh", command=self.update_diagnostics).pack(side="left", padx=5)
+        self.profile_button = ttk.Button(controls_frame, text="Start Profiling", command=self.toggle_profiling)
+        self.profile_button.pack(side="left", padx=5)
+        ttk.Button(controls_frame, text="Dump JSON", command=self.dump_diagnostics).pack(side="left", padx=5)
+        self.diagnostics_label = ttk.Label(controls_frame)
+        self.diagnostics_label.pack(side="left", padx=15)
+        columns = ("name", "calls", "total", "mean", "max", "histogram")
+        self.calls_tree = ttk.Treeview(frame, columns=columns, show="headings", height=12)
+        for col, text, width in [("name", "Method", 260), ("calls", "Calls", 70), ("total", "Total (ms)", 90),
+                                 ("mean", "Mean (ms)", 90), ("max", "Max (ms)", 90),
+                                 ("histogram", "ms buckets", 300)]:
+            self.calls_tree.heading(col, text=text)
+            self.calls_tree.column(col, width=width)
+        self.calls_tree.pack(fill="both", expand=True, padx=10, pady=5)
+        columns = ("target", "writes", "bytes")
+        self.bytes_tree = ttk.Treeview(frame, columns=columns, show="headings", height=5)
+        for col in columns:
+            self.bytes_tree.heading(col, text=col.capitalize())
+            self.bytes_tree.column(col, width=160)
+        self.bytes_tree.pack(fill="x", padx=10, pady=5)
+        self.profile_text = tk.Text(frame, height=12, bg="#2e2e2e", fg="white", font=("Courier", 9))
+        self.profile_text.pack(fill="both", expand=True, padx=10, pady=5)
+        self.update_diagnostics()
+
+    def update_diagnostics(self):
+        snapshot = instrument.stats.snapshot()
+        bounds = [f"<{b:g}" for b in snapshot["buckets_ms"]] + ["more"]
+        for row in self.calls_tree.get_children():
+            self.calls_tree.delete(row)
+        for name, entry in sorted(snapshot["calls"].items(), key=lambda e: -e[1]["total_ms"]):
+            histogram = " ".join(f"{b}:{n}" for b, n in zip(bounds, entry["histogram"]) if n)
+            self.calls_tree.insert("", "end", values=(
+                name, entry["count"], f"{entry['total_ms']:.1f}", f"{entry['mean_ms']:.2f}",
+                f"{entry['max_ms']:.1f}", histogram
             ))
-
-if __name__ == "__main__":
+        for row in self.bytes_tree.get_children():
+            self.bytes_tree.delete(row)
+        for target, entry in sorted(snapshot["bytes"].items()):
+            self.bytes_tree.insert("", "end", values=(target, entry["writes"], entry["bytes"]))
+        self.diagnostics_label.config(text=f"Session: {snapshot['elapsed_s']:.0f}s")
+
+    def toggle_profiling(self):
+        if instrument.stats.profiler is None:
+            instrument.stats.start_profile()
+            self.profile_button.config(text="Stop Profiling")
+            return
+        report = instrument.stats.stop_profile(PROFILE_PATH)
+        self.profile_button.config(text="Start Profiling")
+        self.profile_text.delete("1.0", "end")
+        self.profile_text.insert("end", f"Saved to {PROFILE_PATH}\n{report}")
+
+    def dump_diagnostics(self):
+        path = instrument.stats.dump_path or instrument.DEFAULT_DUMP
+        instrument.stats.dump(path)
+        messagebox.showinfo("Diagnostics", f"Stats written to {path}.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Macro Tracker")
+    parser.add_argument("--stats", nargs="?", const=instrument.DEFAULT_DUMP, metavar="FILE",
+                        help=f"record timing stats and write them to FILE on exit "
+                             f"(or set {instrument.STATS_ENV})")
+    args = parser.parse_args(argv)
+    dump_path = args.stats or instrument.dump_path_from_env()
+    if dump_path:
+        # Methods are wrapped before the app binds any of them as callbacks.
+        instrument.enable(dump_path)
+        instrument.instrument(TrackerStore, instrument.STORE_PREFIXES)
+        instrument.instrument(MacroTrackerApp, ("update_", "record_", "refresh_", "run_search"))
     app = MacroTrackerApp()
     app.mainloop()
+
+
+if __name__ == "__main__":
+    main()
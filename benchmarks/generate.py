@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import random
+from datetime import date, datetime, timedelta
+
+from tracker.events import make_event
+from tracker.macros import MACROS, drink_consumption, macro_vector, scale_vector
+from tracker.timeseries import MEASUREMENT_FIELDS
+from tracker.writer import dumps
+
+# Full-size dataset; --scale shrinks every count proportionally.
+SIZES = {"foods": 100_000, "drinks": 2_000, "meals": 5_000, "history_days": 3_650,
+         "events": 50_000, "usual_foods": 300, "today_events": 20}
+
+ADJECTIVES = ["Smoked", "Grilled", "Roasted", "Fresh", "Low fat", "Organic", "Spicy", "Sweet",
+              "Baked", "Whole", "Light", "Crispy", "Raw", "Frozen", "Salted", "Creamy"]
+FOODS = ["chicken breast", "beef shoulder", "salmon", "tuna", "rice", "pasta", "oats", "bread",
+         "yogurt", "cheese", "egg", "tofu", "lentils", "chickpeas", "potato", "broccoli",
+         "banana", "apple", "almonds", "peanut butter", "turkey", "pita", "hummus", "avocado"]
+BRANDS = ["Tnuva", "Osem", "Strauss", "Tirat Tzvi", "Yotvata", "Angel", "Sugat", "Tara",
+          "Shufersal", "Elite", "Priniv", "Achla"]
+DRINKS = ["Cola", "Orange juice", "Milk", "Protein shake", "Iced coffee", "Lemonade", "Kefir",
+          "Smoothie", "Energy drink", "Chocolate milk"]
+
+
+def food_name(rng, i):
+    return f"{rng.choice(ADJECTIVES)} {rng.choice(FOODS)} ({rng.choice(BRANDS)}) #{i}"
+
+
+def macros(rng, per_unit=False):
+    scale = 2.5 if per_unit else 1.0
+    protein, carbs, fats = (round(rng.uniform(0, limit) * scale, 1) for limit in (30, 60, 25))
+    return {"calories": round(protein * 4 + carbs * 4 + fats * 9, 1),
+            "protein": protein, "carbs": carbs, "fats": fats}
+
+
+def generate(folder, scale=1.0, seed=0):
+    # Write a complete synthetic data folder and return the record counts.
+    rng = random.Random(seed)
+    sizes = {key: max(1, int(value * scale)) for key, value in SIZES.items()}
+    os.makedirs(folder, exist_ok=True)
+
+    foods = []
+    for i in range(sizes["foods"]):
+        per_unit = rng.random() < 0.2
+        food = {"name": food_name(rng, i), "id": i + 1, **macros(rng, per_unit)}
+        if per_unit:
+            food["per_unit"] = True
+        foods.append(food)
+    drinks = [{"name": f"{rng.choice(DRINKS)} ({rng.choice(BRANDS)}) #{i}", "id": i + 1, **macros(rng)}
+              for i in range(sizes["drinks"])]
+    meals = [{"name": f"Meal #{i}", "id": i + 1,
+              "items": [{"food_id": rng.randint(1, len(foods)), "quantity": float(rng.randint(1, 300))}
+                        for _ in range(rng.randint(2, 6))]}
+             for i in range(sizes["meals"])]
+
+    first_day = date.today() - timedelta(days=sizes["history_days"])
+    history, measurements, profile_history = [], [], []
+    for offset in range(sizes["history_days"]):
+        day = (first_day + timedelta(days=offset)).strftime("%m/%d/%Y")
+        record = {"date": day, **{macro: round(rng.uniform(0.6, 1.3) * goal, 1)
+                                  for macro, goal in zip(MACROS, (2000, 150, 250, 70))}}
+        record.update({"calories_goal": 2000, "protein_goal": 150, "carbs_goal": 250, "fats_goal": 70})
+        history.append(record)
+        if offset % 7 == 0:
+            measurements.append({"date": day, **{key: round(rng.uniform(30, 110), 1)
+                                                 for key in MEASUREMENT_FIELDS}})
+            profile_history.append({"date": day, "weight": round(80 + rng.gauss(0, 2), 1),
+                                    "bodyfat": round(18 + rng.gauss(0, 1), 1)})
+
+    # Consumption events spread evenly over the history days, then a few
+    # for today. Most foods eaten come from a small usual set, as in a real
+    # log, so per-item queries and familiarity see repeat entries.
+    usual = rng.sample(foods, min(sizes["usual_foods"], len(foods)))
+
+    def event(day):
+        when = datetime.combine(day, datetime.min.time()) + timedelta(minutes=rng.randrange(7 * 60, 23 * 60))
+        date_str = day.strftime("%m/%d/%Y")
+        roll = rng.random()
+        if roll < 0.7:
+            food = rng.choice(usual) if rng.random() < 0.8 else rng.choice(foods)
+            amount = float(rng.randint(1, 3)) if food.get("per_unit") else float(rng.randint(10, 300))
+            return make_event("food", food, amount, scale_vector(macro_vector(food), amount), date_str, when)
+        if roll < 0.8:
+            drink = rng.choice(drinks)
+            return make_event("drink", drink, 1, drink_consumption(drink), date_str, when)
+        meal = rng.choice(meals)
+        items = [(item["food_id"], item["quantity"],
+                  [value * item["quantity"] for value in macro_vector(foods[item["food_id"] - 1])])
+                 for item in meal["items"]]
+        total = dict(zip(MACROS, (sum(values) for values in zip(*(macros for _, _, macros in items)))))
+        return make_event("meal", meal, 1, total, date_str, when, items=items)
+
+    events = [event(first_day + timedelta(days=n * sizes["history_days"] // sizes["events"]))
+              for n in range(sizes["events"])]
+    events.sort(key=lambda e: e["time"])
+    today = [event(date.today()) for _ in range(sizes["today_events"])]
+    daily = {"date": date.today().strftime("%m/%d/%Y"),
+             "totals": {macro: sum(e["macros"][i] for e in today) for i, macro in enumerate(MACROS)},
+             "events": today}
+
+    files = {"foods": foods, "drinks": drinks, "meals": meals, "history": history,
+             "measurements": measurements, "profile_history": profile_history, "daily": daily,
+             "goals": {"calories": 2000, "protein": 150, "carbs": 250, "fats": 70},
+             "profile_settings": {"age": 30, "height": 180.0}}
+    for name, data in files.items():
+        with open(os.path.join(folder, f"{name}.json"), "w") as f:
+            json.dump(data, f, indent=4)
+    with open(os.path.join(folder, "events.jsonl"), "w") as f:
+        f.writelines(dumps(e) + "\n" for e in events)
+    return {"foods": len(foods), "drinks": len(drinks), "meals": len(meals),
+            "history": len(history), "measurements": len(measurements),
+            "profile_history": len(profile_history), "events": len(events)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic tracker data folder.")
+    parser.add_argument("folder")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    print(json.dumps(generate(args.folder, args.scale, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
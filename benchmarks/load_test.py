@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import json
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.generate import generate
+from tracker.server import serve
+
+
+async def request(reader, writer, method, path, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        if key.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, user, food, deadline, latencies, errors):
+    # One keep-alive connection alternating reads and writes for one user.
+    reader, writer = await asyncio.open_connection(host, port)
+    calls = [("GET", f"/users/{user}/today", None),
+             ("POST", f"/users/{user}/foods/log", {"name": food, "amount": 100}),
+             ("GET", f"/users/{user}/history?days=30", None),
+             ("GET", f"/users/{user}/foods?q=chicken&limit=20", None)]
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            method, path, body = calls[i % len(calls)]
+            start = time.perf_counter()
+            status = await request(reader, writer, method, path, body)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors.append(status)
+            i += 1
+    finally:
+        writer.close()
+
+
+async def load_test(host, port, users, connections, duration, food):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(host, port, users[i % len(users)], food, deadline, latencies, errors)
+                           for i in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {"requests": len(latencies), "errors": len(errors), "seconds": round(elapsed, 2),
+            "requests_per_s": round(len(latencies) / elapsed, 1),
+            "median_ms": round(statistics.median(latencies), 2) if latencies else None,
+            "p95_ms": round(latencies[int(len(latencies) * 0.95)], 2) if latencies else None}
+
+
+async def run_local(args):
+    # Serve a temporary root with one generated data folder per user.
+    root = tempfile.mkdtemp(prefix="tracker-load-")
+    try:
+        users = [f"user{i}" for i in range(args.users)]
+        for user in users:
+            generate(f"{root}/{user}", args.scale, seed=len(user))
+        ready = asyncio.get_running_loop().create_future()
+        server = asyncio.create_task(serve(root, "127.0.0.1", 0, args.backend, ready=ready))
+        port = await ready
+        with open(f"{root}/{users[0]}/foods.json") as f:
+            food = json.load(f)[0]["name"]
+        # Warm up so every user's store is open before timing.
+        await load_test("127.0.0.1", port, users, len(users), 0.5, food)
+        result = await load_test("127.0.0.1", port, users, args.connections, args.duration, food)
+        # Wait for the server to close its stores before the folder goes.
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+        return result
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure requests/sec against the tracker API.")
+    parser.add_argument("--url", help="host:port of a running server (users must exist there)")
+    parser.add_argument("--user", action="append", help="user to exercise with --url")
+    parser.add_argument("--food", default="Pita", help="food name logged with --url")
+    parser.add_argument("--users", type=int, default=4, help="users to generate for a local run")
+    parser.add_argument("--scale", type=float, default=0.05, help="generated data size per user")
+    parser.add_argument("--backend", default="json")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args(argv)
+    if args.url:
+        host, _, port = args.url.rpartition(":")
+        result = asyncio.run(load_test(host, int(port), args.user or ["default"], args.connections,
+                                       args.duration, args.food))
+    else:
+        result = asyncio.run(run_local(args))
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+from tracker.events import make_event
+from tracker.macros import macro_vector, scale_vector
+from tracker.recompute import Correction
+from tracker.store import TrackerStore
+from tracker.writer import dumps
+
+FOODS = 1000
+
+
+def build(folder, events, affected, seed=0):
+    # A data folder whose event log has events entries, affected of them for
+    # food 1, spread over one history record per day.
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    foods = [{"name": f"Food {i}", "id": i, "calories": 100.0, "protein": 5.0, "carbs": 10.0, "fats": 3.0}
+             for i in range(1, FOODS + 1)]
+    first = date(2000, 1, 1)
+    per_day = 20
+    log, history = [], []
+    hits = set(rng.sample(range(events), affected))
+    for n in range(events):
+        day = (first + timedelta(days=n // per_day)).strftime("%m/%d/%Y")
+        food = foods[0] if n in hits else foods[rng.randrange(1, FOODS)]
+        log.append(make_event("food", food, 100.0, scale_vector(macro_vector(food), 100.0), day))
+        if n % per_day == 0:
+            history.append({"date": day, "calories": 0.0, "protein": 0.0, "carbs": 0.0, "fats": 0.0})
+        for macro, value in zip(("calories", "protein", "carbs", "fats"), log[-1]["macros"]):
+            history[-1][macro] += value
+    with open(os.path.join(folder, "foods.json"), "w") as f:
+        f.write(dumps(foods))
+    with open(os.path.join(folder, "history.json"), "w") as f:
+        f.write(dumps(history))
+    with open(os.path.join(folder, "events.jsonl"), "w") as f:
+        f.writelines(dumps(event) + "\n" for event in log)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time recomputing a food correction against log size and "
+                                                 "the number of affected entries.")
+    parser.add_argument("--events", type=int, nargs="+", default=[50_000, 200_000])
+    parser.add_argument("--affected", type=int, nargs="+", default=[100, 1_000, 10_000, 40_000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backend", default="json", choices=("json", "sqlite"))
+    args = parser.parse_args(argv)
+    results = {}
+    for events in args.events:
+        for affected in args.affected:
+            if affected > events:
+                continue
+            root = tempfile.mkdtemp(prefix="tracker-recompute-")
+            try:
+                build(root, events, affected)
+                store = TrackerStore(root, args.backend, snapshot=False)
+                store.foods, store.history
+                store.long_term_aggregates()
+                store.event_log.load()
+                # Building a correction changes nothing, so the best of a
+                # few runs is reported.
+                preview = float("inf")
+                for _ in range(3):
+                    started = time.perf_counter()
+                    correction = Correction(store, 1, {"calories": 90.0}, args.workers)
+                    preview = min(preview, time.perf_counter() - started)
+                started = time.perf_counter()
+                correction.apply()
+                results[f"events={events} affected={affected}"] = {
+                    "days": len(correction.days), "preview": round(preview, 4),
+                    "apply": round(time.perf_counter() - started, 4)}
+                store.close()
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+    print(json.dumps({"cpus": os.cpu_count(), "workers": args.workers, "backend": args.backend, "seconds": results},
+                     indent=4))
+
+
+if __name__ == "__main__":
+    main()
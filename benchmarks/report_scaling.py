@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.generate import generate
+from tracker.report import CACHE_FILE, build_report
+
+
+def worker_counts(limit):
+    counts, n = [], 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    return counts + [limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the client report with increasing worker counts.")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--scale", type=float, default=0.1, help="generated data size per client")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+    root = tempfile.mkdtemp(prefix="tracker-report-")
+    try:
+        for i in range(args.clients):
+            generate(os.path.join(root, f"client{i}"), args.scale, seed=i)
+        results = {}
+        for workers in worker_counts(args.max_workers):
+            started = time.perf_counter()
+            build_report(root, workers=workers)
+            results[f"workers={workers}"] = round(time.perf_counter() - started, 3)
+        cache_path = os.path.join(root, CACHE_FILE)
+        build_report(root, cache_path=cache_path)
+        started = time.perf_counter()
+        build_report(root, cache_path=cache_path)
+        results["cached"] = round(time.perf_counter() - started, 3)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    print(json.dumps({"clients": args.clients, "cpus": os.cpu_count(), "seconds": results}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
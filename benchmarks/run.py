@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.generate import generate
+from tracker import TrackerStore
+from tracker.downsample import BucketedLTTB
+from tracker.macros import MACROS
+from tracker.recompute import Correction
+from tracker.store import COLLECTIONS
+from tracker.timeseries import day_ordinal
+
+SEARCH_QUERIES = ["c", "ch", "chicken", "chiken brest", "smoked beef tirat", ""]
+SEARCH_LIMIT = 500
+# A benchmark regresses when its median is this much slower than the
+# baseline's and at least MIN_DELTA_MS slower; runs under a millisecond
+# move by more than the tolerance with disk and scheduler noise alone.
+TOLERANCE = 0.5
+MIN_DELTA_MS = 1.0
+
+
+def measure(fn, repeat=5, number=1):
+    # Milliseconds per call for each of `repeat` runs of `number` calls.
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) * 1000 / number)
+    return {"median_ms": round(statistics.median(times), 4), "min_ms": round(min(times), 4),
+            "max_ms": round(max(times), 4), "runs": repeat, "calls": number}
+
+
+def paged_tree_factory():
+    # A real PagedTree when Tk can open a display, otherwise one whose
+    # Treeview and label are stubs, so the indexing and diffing work is
+    # still measured.
+    import tkinter as tk
+    from widgets import PagedTree
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError:
+        root = None
+
+    class StubTree:
+        def __init__(self):
+            self.rows = {}
+
+        def get_children(self):
+            return list(self.rows)
+
+        def delete(self, *iids):
+            for iid in iids:
+                del self.rows[iid]
+
+        def insert(self, parent, index, iid, values):
+            self.rows[iid] = values
+
+        def item(self, iid, values):
+            self.rows[iid] = values
+
+    class StubLabel:
+        def configure(self, **options):
+            pass
+
+    class StubPagedTree(PagedTree):
+        # Skips the Tk frame and its widgets; everything else is PagedTree's.
+        def __init__(self, parent, columns, format_record, page_days):
+            self.setup_pages(format_record, page_days)
+            self.range_label = StubLabel()
+            self.tree = StubTree()
+
+    def make(columns, format_record, page_days):
+        if root is not None:
+            return PagedTree(root, columns, format_record, page_days)
+        return StubPagedTree(None, columns, format_record, page_days)
+    return make, "tk" if root is not None else "stub"
+
+
+def cold_start(folder, snapshot):
+    # Open a store and load every collection and the catalog indexes, as
+    # the app ends up doing once all tabs have been shown.
+    store = TrackerStore(folder, snapshot=snapshot)
+    store.load_catalog()
+    for attr in COLLECTIONS.values():
+        getattr(store, attr)
+    return store
+
+
+def run(folder, repeat=5):
+    results = {}
+
+    # ----- Loading -----
+    results["open_store"] = measure(lambda: TrackerStore(folder), repeat)
+    results["load_catalog"] = measure(lambda: TrackerStore(folder).load_catalog(), repeat)
+    store = TrackerStore(folder)
+    for name in ("history", "measurements", "profile_history"):
+        results[f"load_{name}"] = measure(lambda name=name: store.load(name), repeat)
+
+    # ----- Saving -----
+    for name in COLLECTIONS:
+        results[f"save_{name}"] = measure(lambda name=name: store.save(name), repeat)
+    results["save_daily"] = measure(store.save_daily_data, repeat)
+
+    # ----- Search -----
+    for query in SEARCH_QUERIES:
+        limit = SEARCH_LIMIT if query.strip() else None
+        results[f"search[{query}]"] = measure(lambda q=query, l=limit: store.search_foods(q, l), repeat, 10)
+
+    # ----- Recording -----
+    foods = store.foods
+    meals = store.saved_meals
+    results["record_food"] = measure(lambda: store.record_food(foods[0], 100.0), repeat, 200)
+    meal_iter = iter(meals * (repeat * 200 // len(meals) + 1))
+    results["record_meal"] = measure(lambda: store.record_meal(next(meal_iter)), repeat, 200)
+    results["meal_totals"] = measure(lambda: [store.meal_vector(meal) for meal in meals], repeat, 10)
+
+    # ----- Event log -----
+    # Per-item queries and a correction preview for the food logged most.
+    log = store.event_log
+    results["load_events"] = measure(log.load, repeat)
+    food_id = max((key for key in log.by_item if key[0] == "food"), key=lambda key: len(log.by_item[key]))[1]
+    month = day_ordinal(store.daily_data["date"]) - 30
+    results["item_consumption"] = measure(lambda: store.item_consumption("food", food_id), repeat, 10)
+    results["top_items[30d]"] = measure(lambda: store.top_items(start=month), repeat)
+    results["recompute_preview"] = measure(lambda: Correction(store, food_id, {"calories": 1.0}, 1), repeat)
+
+    # ----- Suggestions -----
+    # Against a fixed gap, since the records above use up today's goals.
+    engine = store.suggestion_engine()
+    gap = [store.goals[macro] * 0.25 for macro in MACROS]
+    results["suggest_build"] = measure(engine.build, repeat)
+    results["suggest"] = measure(lambda: engine.suggest(10, gap=gap), repeat, 10)
+    results["suggest[familiar]"] = measure(lambda: engine.suggest(10, True, gap=gap), repeat, 10)
+
+    # ----- Tables -----
+    import app
+    make_tree, tree_kind = paged_tree_factory()
+    views = {"history": ("date", "calories", "protein", "carbs", "fats"),
+             "measurements": ("date",) + tuple(range(9)),
+             "profile_history": ("date", "weight", "bodyfat")}
+    formats = {"history": app.MacroTrackerApp.format_history_record,
+               "measurements": app.MacroTrackerApp.format_measurement_record,
+               "profile_history": app.MacroTrackerApp.format_profile_record}
+    for name, columns in views.items():
+        records = list(getattr(store, COLLECTIONS[name]))
+        format_record = lambda record, f=formats[name]: f(None, record)
+        view = make_tree(columns, format_record, app.HISTORY_PAGE_DAYS)
+        results[f"tree_full[{name}]"] = measure(lambda: view.refresh(list(records)), repeat)
+        view.refresh(records)
+        last = records[-1]
+        results[f"tree_append[{name}]"] = measure(
+            lambda: (records.append(dict(last)), view.refresh(records)), repeat, 20)
+
+    # ----- Charts -----
+    # Calories downsampled at 5 days per pixel, then one new day added.
+    history = store.series("history")
+    points = list(zip(history.days, history.columns["calories"]))
+    results["chart_downsample"] = measure(lambda: BucketedLTTB(5).extend(points), repeat)
+    sampler = BucketedLTTB(5)
+    sampler.extend(points)
+    next_day = iter(range(points[-1][0] + 1, points[-1][0] + 1 + repeat * 200))
+    results["chart_append"] = measure(lambda: sampler.extend([(next(next_day), 2000.0)]), repeat, 200)
+
+    # ----- Cold start -----
+    # Last, since writing the snapshot makes every later store use it.
+    results["cold_start[json]"] = measure(lambda: cold_start(folder, False), repeat)
+    cold_start(folder, False).write_snapshot()
+    results["cold_start[snapshot]"] = measure(lambda: cold_start(folder, True), repeat)
+    return results, tree_kind
+
+
+def run_rounds(args):
+    # Run the suite once per round in a process of its own: timings of some
+    # benchmarks differ between processes by more than the tolerance (memory
+    # layout), so rounds within one process would all share its luck.
+    rounds = []
+    for _ in range(args.rounds):
+        fd, path = tempfile.mkstemp(suffix=".json", prefix="tracker-bench-")
+        os.close(fd)
+        try:
+            subprocess.run([sys.executable, "-m", "benchmarks.run", "--scale", str(args.scale),
+                            "--repeat", str(args.repeat), "--output", path],
+                           check=True, stdout=subprocess.DEVNULL)
+            with open(path, "r") as f:
+                rounds.append(json.load(f))
+        finally:
+            os.remove(path)
+    meta = dict(rounds[0]["meta"], rounds=args.rounds)
+    return meta, combine([report["results"] for report in rounds])
+
+
+def combine(rounds):
+    # One result per benchmark over several rounds: the median of the
+    # rounds' medians, so one slow or fast process does not set it.
+    results = {}
+    for name in rounds[0]:
+        runs = [results[name] for results in rounds]
+        results[name] = {"median_ms": round(statistics.median(r["median_ms"] for r in runs), 4),
+                         "min_ms": min(r["min_ms"] for r in runs), "max_ms": max(r["max_ms"] for r in runs),
+                         "runs": sum(r["runs"] for r in runs), "calls": runs[0]["calls"]}
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE, min_delta=MIN_DELTA_MS):
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get("results", {}).get(name)
+        if not before or not before["median_ms"]:
+            print(f"{name:32} {result['median_ms']:10.3f} ms   (new)")
+            continue
+        ratio = result["median_ms"] / before["median_ms"]
+        slower = ratio > 1 + tolerance and result["median_ms"] - before["median_ms"] >= min_delta
+        flag = "  REGRESSION" if slower else ""
+        print(f"{name:32} {result['median_ms']:10.3f} ms   {ratio:5.2f}x{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the tracker's core operations on synthetic data.")
+    parser.add_argument("--scale", type=float, default=1.0, help="dataset size relative to the full set")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=1,
+                        help="run the suite this many times, each in a new process, and combine the "
+                             "results (use 3 or more when saving a baseline)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a previous results file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--min-delta", type=float, default=MIN_DELTA_MS, help="smallest slowdown in ms reported")
+    args = parser.parse_args(argv)
+
+    if args.rounds > 1:
+        meta, results = run_rounds(args)
+    else:
+        folder = tempfile.mkdtemp(prefix="tracker-bench-")
+        try:
+            started = time.perf_counter()
+            sizes = generate(folder, args.scale)
+            print(f"Generated {sizes} in {time.perf_counter() - started:.1f}s")
+            results, tree_kind = run(folder, args.repeat)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+        meta = {"created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(), "platform": platform.platform(),
+                "scale": args.scale, "rounds": 1, "sizes": sizes, "treeview": tree_kind}
+
+    report = {"meta": meta, "results": results}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta)
+    else:
+        for name, result in results.items():
+            print(f"{name:32} {result['median_ms']:10.3f} ms")
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
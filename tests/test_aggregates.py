@@ -0,0 +1,20 @@
+from tracker import aggregates
+
+HISTORY = [{"date": "01/01/2025", "calories": 2000.0, "calories_goal": 2000},
+           {"date": "01/02/2025", "calories": 1800.0, "calories_goal": 2000}]
+LATER = {"date": "01/05/2025", "calories": 2100.0, "calories_goal": 2000}
+
+
+def test_rebuild_counts_days_missed_before_the_current_day():
+    assert aggregates.rebuild(HISTORY, [])["missed_days"] == 0
+    assert aggregates.rebuild(HISTORY, [], "01/05/2025")["missed_days"] == 2
+    assert aggregates.rebuild(HISTORY, [], "01/03/2025")["missed_days"] == 0
+
+
+def test_rollover_after_a_rebuild_matches_a_full_rebuild():
+    # What the store does: rebuild while 01/05 is being logged, then fold
+    # that day in when it rolls over.
+    state = aggregates.rebuild(HISTORY, [], LATER["date"])
+    aggregates.add_day(state, LATER)
+    state["last_day"] = LATER["date"]
+    assert state == aggregates.rebuild(HISTORY + [LATER], [], LATER["date"])
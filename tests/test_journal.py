@@ -0,0 +1,68 @@
+from tracker.journal import DailyJournal, apply_entry
+from tracker.writer import atomic_write, dumps
+
+
+def consume(calories):
+    return {"op": "consume", "macros": {"calories": calories}}
+
+
+def event(name):
+    return {"op": "event", "event": name}
+
+
+def record(journal, data, entry):
+    # What TrackerStore does for each consumption: change the day in
+    # memory, then journal the change.
+    apply_entry(data, entry)
+    journal.append(entry)
+
+
+def open_journal(tmp_path, compact_every=200):
+    journal = DailyJournal(str(tmp_path / "daily.json"), compact_every=compact_every)
+    return journal, journal.load()
+
+
+def test_entries_are_replayed_on_load(tmp_path):
+    journal, data = open_journal(tmp_path)
+    for calories in (100, 250):
+        record(journal, data, consume(calories))
+    record(journal, data, event("Ate toast"))
+    _, loaded = open_journal(tmp_path)
+    assert loaded["totals"]["calories"] == 350
+    assert loaded["events"] == ["Ate toast"]
+
+
+def test_compaction_folds_the_journal_into_the_snapshot(tmp_path):
+    journal, data = open_journal(tmp_path, compact_every=3)
+    for calories in (100, 200, 300, 400):
+        record(journal, data, consume(calories))
+    assert (tmp_path / "daily.journal").read_text().count("\n") == 1
+    _, loaded = open_journal(tmp_path)
+    assert loaded["totals"]["calories"] == 1000
+
+
+def test_interrupted_compaction_does_not_count_entries_twice(tmp_path):
+    journal, data = open_journal(tmp_path)
+    for calories in (100, 200):
+        record(journal, data, consume(calories))
+    # The snapshot is written but the process dies before the journal is
+    # truncated: both hold the same two entries.
+    atomic_write(journal.snapshot_path, dumps(dict(journal.data, seq=journal.seq)))
+    journal, data = open_journal(tmp_path)
+    assert data["totals"]["calories"] == 300
+    # Entries after the restart still count, once.
+    record(journal, data, consume(50))
+    _, loaded = open_journal(tmp_path)
+    assert loaded["totals"]["calories"] == 350
+
+
+def test_a_torn_last_line_does_not_swallow_later_entries(tmp_path):
+    journal, data = open_journal(tmp_path)
+    record(journal, data, consume(100))
+    with open(journal.journal_path, "a") as f:
+        f.write('{"op": "consume", "macros": {"calo')
+    journal, data = open_journal(tmp_path)
+    assert data["totals"]["calories"] == 100
+    record(journal, data, consume(40))
+    _, loaded = open_journal(tmp_path)
+    assert loaded["totals"]["calories"] == 140
@@ -0,0 +1,150 @@
+from datetime import date, timedelta
+
+import pytest
+
+from tracker.events import COMPACT_SHARE
+from tracker.macros import MACROS
+from tracker.recompute import Correction
+from tracker.store import TrackerStore
+
+FOODS = [{"name": "Rice", "calories": 130.0, "protein": 2.7, "carbs": 28.0, "fats": 0.3},
+         {"name": "Chicken", "calories": 165.0, "protein": 31.0, "carbs": 0.0, "fats": 3.6},
+         {"name": "Apple", "calories": 52.0, "protein": 0.3, "carbs": 14.0, "fats": 0.2}]
+
+
+def day(offset):
+    return (date.today() - timedelta(days=offset)).strftime("%m/%d/%Y")
+
+
+def open_store(folder, backend):
+    return TrackerStore(str(folder), backend, snapshot=False)
+
+
+def logged_store(folder, backend, days=3):
+    # Rice and chicken alone and in a saved meal on each of the last few
+    # days and today, and an apple on the first day.
+    folder.mkdir(exist_ok=True)
+    store = open_store(folder, backend)
+    store.load_catalog()
+    store.add_catalog_items("foods", [dict(food) for food in FOODS])
+    rice, chicken = store.foods_by_name["Rice"], store.foods_by_name["Chicken"]
+    meal = store.add_meal("Bowl", [("Rice", 150.0), ("Chicken", 120.0)])
+    store.daily_data["date"] = day(days)
+    for offset in range(days, -1, -1):
+        store.rollover(day(offset))
+        store.record_food(rice, 100.0 + offset)
+        store.record_food(chicken, 80.0)
+        store.record_meal(meal)
+        if offset == days:
+            store.record_food(store.foods_by_name["Apple"], 150.0)
+    return store
+
+
+def day_sums(events):
+    sums = {}
+    for event in events:
+        totals = sums.setdefault(event["date"], [0.0] * len(MACROS))
+        for i, value in enumerate(event["macros"]):
+            totals[i] += value
+    return sums
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_apply_writes_what_the_preview_showed(tmp_path, backend):
+    store = logged_store(tmp_path, backend)
+    rice = store.foods_by_name["Rice"]
+    correction = Correction(store, rice["id"], {"calories": 150.0}, workers=1)
+    assert len(correction.days) == 3
+    assert len(correction.events) == 6 and len(correction.today_events) == 2
+    expected_days = {before["date"]: after for before, after in correction.days}
+    expected_events = [new for _, new in correction.events]
+    expected_today = correction.today[1]
+    correction.apply()
+    store.close()
+
+    store = open_store(tmp_path, backend)
+    assert store.foods_by_name["Rice"]["calories"] == 150.0
+    for record in store.history:
+        assert record == expected_days[record["date"]]
+    for macro in MACROS:
+        assert store.daily_data["totals"][macro] == pytest.approx(expected_today[macro])
+    store.event_log.load()
+    events = store.event_log.events
+    positions = [p for p, _ in correction.events]
+    assert [events[p] for p in positions] == expected_events
+    # Every corrected day still adds up from its logged entries.
+    for date_str, totals in day_sums(events).items():
+        record = next(r for r in store.history if r["date"] == date_str)
+        assert [record[macro] for macro in MACROS] == pytest.approx(totals, abs=0.06)
+    # Nothing is left to correct.
+    assert not Correction(store, rice["id"], {"calories": 150.0}, workers=1).days
+    store.close()
+
+
+def test_meals_are_corrected_by_what_they_held_when_logged(tmp_path):
+    store = logged_store(tmp_path, "json", days=1)
+    meal = store.saved_meals[0]
+    store.update_meal(meal, items=[("Chicken", 200.0)])
+    chicken = store.foods_by_name["Chicken"]
+    correction = Correction(store, store.foods_by_name["Rice"]["id"], {"calories": 0.0}, workers=1)
+    meal_events = [new for _, new in correction.events if new["kind"] == "meal"]
+    assert len(meal_events) == 1
+    [rice_item] = [item for item in meal_events[0]["items"] if item["food_id"] != chicken["id"]]
+    assert rice_item["macros"][0] == 0.0
+    assert meal_events[0]["macros"][0] == pytest.approx(165.0 * 1.2)
+    store.close()
+
+
+def test_patches_survive_a_reload_and_fold_into_the_log(tmp_path):
+    store = logged_store(tmp_path, "json", days=6)
+    log_path = tmp_path / "events.jsonl"
+    patch_path = tmp_path / "events.patches"
+    rice = store.foods_by_name["Rice"]
+    store.event_log.load()
+    total = len(store.event_log.events)
+
+    # A correction touching under a quarter of the log is kept as patches.
+    apple = store.foods_by_name["Apple"]
+    correction = Correction(store, apple["id"], {"calories": 50.0}, workers=1)
+    assert 0 < len(correction.events) <= total * COMPACT_SHARE
+    log_before = log_path.read_bytes()
+    correction.apply()
+    assert patch_path.exists() and log_path.read_bytes() == log_before
+    store.close()
+    store = open_store(tmp_path, "json")
+    store.event_log.load()
+    assert [store.event_log.events[p] for p, _ in correction.events] == [new for _, new in correction.events]
+    store.load_catalog()
+
+    # Past a quarter, the patches are folded into events.jsonl.
+    correction = Correction(store, rice["id"], {"calories": 140.0}, workers=1)
+    correction.apply()
+    assert not patch_path.exists()
+    store.close()
+    store = open_store(tmp_path, "json")
+    store.event_log.load()
+    assert store.event_log.patches == 0
+    assert [store.event_log.events[p] for p, _ in correction.events] == [new for _, new in correction.events]
+    store.close()
+
+
+def test_patches_follow_their_event_past_a_damaged_line(tmp_path):
+    store = logged_store(tmp_path, "json", days=6)
+    apple = store.foods_by_name["Apple"]
+    correction = Correction(store, apple["id"], {"calories": 50.0}, workers=1)
+    correction.apply()
+    [(position, new)] = [(p, e) for p, e in correction.events if e["kind"] == "food"]
+    store.close()
+    # A line before the corrected event becomes unreadable.
+    log_path = tmp_path / "events.jsonl"
+    lines = log_path.read_text().splitlines(keepends=True)
+    assert position > 0
+    lines[0] = '{"time": \n'
+    log_path.write_text("".join(lines))
+
+    store = open_store(tmp_path, "json")
+    store.event_log.load()
+    events = store.event_log.events
+    assert events[position - 1] == new
+    assert [event for event in events if event["macros"] == new["macros"]] == [new]
+    store.close()
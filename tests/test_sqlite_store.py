@@ -0,0 +1,70 @@
+import json
+import sqlite3
+
+import pytest
+
+from tracker.sqlite_store import SQLiteStorage
+from tracker.store import TrackerStore
+
+FOODS = [{"name": "Oats", "id": 7, "calories": 380.0, "protein": 13.0, "carbs": 67.0, "fats": 7.0},
+         {"name": "Egg", "id": 3, "calories": 155.0, "protein": 13.0, "carbs": 1.0, "fats": 11.0}]
+HISTORY = [{"date": "01/01/2025", "calories": 2000.0}, {"date": "01/02/2025", "calories": 1800.0},
+           {"date": "01/03/2025", "calories": 2100.0}]
+
+
+def old_database(path):
+    # Rows in the layout from before the rekeying: ids in insertion order
+    # (with gaps), not record ids or positions, and user_version 0.
+    SQLiteStorage(path).close()
+    conn = sqlite3.connect(path)
+    with conn:
+        for row_id, food in zip((10, 11), FOODS):
+            conn.execute("INSERT INTO foods (id, name, data) VALUES (?, ?, ?)",
+                         (row_id, food["name"], json.dumps(food)))
+        for row_id, record in zip((5, 9, 12), HISTORY):
+            conn.execute("INSERT INTO history (id, day, data) VALUES (?, ?, ?)",
+                         (row_id, record["date"], json.dumps(record)))
+        conn.execute("PRAGMA user_version = 0")
+    conn.close()
+
+
+def test_rekeyed_database_round_trips(tmp_path):
+    path = str(tmp_path / "tracker.db")
+    old_database(path)
+    db = SQLiteStorage(path)
+    assert db.conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert db.conn.execute("SELECT id FROM foods ORDER BY id").fetchall() == [(3,), (7,)]
+    assert db.conn.execute("SELECT id FROM history ORDER BY id").fetchall() == [(1,), (2,), (3,)]
+    assert db.load_collection("history") == HISTORY
+    assert sorted(db.load_collection("foods"), key=lambda f: f["id"]) == sorted(FOODS, key=lambda f: f["id"])
+    db.close()
+    # Opening again does not rekey again.
+    db = SQLiteStorage(path)
+    assert db.load_collection("history") == HISTORY
+    db.close()
+
+
+def test_edits_are_written_by_key_and_read_back(tmp_path):
+    old_database(str(tmp_path / "tracker.db"))
+    store = TrackerStore(str(tmp_path), "sqlite", snapshot=False)
+    store.update_food(3, {"calories": 150.0})
+    store.history[1]["calories"] = 1850.0
+    store.save("history", changed=[store.history[1]])
+    del store.history[2]
+    store.save("history", changed=[])
+    store.close()
+
+    store = TrackerStore(str(tmp_path), "sqlite", snapshot=False)
+    assert store.foods_by_id[3]["calories"] == 150.0
+    assert store.foods_by_id[7]["calories"] == 380.0
+    assert [r["calories"] for r in store.history] == [2000.0, 1850.0]
+    store.close()
+
+
+def test_a_failed_rewrite_keeps_the_old_rows(tmp_path):
+    db = SQLiteStorage(str(tmp_path / "tracker.db"))
+    db.replace_collection("foods", FOODS)
+    with pytest.raises(TypeError):
+        db.replace_collection("foods", [{"id": 1, "name": "Bad", "calories": {1}}])
+    assert sorted(f["id"] for f in db.load_collection("foods")) == [3, 7]
+    db.close()
@@ -0,0 +1,37 @@
+import pytest
+
+from tracker.store import TrackerStore
+
+# The suggester needs NumPy.
+Suggester = pytest.importorskip("tracker.suggest").Suggester
+
+FOODS = [{"name": "Rice", "calories": 130.0, "protein": 2.7, "carbs": 28.0, "fats": 0.3},
+         {"name": "Chicken", "calories": 165.0, "protein": 31.0, "carbs": 0.0, "fats": 3.6},
+         {"name": "Egg", "units": True, "per_unit": True, "calories": 78.0, "protein": 6.3, "carbs": 0.6, "fats": 5.3}]
+DRINKS = [{"name": "Milk", "calories": 122.0, "protein": 8.0, "carbs": 12.0, "fats": 4.8}]
+
+
+def test_incremental_updates_match_a_fresh_build(tmp_path):
+    store = TrackerStore(str(tmp_path), "json", snapshot=False)
+    store.load_catalog()
+    store.add_catalog_items("foods", [dict(food) for food in FOODS])
+    store.add_catalog_items("drinks", [dict(drink) for drink in DRINKS])
+    bowl = store.add_meal("Bowl", [("Rice", 150.0), ("Chicken", 120.0)])
+    breakfast = store.add_meal("Breakfast", [("Egg", 2.0), ("Rice", 50.0)])
+    store.record_food(store.foods_by_name["Rice"], 100.0)
+    assert store.suggestions()
+
+    # Each kind of change the suggester applies to its rows in place.
+    store.update_food(store.foods_by_name["Chicken"]["id"], {"protein": 25.0})
+    store.add_catalog_items("foods", [{"name": "Oats", "calories": 380.0, "protein": 13.0,
+                                       "carbs": 67.0, "fats": 7.0}])
+    store.update_drink(store.drinks[0]["id"], {"calories": 64.0, "fats": 1.0})
+    store.update_meal(bowl, items=[("Oats", 80.0), ("Chicken", 100.0)])
+    store.remove_meal(breakfast)
+    store.add_meal("Snack", [("Egg", 1.0)])
+
+    fresh = Suggester(store)
+    for kinds in (None, ["meal"]):
+        incremental = store.suggestions(limit=50, kinds=kinds)
+        rebuilt = fresh.suggest(limit=50, kinds=kinds)
+        assert incremental == rebuilt
@@ -0,0 +1,127 @@
+import pytest
+
+from tracker.store import TrackerStore
+from tracker.sync import FolderLink, Replica, sync
+from tracker.timeseries import MEASUREMENT_FIELDS
+
+FOODS = [{"name": "Oats", "calories": 380.0, "protein": 13.0, "carbs": 67.0, "fats": 7.0},
+         {"name": "Egg", "calories": 155.0, "protein": 13.0, "carbs": 1.0, "fats": 11.0}]
+
+
+def make_store(folder):
+    folder.mkdir(parents=True, exist_ok=True)
+    store = TrackerStore(str(folder), snapshot=False)
+    store.load_catalog()
+    return store
+
+
+def sync_folders(a, b):
+    # One sync of a with b, as "python -m tracker.sync with B" run in A.
+    store, peer = make_store(a), make_store(b)
+    try:
+        return sync(Replica(store), FolderLink(peer))
+    finally:
+        peer.close()
+        store.close()
+
+
+def food(folder, name):
+    store = make_store(folder)
+    try:
+        return next(f for f in store.foods if f["name"] == name)
+    finally:
+        store.close()
+
+
+def test_new_records_reach_the_other_side(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    store = make_store(a)
+    store.add_catalog_items("foods", [dict(f) for f in FOODS])
+    store.record_measurements(dict.fromkeys(MEASUREMENT_FIELDS, 30.0), date="01/02/2025")
+    store.close()
+    make_store(b).close()
+
+    result = sync_folders(a, b)
+    assert result["sent"] == 3
+    assert food(b, "Egg")["calories"] == 155.0
+    store = make_store(b)
+    assert [m["date"] for m in store.measurements] == ["01/02/2025"]
+    store.close()
+    # Nothing changed since, so nothing is sent again.
+    assert sync_folders(a, b)["sent"] == 0
+    assert sync_folders(b, a)["sent"] == 0
+
+
+def device(folder):
+    store = make_store(folder)
+    try:
+        return Replica(store).device
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("starter", ["a", "b"])
+def test_conflicting_edits_converge(tmp_path, starter):
+    a, b = tmp_path / "a", tmp_path / "b"
+    store = make_store(a)
+    store.add_catalog_items("foods", [dict(f) for f in FOODS])
+    store.close()
+    make_store(b).close()
+    sync_folders(a, b)
+
+    # Both devices change the same food before syncing again.
+    written = {}
+    for folder, calories in ((a, 300.0), (b, 310.0)):
+        store = make_store(folder)
+        store.update_food(store.foods_by_name["Egg"]["id"], {"calories": calories})
+        store.close()
+        written[device(folder)] = calories
+
+    result = sync_folders(a, b) if starter == "a" else sync_folders(b, a)
+    [(name, key, winner)] = result["conflicts"]
+    assert (name, key) == ("foods", "egg")
+    assert food(a, "Egg")["calories"] == food(b, "Egg")["calories"] == written[winner]
+    # The loser's side took the winning record as it is, so syncing again
+    # either way sends nothing and changes nothing.
+    assert sync_folders(a, b)["sent"] == sync_folders(b, a)["sent"] == 0
+    assert food(a, "Egg")["calories"] == food(b, "Egg")["calories"] == written[winner]
+
+
+def test_later_edit_wins_a_conflict(tmp_path):
+    a, b, c = tmp_path / "a", tmp_path / "b", tmp_path / "c"
+    store = make_store(a)
+    store.add_catalog_items("foods", [dict(f) for f in FOODS])
+    store.close()
+    for folder in (b, c):
+        make_store(folder).close()
+        sync_folders(a, folder)
+
+    # A edits first and syncs with C, which moves C's clock past A's edit;
+    # C's edit made after that is the later one and wins against A.
+    store = make_store(a)
+    store.update_food(store.foods_by_name["Oats"]["id"], {"calories": 300.0})
+    store.close()
+    sync_folders(a, c)
+    store = make_store(c)
+    store.update_food(store.foods_by_name["Oats"]["id"], {"calories": 320.0})
+    store.close()
+    # B has not seen either edit; it ends up with C's.
+    sync_folders(b, a)
+    sync_folders(b, c)
+    sync_folders(a, b)
+    assert food(a, "Oats")["calories"] == food(b, "Oats")["calories"] == food(c, "Oats")["calories"] == 320.0
+
+
+def test_records_added_on_both_sides_are_all_kept(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    for folder, weight in ((a, 80.0), (b, 79.5)):
+        store = make_store(folder)
+        store.record_profile_update(weight, date="03/01/2025")
+        store.record_measurements(dict.fromkeys(MEASUREMENT_FIELDS, weight / 2), date="03/01/2025")
+        store.close()
+    sync_folders(a, b)
+    for folder in (a, b):
+        store = make_store(folder)
+        assert sorted(r["weight"] for r in store.profile_history) == [79.5, 80.0]
+        assert len(store.measurements) == 2
+        store.close()
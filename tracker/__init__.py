@@ -0,0 +1,2 @@
+from .macros import MACROS, drink_consumption, macro_vector, scale_vector
+from .store import StorageError, TrackerStore
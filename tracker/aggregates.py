@@ -0,0 +1,125 @@
+import math
+
+from .macros import MACROS
+from .timeseries import day_ordinal
+
+VERSION = 1
+# Weight smoothing, matching Analytics.weight_trend.
+EMA_ALPHA = 0.1
+# A day counts towards the goal streak when calories are within this share
+# of the goal.
+GOAL_TOLERANCE = 0.1
+
+
+# Long-term statistics kept up to date one day (or one weigh-in) at a time,
+# so showing them never rescans history. The state is a plain dict saved as
+# aggregates.json.
+def empty_aggregates():
+    return {"version": VERSION, "days": 0, "missed_days": 0,
+            "sums": {macro: 0.0 for macro in MACROS},
+            "squares": {macro: 0.0 for macro in MACROS},
+            "goal_days": 0,
+            "streak": 0, "best_streak": 0,
+            "goal_streak": 0, "best_goal_streak": 0,
+            "weight_ema": None, "weigh_ins": 0,
+            # Date of the last finished day folded in, so a rollover that
+            # is run again does not count the day twice.
+            "last_day": None}
+
+
+def within_goal(record, tolerance=GOAL_TOLERANCE):
+    goal = record.get("calories_goal") or 0
+    return goal > 0 and abs(record.get("calories", 0) - goal) <= tolerance * goal
+
+
+def add_day(state, record):
+    # Fold one finished day's history record into the aggregates.
+    state["days"] += 1
+    for macro in MACROS:
+        value = float(record.get(macro, 0) or 0)
+        state["sums"][macro] += value
+        state["squares"][macro] += value * value
+    state["streak"] += 1
+    state["best_streak"] = max(state["best_streak"], state["streak"])
+    if within_goal(record):
+        state["goal_days"] += 1
+        state["goal_streak"] += 1
+        state["best_goal_streak"] = max(state["best_goal_streak"], state["goal_streak"])
+    else:
+        state["goal_streak"] = 0
+
+
+def replace_day(state, old, new):
+    # Swap a logged day's record for a corrected one. Returns False when
+    # the day moved in or out of the goal range, as the goal streaks then
+    # need a rebuild.
+    for macro in MACROS:
+        before = float(old.get(macro, 0) or 0)
+        after = float(new.get(macro, 0) or 0)
+        state["sums"][macro] += after - before
+        state["squares"][macro] += after * after - before * before
+    return within_goal(old) == within_goal(new)
+
+
+def skip_days(state, count=1):
+    # Days with nothing logged end both streaks.
+    if count > 0:
+        state["missed_days"] += count
+        state["streak"] = 0
+        state["goal_streak"] = 0
+
+
+def add_weight(state, weight, alpha=EMA_ALPHA):
+    try:
+        weight = float(weight)
+    except (TypeError, ValueError):
+        return
+    ema = state["weight_ema"]
+    state["weight_ema"] = weight if ema is None else ema + alpha * (weight - ema)
+    state["weigh_ins"] += 1
+
+
+def rebuild(history, profile_history, current=None):
+    # One full pass, for data that predates the aggregates. Gaps between
+    # consecutive history dates count as missed days, and so do the days
+    # from the last one up to current, the day still being logged (which
+    # its rollover counts).
+    state = empty_aggregates()
+    previous = None
+    for record in history:
+        try:
+            day = day_ordinal(record.get("date"))
+        except (TypeError, ValueError):
+            day = None
+        if previous is not None and day is not None:
+            skip_days(state, day - previous - 1)
+        add_day(state, record)
+        previous = day if day is not None else previous
+        state["last_day"] = record.get("date")
+    try:
+        if previous is not None and current is not None:
+            skip_days(state, day_ordinal(current) - previous - 1)
+    except (TypeError, ValueError):
+        pass
+    for record in profile_history:
+        add_weight(state, record.get("weight"))
+    return state
+
+
+def summary(state):
+    # Means and standard deviations per macro over logged days, with the
+    # streaks and weight trend.
+    days = state["days"]
+    stats = {"days": days, "missed_days": state["missed_days"],
+             "streak": state["streak"], "best_streak": state["best_streak"],
+             "goal_streak": state["goal_streak"], "best_goal_streak": state["best_goal_streak"],
+             "goal_rate": state["goal_days"] / days if days else None,
+             "weight_ema": state["weight_ema"], "macros": {}}
+    for macro in MACROS:
+        if not days:
+            stats["macros"][macro] = {"mean": None, "std": None}
+            continue
+        mean = state["sums"][macro] / days
+        variance = max(state["squares"][macro] / days - mean * mean, 0.0)
+        stats["macros"][macro] = {"mean": mean, "std": math.sqrt(variance)}
+    return stats
@@ -0,0 +1,155 @@
+from datetime import date
+
+import numpy as np
+
+from .macros import MACROS
+from .timeseries import HISTORY_FIELDS, MEASUREMENT_FIELDS, PROFILE_FIELDS, TimeSeries
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# EMA is evaluated in blocks so the decay**-k weights stay within float range:
+# at most EMA_BLOCK values, and fewer for large alpha so that decay**k stays
+# above EMA_MIN_POWER.
+EMA_BLOCK = 256
+EMA_MIN_POWER = 1e-100
+
+
+class Series:
+    # One collection as NumPy columns over a TimeSeries: a sorted int64
+    # array of day ordinals and a float64 array per field, with NaN for
+    # missing or blank values.
+    def __init__(self, records, fields):
+        days, self.columns = TimeSeries.from_records(records, fields).numpy()
+        self.days = days.astype(np.int64)
+
+    def __len__(self):
+        return len(self.days)
+
+    def window(self, start=None, end=None):
+        lo = 0 if start is None else np.searchsorted(self.days, start, "left")
+        hi = len(self.days) if end is None else np.searchsorted(self.days, end, "right")
+        return lo, hi
+
+    def period_keys(self, period):
+        if period == "week":
+            # Ordinal 1 (0001-01-01) was a Monday, so weeks start on Monday.
+            return (self.days - 1) // 7
+        if period == "month":
+            dates = (self.days - EPOCH_ORDINAL).astype("datetime64[D]")
+            return dates.astype("datetime64[M]").astype(np.int64)
+        raise ValueError(f"Unknown period: {period}")
+
+    def period_start(self, period, key):
+        if period == "week":
+            return date.fromordinal(int(key) * 7 + 1)
+        month = np.datetime64(int(key), "M").astype("datetime64[D]").astype(np.int64)
+        return date.fromordinal(int(month) + EPOCH_ORDINAL)
+
+    def rollup(self, fields, period="week"):
+        # Per-period record counts and NaN-aware means for each field.
+        if not len(self):
+            return []
+        keys = self.period_keys(period)
+        unique, starts = np.unique(keys, return_index=True)
+        means = {}
+        for field in fields:
+            values = self.columns[field]
+            valid = ~np.isnan(values)
+            sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+            counts = np.add.reduceat(valid.astype(np.int64), starts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means[field] = sums / counts
+        sizes = np.diff(np.append(starts, len(self)))
+        return [{"start": self.period_start(period, key),
+                 "count": int(size),
+                 **{field: float(means[field][i]) for field in fields}}
+                for i, (key, size) in enumerate(zip(unique, sizes))]
+
+    def rolling_mean(self, field, window_days):
+        # Mean over the calendar window (day - window_days, day] ending at
+        # each record, from prefix sums and searchsorted bounds.
+        values = self.columns[field]
+        valid = ~np.isnan(values)
+        sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+        counts = np.concatenate(([0], np.cumsum(valid)))
+        lo = np.searchsorted(self.days, self.days - window_days + 1, "left")
+        hi = np.arange(1, len(self) + 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (sums[hi] - sums[lo]) / (counts[hi] - counts[lo])
+
+    def ema(self, field, alpha):
+        values = self.columns[field]
+        valid = ~np.isnan(values)
+        return self.days[valid], ema(values[valid], alpha)
+
+
+def ema(values, alpha):
+    # Vectorized exponential moving average seeded with the first value:
+    # inside each block ema[j] = d**(j+1) * prev + a * sum(d**(j-i) * x[i]).
+    out = np.empty_like(values)
+    if not len(values):
+        return out
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        # alpha = 1 keeps only the latest value.
+        out[:] = values
+        return out
+    size = max(1, min(EMA_BLOCK, int(np.log(EMA_MIN_POWER) / np.log(decay))))
+    prev = values[0]
+    for start in range(0, len(values), size):
+        block = values[start:start + size]
+        powers = decay ** np.arange(1, len(block) + 1)
+        out[start:start + len(block)] = powers * (prev + alpha * np.cumsum(block / powers))
+        prev = out[start + len(block) - 1]
+    return out
+
+
+class Analytics:
+    def __init__(self, history, profile_history, measurements):
+        self.load_history(history)
+        self.load_profile(profile_history)
+        self.load_measurements(measurements)
+
+    def load_history(self, history):
+        self.history = Series(history, HISTORY_FIELDS)
+
+    def load_profile(self, profile_history):
+        self.profile = Series(profile_history, PROFILE_FIELDS)
+
+    def load_measurements(self, measurements):
+        self.measurements = Series(measurements, MEASUREMENT_FIELDS)
+
+    def history_rollup(self, period="week", tolerance=0.1):
+        # Weekly or monthly macro averages with the share of days whose
+        # calories landed within tolerance of that day's goal.
+        rows = self.history.rollup(MACROS, period)
+        if not rows:
+            return rows
+        hits = self.adherence_mask("calories", tolerance)
+        keys = self.history.period_keys(period)
+        _, starts = np.unique(keys, return_index=True)
+        rates = np.add.reduceat(hits.astype(np.float64), starts) / np.diff(np.append(starts, len(keys)))
+        for row, rate in zip(rows, rates):
+            row["adherence"] = float(rate)
+        return rows
+
+    def adherence_mask(self, macro, tolerance=0.1):
+        actual = self.history.columns[macro]
+        goal = self.history.columns[f"{macro}_goal"]
+        with np.errstate(invalid="ignore"):
+            return np.abs(actual - goal) <= tolerance * goal
+
+    def adherence_rate(self, macro, tolerance=0.1, days=None):
+        hits = self.adherence_mask(macro, tolerance)
+        if days is not None and len(self.history):
+            lo, _ = self.history.window(start=self.history.days[-1] - days + 1)
+            hits = hits[lo:]
+        return float(hits.mean()) if len(hits) else None
+
+    def rolling_average(self, macro, window_days=7):
+        if not len(self.history):
+            return None
+        return float(self.history.rolling_mean(macro, window_days)[-1])
+
+    def weight_trend(self, alpha=0.1):
+        days, smoothed = self.profile.ema("weight", alpha)
+        return [(date.fromordinal(int(d)), float(w)) for d, w in zip(days, smoothed)]
@@ -0,0 +1,58 @@
+def assign_ids(items):
+    # Give every catalog item a stable integer "id". Existing ids are kept;
+    # new ones continue after the largest id in use. Returns True when any
+    # item was changed and the catalog needs saving.
+    next_id = max((item["id"] for item in items if "id" in item), default=0) + 1
+    changed = False
+    for item in items:
+        if "id" not in item:
+            item["id"] = next_id
+            next_id += 1
+            changed = True
+    return changed
+
+
+def build_index(items):
+    return {item["id"]: item for item in items}
+
+
+def build_name_index(items):
+    index = {}
+    for item in items:
+        index.setdefault(item.get("name"), item)
+    return index
+
+
+def normalize_meals(meals, foods):
+    # Older meals embed a full copy of each food. Replace every copy with a
+    # {"food_id", "quantity"} reference to the catalog food of the same name;
+    # foods that are not in the catalog are added to it once, however many
+    # meals embed them. Returns True when any meal was rewritten.
+    by_name = build_name_index(foods)
+    next_id = max((food["id"] for food in foods), default=0) + 1
+    changed = False
+    for meal in meals:
+        items = []
+        for item in meal.get("items", []):
+            embedded = item.get("food")
+            if embedded is None:
+                items.append(item)
+                continue
+            food = by_name.get(embedded.get("name"))
+            if food is None:
+                food = {key: value for key, value in embedded.items() if key != "id"}
+                food["id"] = next_id
+                next_id += 1
+                foods.append(food)
+                by_name[food.get("name")] = food
+            items.append({"food_id": food["id"], "quantity": item.get("quantity", 0)})
+            changed = True
+        meal["items"] = items
+    return changed
+
+
+def resolve_items(meal, foods_by_id):
+    # (food, quantity) pairs for a meal; food is None when the referenced
+    # food has been removed from the catalog.
+    return [(foods_by_id.get(item.get("food_id")), item.get("quantity", 0))
+            for item in meal.get("items", [])]
@@ -0,0 +1,69 @@
+import bisect
+import math
+
+
+# Largest-Triangle-Three-Buckets downsampling: one point is kept per bucket,
+# the one forming the largest triangle with the point kept in the previous
+# bucket and the average of the next one, which keeps peaks and dips that
+# plain averaging or striding would flatten.
+def area(ax, ay, bx, by, cx, cy):
+    # Twice the triangle's area; only compared, never shown.
+    return abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+
+
+class BucketedLTTB:
+    # LTTB over buckets of a fixed width in x (days per pixel at one zoom
+    # level), aligned to multiples of width rather than to the data. New
+    # points only change the last buckets, so extend() reselects just the
+    # last two old buckets and the new ones instead of the whole series;
+    # any x range is then a slice of the kept points.
+    def __init__(self, width):
+        self.width = width
+        self.xs = []
+        self.ys = []
+        self.keys = []
+        self.starts = []
+        self.selected = []
+
+    def extend(self, points):
+        # points are (x, y) pairs with x ascending and not before the last
+        # point already added; NaN values are skipped.
+        first = max(len(self.keys) - 2, 0)
+        for x, y in points:
+            if math.isnan(y):
+                continue
+            key = x // self.width
+            if not self.keys or key != self.keys[-1]:
+                self.keys.append(key)
+                self.starts.append(len(self.xs))
+            self.xs.append(x)
+            self.ys.append(y)
+        self.select(first)
+
+    def select(self, first):
+        del self.selected[first:]
+        xs, ys, starts = self.xs, self.ys, self.starts
+        last = len(starts) - 1
+        for b in range(first, last + 1):
+            lo = starts[b]
+            hi = starts[b + 1] if b < last else len(xs)
+            if b == 0:
+                self.selected.append(lo)
+                continue
+            if b == last:
+                self.selected.append(hi - 1)
+                continue
+            next_hi = starts[b + 2] if b + 1 < last else len(xs)
+            count = next_hi - hi
+            avg_x = sum(xs[hi:next_hi]) / count
+            avg_y = sum(ys[hi:next_hi]) / count
+            a = self.selected[b - 1]
+            ax, ay = xs[a], ys[a]
+            self.selected.append(max(range(lo, hi), key=lambda j: area(ax, ay, xs[j], ys[j], avg_x, avg_y)))
+
+    def points(self, start=None, end=None):
+        # Kept points with start <= x <= end.
+        lo = 0 if start is None else bisect.bisect_left(self.keys, start // self.width)
+        hi = len(self.keys) if end is None else bisect.bisect_right(self.keys, end // self.width)
+        return [(self.xs[i], self.ys[i]) for i in self.selected[lo:hi]
+                if (start is None or self.xs[i] >= start) and (end is None or self.xs[i] <= end)]
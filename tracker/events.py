@@ -0,0 +1,310 @@
+import bisect
+import heapq
+import json
+import os
+from array import array
+from datetime import datetime
+
+from .instrument import stats
+from .macros import MACROS
+from .timeseries import day_ordinal
+from .writer import atomic_write, dumps, read_jsonl
+
+# Consumption event kinds and the unit their quantity is in.
+UNITS = {"food": "g", "food_unit": "unit", "drink": "serving", "meal": "meal"}
+# Corrected events are kept in a patch file next to events.jsonl until they
+# number more than this share of the log; then the log is rewritten.
+COMPACT_SHARE = 0.25
+# Bytes read from the end of events.jsonl to find the newest event without
+# loading the log.
+TAIL_BYTES = 64 * 1024
+
+
+def make_event(kind, item, quantity, consumption, date, when=None, items=None):
+    # A structured consumption record. item_id is the catalog id (foods,
+    # drinks) or the saved meal id; name is kept so the record still reads
+    # correctly if the item is later renamed or removed. A meal's items are
+    # what it was made of when logged, as (food id, quantity, macros) per
+    # meal, so the foods in it can be traced after the meal changes.
+    unit = UNITS["food_unit"] if kind == "food" and item.get("per_unit", False) else UNITS[kind]
+    event = {"time": (when or datetime.now()).isoformat(timespec="seconds"),
+             "date": date,
+             "kind": kind,
+             "item_id": item.get("id"),
+             "name": item.get("name"),
+             "quantity": quantity,
+             "unit": unit,
+             "macros": [consumption.get(macro, 0) for macro in MACROS]}
+    if items is not None:
+        event["items"] = [{"food_id": food_id, "quantity": qty, "macros": list(macros)}
+                          for food_id, qty, macros in items]
+    return event
+
+
+def describe(event):
+    # The text shown on the Today tab. Days logged before structured events
+    # existed hold plain strings, which are shown as they are.
+    if isinstance(event, str):
+        return event
+    name, quantity = event.get("name"), event.get("quantity", 0)
+    if event["kind"] == "meal":
+        calories, protein, carbs, fats = (round(value, 1) for value in event["macros"])
+        return f"Ate meal '{name}' (Cal: {calories}, Prot: {protein}, Carbs: {carbs}, Fats: {fats})"
+    if event["kind"] == "drink":
+        servings = "1 serving" if quantity == 1 else f"{quantity:g} servings"
+        return f"Drank {servings} of {name}"
+    if event["unit"] == "unit":
+        return f"Ate {quantity:.1f} unit(s) of {name}"
+    return f"Ate {quantity:.1f}g of {name}"
+
+
+def is_structured(event):
+    return isinstance(event, dict)
+
+
+def meal_foods(event):
+    # Food ids in a meal event; empty for other events and for meals logged
+    # before their items were recorded.
+    if event.get("kind") != "meal":
+        return set()
+    return {item.get("food_id") for item in event.get("items", ())}
+
+
+def meal_portion(event, food_id):
+    # The part of a meal event that was food_id, as a food event.
+    quantity, macros = 0.0, [0.0] * len(MACROS)
+    for item in event["items"]:
+        if item.get("food_id") == food_id:
+            quantity += item.get("quantity", 0)
+            macros = [total + value for total, value in zip(macros, item["macros"])]
+    times = event.get("quantity", 1)
+    return {"time": event.get("time"), "date": event.get("date"), "kind": "food", "item_id": food_id,
+            "meal_id": event.get("item_id"), "quantity": quantity * times,
+            "macros": [value * times for value in macros]}
+
+
+def event_key(event):
+    # What identifies a logged event: corrections change its macros but
+    # never these.
+    return (event.get("time"), event.get("kind"), event.get("item_id"), event.get("quantity"))
+
+
+def patch_position(events, patch):
+    # Where a patch applies: its recorded position, or when the event there
+    # is a different one (a damaged line before it is skipped on reading,
+    # which moves later events down), the nearest event before that with
+    # the same key. None when the event is not in the log.
+    position, key = patch.get("position"), event_key(patch["event"])
+    if not isinstance(position, int) or position < 0:
+        return None
+    for p in range(min(position, len(events) - 1), -1, -1):
+        if event_key(events[p]) == key:
+            return p
+    return None
+
+
+def event_day(event):
+    try:
+        return day_ordinal(event["date"])
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+
+def summarize(events):
+    # Total quantity, macros and count over structured events.
+    total = {"count": 0, "quantity": 0.0, **{macro: 0.0 for macro in MACROS}}
+    for event in events:
+        total["count"] += 1
+        total["quantity"] += event.get("quantity", 0)
+        for macro, value in zip(MACROS, event["macros"]):
+            total[macro] += value
+    return total
+
+
+def top_items(events, macro="calories", limit=10):
+    # Items with the largest total of macro, as summaries with kind, item_id
+    # and name.
+    index = MACROS.index(macro)
+    totals = {}
+    for event in events:
+        key = (event["kind"], event.get("item_id"))
+        entry = totals.get(key)
+        if entry is None:
+            entry = totals[key] = {"kind": event["kind"], "item_id": event.get("item_id"),
+                                   "name": event.get("name"), "events": []}
+        entry["events"].append(event)
+    ranked = heapq.nlargest(limit, totals.values(),
+                            key=lambda e: sum(event["macros"][index] for event in e["events"]))
+    return [{"kind": e["kind"], "item_id": e["item_id"], "name": e["name"], **summarize(e["events"])}
+            for e in ranked]
+
+
+class EventLog:
+    # Structured events of finished days, appended at rollover. Records are
+    # only read when first queried; appending never needs them in memory.
+    # Queries go through two indexes: positions per (kind, item_id) and a
+    # day ordinal per position, which is sorted as long as days are
+    # appended in order and can then be bisected. Meal events are also
+    # indexed by the foods in them.
+    #
+    # Corrections replace events by position: as an UPDATE of their row in
+    # SQLite, or as one line each in the patch file, which is applied over
+    # events.jsonl on load (replaying a patch twice does no harm). A patch
+    # is only applied to an event with the same key as its own, so it never
+    # lands on the wrong event if lines before it become unreadable.
+    def __init__(self, path=None, db=None):
+        self.path = path
+        self.db = db
+        self.patch_path = os.path.splitext(path)[0] + ".patches" if path else None
+        self.events = None
+
+    def load(self):
+        # SQLite row ids by position, for updating rows.
+        self.keys = array("q")
+        self.patches = 0
+        if self.db:
+            keys, events = self.db.load_events()
+            self.keys.extend(keys)
+        elif self.path and os.path.exists(self.path):
+            events = read_jsonl(self.path)
+            if os.path.exists(self.patch_path):
+                for patch in read_jsonl(self.patch_path):
+                    if not isinstance(patch, dict) or not is_structured(patch.get("event")):
+                        continue
+                    position = patch_position(events, patch)
+                    if position is not None:
+                        events[position] = patch["event"]
+                        self.patches += 1
+        else:
+            events = []
+        self.events = []
+        self.by_item = {}
+        self.in_meals = {}
+        self.days = array("i")
+        self.ordered = True
+        self.index(events)
+
+    def index(self, events):
+        for event in events:
+            position = len(self.events)
+            day = event_day(event)
+            if self.days and day < self.days[-1]:
+                self.ordered = False
+            self.events.append(event)
+            self.days.append(day)
+            self.by_item.setdefault((event["kind"], event.get("item_id")), []).append(position)
+            for food_id in meal_foods(event):
+                self.in_meals.setdefault(food_id, []).append(position)
+
+    def last_day(self):
+        # Day ordinal of the newest event, or None for an empty log. Reads
+        # only the end of the log when it is not loaded.
+        if self.events is None:
+            if self.db:
+                event = self.db.last_event()
+                return event_day(event) if event else None
+            event = self.tail_event()
+            if event is not None:
+                return event_day(event)
+            self.load()
+        return self.days[-1] if self.days else None
+
+    def tail_event(self):
+        # The last readable event in the final TAIL_BYTES of events.jsonl;
+        # None when there is none there (or no file).
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            start = max(0, f.tell() - TAIL_BYTES)
+            f.seek(start)
+            lines = f.read().split(b"\n")
+        if start:
+            # The first line is the end of one that started earlier.
+            lines = lines[1:]
+        for line in reversed(lines):
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if is_structured(event):
+                return event
+        return None
+
+    def extend(self, events):
+        events = [event for event in events if is_structured(event)]
+        if not events:
+            return
+        if self.db:
+            keys = self.db.append_events(events)
+            if self.events is not None:
+                self.keys.extend(keys)
+        else:
+            data = "".join(dumps(event) + "\n" for event in events)
+            with open(self.path, "a") as f:
+                f.write(data)
+            stats.add_bytes(os.path.basename(self.path), len(data))
+        if self.events is not None:
+            self.index(events)
+
+    def update(self, changes):
+        # Store corrected events. changes are (position, new event) pairs;
+        # the events are updated in place. Only the changed events are
+        # written.
+        if not changes:
+            return
+        if self.db:
+            self.db.update_events([(self.keys[position], new) for position, new in changes])
+        else:
+            data = "".join(dumps({"position": position, "event": new}) + "\n" for position, new in changes)
+            with open(self.patch_path, "a") as f:
+                f.write(data)
+            stats.add_bytes(os.path.basename(self.patch_path), len(data))
+            self.patches += len(changes)
+        for position, new in changes:
+            event = self.events[position]
+            event.clear()
+            event.update(new)
+        if self.patches > len(self.events) * COMPACT_SHARE:
+            self.compact()
+
+    def compact(self):
+        # Fold the patches into events.jsonl.
+        atomic_write(self.path, "".join(dumps(event) + "\n" for event in self.events))
+        os.remove(self.patch_path)
+        self.patches = 0
+
+    def positions(self, start=None, end=None):
+        if self.events is None:
+            self.load()
+        if not self.ordered:
+            return [p for p, day in enumerate(self.days)
+                    if (start is None or day >= start) and (end is None or day <= end)]
+        lo = 0 if start is None else bisect.bisect_left(self.days, start)
+        hi = len(self.days) if end is None else bisect.bisect_right(self.days, end)
+        return range(lo, hi)
+
+    def select(self, kind=None, item_id=None, start=None, end=None, in_meals=False):
+        # Events for one item (when kind and item_id are given) and/or a
+        # range of day ordinals, oldest first. With in_meals, the events of
+        # a food include the meal events it is part of.
+        if kind is None or item_id is None:
+            positions = self.positions(start, end)
+            return [self.events[p] for p in positions
+                    if kind is None or self.events[p]["kind"] == kind]
+        return [self.events[p] for p in self.item_positions(kind, item_id, start, end, in_meals)]
+
+    def item_positions(self, kind, item_id, start=None, end=None, in_meals=False):
+        if self.events is None:
+            self.load()
+        positions = self.by_item.get((kind, item_id), [])
+        if in_meals and kind == "food" and item_id in self.in_meals:
+            positions = sorted(positions + self.in_meals[item_id])
+        if self.ordered:
+            lo = 0 if start is None else bisect.bisect_left(positions, start, key=self.days.__getitem__)
+            hi = len(positions) if end is None else bisect.bisect_right(positions, end, key=self.days.__getitem__)
+            positions = positions[lo:hi]
+        else:
+            positions = [p for p in positions
+                         if (start is None or self.days[p] >= start) and (end is None or self.days[p] <= end)]
+        return positions
@@ -0,0 +1,207 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import time
+
+from .macros import MACROS
+from .store import JSON_FOLDER, TrackerStore
+
+BATCH_SIZE = 5000
+KJ_PER_KCAL = 4.184
+# Rejected rows kept as examples in the report; the rest are only counted.
+MAX_REJECT_SAMPLES = 20
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.reasons = {}
+        self.samples = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if len(self.samples) < MAX_REJECT_SAMPLES:
+            self.samples.append((line, reason))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def report(self):
+        rate = self.read / self.elapsed if self.elapsed else 0.0
+        lines = [f"Read {self.read} rows in {self.elapsed:.2f}s ({rate:,.0f} rows/s)",
+                 f"Imported {self.imported}, skipped {self.duplicates} duplicates, rejected {self.rejected}"]
+        for reason, count in sorted(self.reasons.items(), key=lambda r: -r[1]):
+            lines.append(f"  {count} x {reason}")
+        for line, reason in self.samples:
+            lines.append(f"  row {line}: {reason}")
+        return "\n".join(lines)
+
+
+# ----- Readers -----
+def read_csv(path, delimiter=None):
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        if delimiter is None:
+            # The sniffer gives up on single-column or irregular files;
+            # those are read as comma-separated.
+            try:
+                delimiter = csv.Sniffer().sniff(f.read(64 * 1024), delimiters=",;\t|").delimiter
+            except csv.Error:
+                delimiter = ","
+            f.seek(0)
+        yield from csv.DictReader(f, delimiter=delimiter)
+
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+
+
+def read_rows(path, fmt=None, delimiter=None):
+    fmt = fmt or ("jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson") else "csv")
+    if fmt == "jsonl":
+        return read_jsonl(path)
+    return read_csv(path, delimiter)
+
+
+# ----- Pipeline -----
+def parse_number(value):
+    if value is None or value == "":
+        return 0.0
+    try:
+        number = float(value)
+    except TypeError:
+        raise ValueError(value)
+    # float() also accepts "nan" and "inf", which are not amounts.
+    if not math.isfinite(number):
+        raise ValueError(value)
+    return number
+
+
+def map_rows(rows, mapping, stats, per_unit=False, energy_kj=False):
+    # Turn source rows into catalog items. mapping maps catalog fields
+    # (name, calories, protein, carbs, fats and optionally per_unit) to
+    # source column names; unmapped fields use the same name.
+    for line, row in enumerate(rows, start=1):
+        stats.read += 1
+        if not isinstance(row, dict):
+            stats.reject(line, "unreadable row")
+            continue
+        name = str(row.get(mapping.get("name", "name")) or "").strip()
+        if not name:
+            stats.reject(line, "missing name")
+            continue
+        try:
+            values = {macro: parse_number(row.get(mapping.get(macro, macro))) for macro in MACROS}
+        except ValueError:
+            stats.reject(line, "bad number")
+            continue
+        if any(value < 0 for value in values.values()):
+            stats.reject(line, "negative value")
+            continue
+        if energy_kj:
+            values["calories"] = round(values["calories"] / KJ_PER_KCAL, 1)
+        item = {"name": name, **values}
+        if "per_unit" in mapping:
+            flag = str(row.get(mapping["per_unit"], "")).strip().lower()
+            item["per_unit"] = flag in ("1", "true", "yes", "unit", "y")
+        elif per_unit:
+            item["per_unit"] = True
+        yield item
+
+
+def dedupe(items, existing_names, stats):
+    # Drop items whose name (case-insensitive) is already in the catalog or
+    # earlier in the input. Only the names are kept in memory.
+    seen = {name.lower() for name in existing_names if name}
+    for item in items:
+        key = item["name"].lower()
+        if key in seen:
+            stats.duplicates += 1
+            continue
+        seen.add(key)
+        yield item
+
+
+def batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_items(store, rows, mapping, kind="foods", batch_size=BATCH_SIZE,
+                 per_unit=False, energy_kj=False, progress=None):
+    # Stream rows through mapping and de-duplication and add them to the
+    # store one batch at a time; nothing but the current batch and the set
+    # of known names is held in memory. SQLite inserts each batch as it
+    # goes; a JSON catalog is one file, so it is written once at the end.
+    catalog = store.foods if kind == "foods" else store.drinks
+    stats = ImportStats()
+    items = map_rows(rows, mapping, stats, per_unit, energy_kj)
+    items = dedupe(items, (item.get("name") for item in catalog), stats)
+    for batch in batches(items, batch_size):
+        store.add_catalog_items(kind, batch, save=bool(store.db))
+        stats.imported += len(batch)
+        if progress:
+            progress(stats)
+    if stats.imported and not store.db:
+        store.save(kind)
+    stats.finish()
+    return stats
+
+
+def parse_mapping(pairs):
+    mapping = {}
+    for pair in pairs or []:
+        field, sep, column = pair.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Expected field=column, got {pair!r}")
+        mapping[field.strip()] = column.strip()
+    return mapping
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import foods or drinks from a CSV or JSONL nutrient database.")
+    parser.add_argument("path")
+    parser.add_argument("--folder", default=JSON_FOLDER)
+    parser.add_argument("--backend", default=os.environ.get("MACRO_TRACKER_BACKEND", "json"))
+    parser.add_argument("--kind", choices=("foods", "drinks"), default="foods")
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--delimiter")
+    parser.add_argument("--map", nargs="*", metavar="FIELD=COLUMN",
+                        help="e.g. name=Description calories=Energy protein=Protein")
+    parser.add_argument("--per-unit", action="store_true", help="values are per unit instead of per 100g")
+    parser.add_argument("--energy-kj", action="store_true", help="the calories column is in kJ")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    store = TrackerStore(args.folder, args.backend)
+    try:
+        rows = read_rows(args.path, args.format, args.delimiter)
+        stats = import_items(store, rows, parse_mapping(args.map), args.kind, args.batch_size,
+                             args.per_unit, args.energy_kj,
+                             progress=lambda s: print(f"... {s.imported} imported, {s.read} read", flush=True))
+    finally:
+        store.close()
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import atexit
+import bisect
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+# Set to "1" for the default dump file, or to the path to dump to.
+STATS_ENV = "MACRO_TRACKER_STATS"
+DEFAULT_DUMP = "tracker_stats.json"
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is
+# everything slower.
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+# TrackerStore methods timed when instrumentation is on.
+STORE_PREFIXES = ("load", "save", "write_json", "append_daily_entry", "record_", "update_",
+                  "add_", "search_")
+PROFILE_LINES = 40
+
+
+class Stats:
+    # Call counts, latency histograms and bytes written, keyed by name.
+    # Recording is a no-op until enable() is called, and methods are only
+    # wrapped with timers by instrument(), so a normal session pays nothing.
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.bytes = {}
+        self.started = time.time()
+        self.profiler = None
+        self.dump_path = None
+
+    def record(self, name, seconds):
+        ms = seconds * 1000
+        with self.lock:
+            entry = self.calls.get(name)
+            if entry is None:
+                entry = self.calls[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                            "histogram": [0] * (len(BUCKETS_MS) + 1)}
+            entry["count"] += 1
+            entry["total_ms"] += ms
+            entry["max_ms"] = max(entry["max_ms"], ms)
+            entry["histogram"][bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def add_bytes(self, target, count):
+        if not self.enabled:
+            return
+        with self.lock:
+            entry = self.bytes.setdefault(target, {"writes": 0, "bytes": 0})
+            entry["writes"] += 1
+            entry["bytes"] += count
+
+    def snapshot(self):
+        with self.lock:
+            calls = {name: dict(entry, histogram=list(entry["histogram"]),
+                                mean_ms=entry["total_ms"] / entry["count"])
+                     for name, entry in self.calls.items()}
+            return {"started": self.started, "elapsed_s": time.time() - self.started,
+                    "buckets_ms": list(BUCKETS_MS), "calls": calls,
+                    "bytes": {target: dict(entry) for target, entry in self.bytes.items()}}
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=4)
+
+    # ----- cProfile -----
+    def start_profile(self):
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profile(self, path=None):
+        # Stop the capture and return the top functions by cumulative time;
+        # with path, the raw profile is also saved for pstats/snakeviz.
+        if self.profiler is None:
+            return ""
+        profiler, self.profiler = self.profiler, None
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        return out.getvalue()
+
+
+stats = Stats()
+
+
+def timed(name, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats.record(name, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument(cls, prefixes):
+    # Wrap the methods of cls whose names start with one of prefixes.
+    # Must run before instances bind those methods as callbacks.
+    for name, value in list(vars(cls).items()):
+        if callable(value) and name.startswith(tuple(prefixes)):
+            setattr(cls, name, timed(f"{cls.__name__}.{name}", value))
+
+
+def dump_path_from_env():
+    value = os.environ.get(STATS_ENV, "").strip()
+    if not value or value == "0":
+        return None
+    return DEFAULT_DUMP if value == "1" else value
+
+
+def enable(dump_path=None):
+    # Start recording; the stats are written to dump_path at exit.
+    stats.enabled = True
+    stats.dump_path = dump_path
+    if dump_path:
+        atexit.register(stats.dump, dump_path)
@@ -0,0 +1,76 @@
+import json
+import os
+from datetime import datetime
+
+from .instrument import stats
+from .writer import atomic_write, dumps, read_jsonl
+
+# Number of journal entries replayed on top of the snapshot before it is
+# folded back into daily.json.
+COMPACT_EVERY = 200
+
+
+def empty_daily_data(date=None):
+    return {"date": date or datetime.now().strftime("%m/%d/%Y"),
+            "totals": {"calories": 0, "protein": 0, "carbs": 0, "fats": 0},
+            "events": []}
+
+
+def apply_entry(data, entry):
+    op = entry.get("op")
+    if op == "consume":
+        for macro, value in entry.get("macros", {}).items():
+            data["totals"][macro] = data["totals"].get(macro, 0) + value
+    elif op == "event":
+        data["events"].append(entry["event"])
+
+
+class DailyJournal:
+    # Append-only log for daily.json: every consumption or event is a single
+    # line appended to the journal, and the snapshot is only rewritten on
+    # compaction. Each entry carries a sequence number and the snapshot stores
+    # the last one it contains, so a crash between writing the snapshot and
+    # truncating the journal never replays an entry twice.
+    def __init__(self, snapshot_path, journal_path=None, compact_every=COMPACT_EVERY):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or os.path.splitext(snapshot_path)[0] + ".journal"
+        self.compact_every = compact_every
+        self.data = None
+        self.seq = 0
+        self.pending = 0
+
+    def load(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                data = json.load(f)
+            data.setdefault("events", [])
+        else:
+            data = empty_daily_data()
+        self.seq = data.pop("seq", 0)
+        self.pending = 0
+        if os.path.exists(self.journal_path):
+            for entry in read_jsonl(self.journal_path):
+                if not isinstance(entry, dict) or entry.get("seq", 0) <= self.seq:
+                    continue
+                apply_entry(data, entry)
+                self.seq = entry["seq"]
+                self.pending += 1
+        self.data = data
+        return data
+
+    def append(self, entry):
+        self.seq += 1
+        entry = dict(entry, seq=self.seq)
+        line = dumps(entry) + "\n"
+        with open(self.journal_path, "a") as f:
+            f.write(line)
+        stats.add_bytes(os.path.basename(self.journal_path), len(line))
+        self.pending += 1
+        if self.pending >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        snapshot = dict(self.data, seq=self.seq)
+        atomic_write(self.snapshot_path, dumps(snapshot))
+        open(self.journal_path, "w").close()
+        self.pending = 0
@@ -0,0 +1,370 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+from urllib.request import urlopen
+
+from .importer import parse_mapping, parse_number, read_rows
+from .macros import MACROS
+from .search import SearchIndex
+from .store import JSON_FOLDER, TrackerStore
+
+CACHE_FILE = "lookup_cache.db"
+CACHE_CAPACITY = 10_000
+# Found products are kept for a week; "not found" answers for a day, so a
+# product added to the source later shows up reasonably soon.
+CACHE_TTL = 7 * 24 * 3600
+MISS_TTL = 24 * 3600
+BATCH_SIZE = 50
+SEARCH_LIMIT = 10
+HTTP_TIMEOUT = 10
+HOST = "127.0.0.1"
+PORT = 8766
+BARCODE_RE = re.compile(r"^\d{6,14}$")
+
+
+def normalize_barcode(code):
+    return re.sub(r"[\s-]", "", str(code))
+
+
+def is_barcode(text):
+    return bool(BARCODE_RE.match(normalize_barcode(text)))
+
+
+def product(row, mapping=None):
+    # A source record as a catalog food (macros per 100g, or per unit with
+    # per_unit set) plus its barcode; None when it has no name.
+    mapping = mapping or {}
+    name = str(row.get(mapping.get("name", "name")) or "").strip()
+    if not name:
+        return None
+    try:
+        item = {"name": name, **{macro: parse_number(row.get(mapping.get(macro, macro))) for macro in MACROS}}
+    except ValueError:
+        return None
+    barcode = row.get(mapping.get("barcode", "barcode"))
+    if barcode:
+        item["barcode"] = normalize_barcode(barcode)
+    if row.get(mapping.get("per_unit", "per_unit")) in (True, "1", "true", "yes"):
+        item["per_unit"] = True
+    return item
+
+
+# ----- Providers -----
+# A provider answers barcode lookups in batches and name searches:
+#   lookup_barcodes(barcodes) -> {barcode: product or None}
+#   search(name, limit) -> [product, ...]
+# Products are dicts as returned by product().
+class FileProvider:
+    # Products from a JSON list, JSONL or CSV file (see importer), for use
+    # offline or behind serve().
+    def __init__(self, path, mapping=None):
+        if path.lower().endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        else:
+            rows = read_rows(path)
+        self.products = [p for p in (product(row, mapping) for row in rows if isinstance(row, dict)) if p]
+        self.by_barcode = {p["barcode"]: p for p in self.products if "barcode" in p}
+        self.index = SearchIndex()
+        self.index.build((i, p["name"]) for i, p in enumerate(self.products))
+
+    def lookup_barcodes(self, barcodes):
+        return {code: self.by_barcode.get(code) for code in barcodes}
+
+    def search(self, name, limit=SEARCH_LIMIT):
+        return [self.products[i] for i in self.index.search(name, limit)]
+
+
+class HTTPProvider:
+    # A JSON source over HTTP with the routes serve() provides:
+    #   GET /products?barcodes=a,b,c -> {"products": {barcode: product or null}}
+    #   GET /search?q=...&limit=N   -> {"products": [product, ...]}
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def get(self, path):
+        with urlopen(f"{self.url}{path}", timeout=self.timeout) as response:
+            return json.load(response)["products"]
+
+    def lookup_barcodes(self, barcodes):
+        return self.get(f"/products?barcodes={quote(','.join(barcodes))}")
+
+    def search(self, name, limit=SEARCH_LIMIT):
+        return self.get(f"/search?q={quote(name)}&limit={limit}")
+
+
+def make_provider(source):
+    # An http(s):// URL or a product file.
+    if source.startswith(("http://", "https://")):
+        return HTTPProvider(source)
+    return FileProvider(source)
+
+
+# ----- Cache -----
+class LookupCache:
+    # Answers by key in SQLite, evicting the least recently used beyond
+    # capacity. Entries past their expiry count as misses. Calls may come
+    # from several threads.
+    def __init__(self, path, capacity=CACHE_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                          "expires REAL NOT NULL, used REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+        self.evictions = 0
+
+    def get_many(self, keys, now=None):
+        # {key: value} for the keys cached and not expired.
+        now = now or time.time()
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, value FROM entries WHERE expires > ? AND key IN ({','.join('?' * len(chunk))})",
+                    [now, *chunk]).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+            if found:
+                with self.conn:
+                    self.conn.executemany("UPDATE entries SET used = ? WHERE key = ?",
+                                          [(now, key) for key in found])
+        return found
+
+    def put_many(self, values, ttl, now=None):
+        now = now or time.time()
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO entries (key, value, expires, used) VALUES (?, ?, ?, ?)",
+                                  [(key, json.dumps(value), now + ttl, now) for key, value in values.items()])
+            excess = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.capacity
+            if excess > 0:
+                self.conn.execute("DELETE FROM entries WHERE key IN "
+                                  "(SELECT key FROM entries ORDER BY used LIMIT ?)", (excess,))
+                self.evictions += excess
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM entries")
+
+    def close(self):
+        self.conn.close()
+
+
+# ----- Lookups -----
+class FoodLookup:
+    # Cached, batched and coalesced lookups against a provider. Barcodes
+    # missing from the cache are fetched batch_size at a time; a key that
+    # another thread is already fetching is waited for rather than
+    # requested again.
+    def __init__(self, provider, cache, batch_size=BATCH_SIZE):
+        self.provider = provider
+        self.cache = cache
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.counts = {"requests": 0, "hits": 0, "misses": 0, "coalesced": 0,
+                       "provider_calls": 0, "provider_items": 0, "provider_seconds": 0.0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def metrics(self):
+        with self.lock:
+            metrics = dict(self.counts)
+        looked_up = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = metrics["hits"] / looked_up if looked_up else None
+        metrics["evictions"] = self.cache.evictions
+        return metrics
+
+    def resolve(self, keys, fetch):
+        # Values for keys from the cache, from fetches already in flight,
+        # or from fetch(missing keys) -> {key: value}, called in batches.
+        keys = list(dict.fromkeys(keys))
+        self.count("requests", len(keys))
+        results = self.cache.get_many(keys)
+        self.count("hits", len(results))
+        missing = [key for key in keys if key not in results]
+        self.count("misses", len(missing))
+        waiting, owned = {}, {}
+        with self.lock:
+            for key in missing:
+                future = self.inflight.get(key)
+                if future is None:
+                    future = self.inflight[key] = Future()
+                    owned[key] = future
+                else:
+                    waiting[key] = future
+        self.count("coalesced", len(waiting))
+        owned_keys = list(owned)
+        try:
+            for start in range(0, len(owned_keys), self.batch_size):
+                batch = owned_keys[start:start + self.batch_size]
+                started = time.perf_counter()
+                fetched = fetch(batch)
+                self.count("provider_calls")
+                self.count("provider_items", len(batch))
+                self.count("provider_seconds", time.perf_counter() - started)
+                values = {key: fetched.get(key) for key in batch}
+                self.cache.put_many({k: v for k, v in values.items() if v is not None}, CACHE_TTL)
+                self.cache.put_many({k: v for k, v in values.items() if v is None}, MISS_TTL)
+                for key, value in values.items():
+                    results[key] = value
+                    with self.lock:
+                        self.inflight.pop(key, None)
+                    owned[key].set_result(value)
+        except Exception as e:
+            with self.lock:
+                for key, future in owned.items():
+                    if not future.done():
+                        self.inflight.pop(key, None)
+                        future.set_exception(e)
+            raise
+        for key, future in waiting.items():
+            results[key] = future.result()
+        return {key: results[key] for key in keys}
+
+    def lookup_barcodes(self, barcodes):
+        # {barcode: product or None}, for any number of barcodes.
+        codes = [normalize_barcode(code) for code in barcodes]
+        found = self.resolve([f"barcode:{code}" for code in codes],
+                             lambda keys: {f"barcode:{code}": value for code, value in
+                                           self.provider.lookup_barcodes([k.split(":", 1)[1] for k in keys]).items()})
+        return {code: found[f"barcode:{code}"] for code in codes}
+
+    def lookup_barcode(self, barcode):
+        return self.lookup_barcodes([barcode])[normalize_barcode(barcode)]
+
+    def search(self, name, limit=SEARCH_LIMIT):
+        key = f"search:{limit}:{' '.join(name.lower().split())}"
+        return self.resolve([key], lambda keys: {key: self.provider.search(name, limit)})[key]
+
+    def find(self, text, limit=SEARCH_LIMIT):
+        # A barcode or a name, as typed into the Foods tab.
+        if is_barcode(text):
+            found = self.lookup_barcode(text)
+            return [found] if found else []
+        return self.search(text, limit)
+
+    def close(self):
+        self.cache.close()
+
+
+def open_lookup(source, folder=JSON_FOLDER, capacity=CACHE_CAPACITY):
+    return FoodLookup(make_provider(source), LookupCache(os.path.join(folder, CACHE_FILE), capacity))
+
+
+def add_foods(store, products):
+    # Add looked-up products to the catalog, skipping those whose barcode
+    # or name (case-insensitive) is already there. Returns the added foods.
+    barcodes = {food["barcode"] for food in store.foods if food.get("barcode")}
+    names = {str(food.get("name", "")).lower() for food in store.foods}
+    added = []
+    for item in products:
+        if not item or item.get("barcode") in barcodes or item["name"].lower() in names:
+            continue
+        food = {key: item[key] for key in ("name", *MACROS, "barcode", "per_unit") if key in item}
+        added.append(food)
+        names.add(food["name"].lower())
+        if food.get("barcode"):
+            barcodes.add(food["barcode"])
+    if added:
+        store.add_catalog_items("foods", added)
+    return added
+
+
+# ----- Local stand-in server -----
+def make_handler(provider):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if url.path == "/products":
+                codes = [normalize_barcode(c) for c in query.get("barcodes", "").split(",") if c]
+                self.reply(200, {"products": provider.lookup_barcodes(codes)})
+            elif url.path == "/search":
+                self.reply(200, {"products": provider.search(query.get("q", ""), int(query.get("limit", SEARCH_LIMIT)))})
+            else:
+                self.reply(404, {"error": "Not found."})
+
+        def reply(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(path, host=HOST, port=PORT, mapping=None):
+    # Serve a product file over HTTP, standing in for an online source.
+    server = ThreadingHTTPServer((host, port), make_handler(FileProvider(path, mapping)))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up foods by name or barcode, or serve a product file.")
+    parser.add_argument("--folder", default=JSON_FOLDER)
+    parser.add_argument("--backend", default=os.environ.get("MACRO_TRACKER_BACKEND", "json"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    find = sub.add_parser("find", help="look up barcodes or a name")
+    find.add_argument("source", help="product file or http:// URL of a product server")
+    find.add_argument("query", nargs="+", help="barcodes, or words of a name")
+    find.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+    find.add_argument("--add", action="store_true", help="add the results to the food catalog")
+    server = sub.add_parser("serve", help="serve a product file over HTTP")
+    server.add_argument("path")
+    server.add_argument("--host", default=HOST)
+    server.add_argument("--port", type=int, default=PORT)
+    server.add_argument("--map", nargs="*", metavar="FIELD=COLUMN")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        httpd = serve(args.path, args.host, args.port, parse_mapping(args.map))
+        print(f"Serving {args.path} on http://{args.host}:{httpd.server_address[1]}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    lookup = open_lookup(args.source, args.folder)
+    try:
+        if all(is_barcode(q) for q in args.query):
+            products = [p for p in lookup.lookup_barcodes(args.query).values() if p]
+        else:
+            products = lookup.search(" ".join(args.query), args.limit)
+        for p in products:
+            print(f"{p.get('barcode', '-'):>14}  {p['name']}: {p['calories']} kcal, {p['protein']}g protein, "
+                  f"{p['carbs']}g carbs, {p['fats']}g fats")
+        if args.add:
+            store = TrackerStore(args.folder, args.backend)
+            added = add_foods(store, products)
+            store.close()
+            print(f"Added {len(added)} foods to the catalog.")
+        metrics = lookup.metrics()
+        rate = f"{metrics['hit_rate']:.0%}" if metrics["hit_rate"] is not None else "-"
+        print(f"Cache hit rate {rate} ({metrics['hits']} hits, {metrics['misses']} misses, "
+              f"{metrics['provider_calls']} provider calls)")
+    finally:
+        lookup.close()
+
+
+if __name__ == "__main__":
+    main()
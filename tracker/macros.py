@@ -0,0 +1,30 @@
+MACROS = ("calories", "protein", "carbs", "fats")
+
+
+def empty_totals():
+    return {macro: 0 for macro in MACROS}
+
+
+def scale(item, factor):
+    return {macro: item.get(macro, 0) * factor for macro in MACROS}
+
+
+def drink_consumption(drink, servings=1):
+    return scale(drink, servings)
+
+
+def macro_vector(food):
+    # Macros per gram, or per unit for per-unit foods, so a consumption is
+    # just the vector scaled by the amount.
+    unit = 1.0 if food.get("per_unit", False) else 0.01
+    return tuple(food.get(macro, 0) * unit for macro in MACROS)
+
+
+def scale_vector(vector, amount):
+    return {macro: value * amount for macro, value in zip(MACROS, vector)}
+
+
+def add_totals(totals, consumption):
+    for macro in totals:
+        totals[macro] += consumption.get(macro, 0)
+    return totals
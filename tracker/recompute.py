@@ -0,0 +1,290 @@
+import argparse
+import bisect
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import aggregates
+from .events import UNITS, is_structured, meal_foods, meal_portion
+from .macros import MACROS, macro_vector
+from .store import JSON_FOLDER, TrackerStore
+
+# Fewer affected events than this are recomputed in this process; starting
+# worker processes would cost more than it saves.
+PARALLEL_MIN_EVENTS = 20_000
+CHUNK_EVENTS = 5_000
+PREVIEW_LINES = 20
+
+
+# ----- Recomputing events -----
+# An affected event's corrected macros are base + vector * quantity, with
+# vector the corrected macros per gram (or unit) and quantity the grams of
+# the food eaten: for a food logged on its own base is zero; for a saved
+# meal it is the macros logged less the food's share recorded in the meal.
+def recompute_chunk(job):
+    # job is (vectors, rows) with rows of (date, old macros, base, quantity,
+    # vector index). Returns the new macros per row and the change per date.
+    vectors, rows = job
+    new_macros, deltas = [], {}
+    for date, old, base, quantity, v in rows:
+        new = [b + x * quantity for b, x in zip(base, vectors[v])]
+        delta = deltas.setdefault(date, [0.0] * len(MACROS))
+        for i, (after, before) in enumerate(zip(new, old)):
+            delta[i] += after - before
+        new_macros.append(new)
+    return new_macros, deltas
+
+
+def run_chunks(vectors, rows, workers):
+    chunks = [(vectors, rows[i:i + CHUNK_EVENTS]) for i in range(0, len(rows), CHUNK_EVENTS)]
+    if workers > 1 and len(rows) >= PARALLEL_MIN_EVENTS:
+        with ProcessPoolExecutor(min(workers, len(chunks))) as pool:
+            results = list(pool.map(recompute_chunk, chunks))
+    else:
+        results = [recompute_chunk(chunk) for chunk in chunks]
+    new_macros, deltas = [], {}
+    for chunk_macros, chunk_deltas in results:
+        new_macros.extend(chunk_macros)
+        for date, delta in chunk_deltas.items():
+            total = deltas.setdefault(date, [0.0] * len(MACROS))
+            for i, value in enumerate(delta):
+                total[i] += value
+    return new_macros, deltas
+
+
+def date_key(date):
+    # MM/DD/YYYY as YYYYMMDD, which sorts like the dates without parsing.
+    return date[6:] + date[:2] + date[3:5]
+
+
+def find_day(history, date):
+    # The history record for date. History is appended in date order, so
+    # it is bisected; records out of order fall back to a scan.
+    try:
+        i = bisect.bisect_left(history, date_key(date), key=lambda record: date_key(record["date"]))
+        if i < len(history) and history[i]["date"] == date:
+            return history[i]
+    except (KeyError, TypeError):
+        pass
+    return next((record for record in history if record.get("date") == date), None)
+
+
+def rounded(values):
+    return {macro: round(value, 1) for macro, value in values.items()}
+
+
+class Correction:
+    # The effect of changing a food's macros, worked out without changing
+    # anything: the food before and after, every saved meal using it, and
+    # the totals of every day (past and today) on which it was eaten alone
+    # or in a saved meal. Call apply() to commit it.
+    #
+    # Affected days are found through the event log's item index, so the
+    # work grows with the number of times the food (or a meal with it) was
+    # logged, not with the length of the history. Meals are corrected by the
+    # contents recorded when they were logged. Days logged before
+    # consumption events were kept cannot be traced and are left alone, and
+    # so are meals logged before their contents were recorded; the days with
+    # such a meal that uses the food now, or that was since deleted, are
+    # listed as untraceable.
+    def __init__(self, store, food_id, values, workers=None):
+        self.store = store
+        self.food = store.foods_by_id[food_id]
+        self.values = values
+        self.before = {key: value for key, value in self.food.items() if key != "id"}
+        self.after = {**self.before, **values}
+        self.meals = self.affected_meals()
+        self.recompute(workers or os.cpu_count() or 1)
+
+    def vector(self, food, unit):
+        return macro_vector({**food, "per_unit": unit == UNITS["food_unit"]})
+
+    def affected_meals(self):
+        # (meal, grams or units of the food in it, totals before, after).
+        food_id = self.food["id"]
+        old, new = macro_vector(self.before), macro_vector(self.after)
+        meals = []
+        for meal in self.store.saved_meals:
+            quantity = sum(item.get("quantity", 0) for item in meal.get("items", []) if item.get("food_id") == food_id)
+            if not quantity:
+                continue
+            before = self.store.meal_vector(meal)
+            after = tuple(value + (n - o) * quantity for value, o, n in zip(before, old, new))
+            meals.append((meal, quantity, dict(zip(MACROS, before)), dict(zip(MACROS, after))))
+        return meals
+
+    def affected_events(self, events):
+        # Rows for recompute_chunk for the events of this food, alone or in
+        # a saved meal.
+        food_id = self.food["id"]
+        zero = [0.0] * len(MACROS)
+        vectors = [self.vector(self.after, UNITS["food"]), self.vector(self.after, UNITS["food_unit"])]
+        in_meals = 1 if self.after.get("per_unit", False) else 0
+        rows, affected = [], []
+        for event in events:
+            if not is_structured(event):
+                continue
+            if event["kind"] == "food" and event.get("item_id") == food_id:
+                v = 1 if event.get("unit") == UNITS["food_unit"] else 0
+                rows.append((event["date"], event["macros"], zero, event.get("quantity", 0), v))
+            elif food_id in meal_foods(event):
+                portion = meal_portion(event, food_id)
+                base = [total - part for total, part in zip(event["macros"], portion["macros"])]
+                rows.append((event["date"], event["macros"], base, portion["quantity"], in_meals))
+            else:
+                continue
+            affected.append(event)
+        return vectors, rows, affected
+
+    def corrected(self, event, macros):
+        # The event with its new macros, and for a meal the food's recorded
+        # share too.
+        new = {**event, "macros": macros}
+        if event["kind"] == "meal":
+            vector = macro_vector(self.after)
+            new["items"] = [{**item, "macros": [value * item.get("quantity", 0) for value in vector]}
+                            if item.get("food_id") == self.food["id"] else item
+                            for item in event["items"]]
+        return new
+
+    def untraceable_meal(self, kind, item_id):
+        # Whether meal events without recorded contents may hold this food.
+        return kind == "meal" and (item_id in self.meal_ids or item_id not in self.saved_meal_ids)
+
+    def recompute(self, workers):
+        store, log = self.store, self.store.event_log
+        positions = log.item_positions("food", self.food["id"], in_meals=True)
+        vectors, rows, logged = self.affected_events([log.events[p] for p in positions])
+        new_macros, deltas = run_chunks(vectors, rows, workers)
+        self.events = [(p, self.corrected(event, macros)) for p, event, macros in zip(positions, logged, new_macros)]
+
+        today = store.daily_data
+        vectors, rows, todays = self.affected_events(today["events"])
+        new_macros, today_deltas = run_chunks(vectors, rows, 1)
+        self.today_events = [(event, self.corrected(event, macros)) for event, macros in zip(todays, new_macros)]
+        delta = today_deltas.get(today["date"], [0.0] * len(MACROS))
+        self.today = (dict(today["totals"]),
+                      {macro: today["totals"][macro] + change for macro, change in zip(MACROS, delta)})
+
+        self.meal_ids = {meal["id"] for meal, _, _, _ in self.meals}
+        self.saved_meal_ids = {meal.get("id") for meal in store.saved_meals}
+        untraceable = {log.events[p]["date"]
+                       for key, found in log.by_item.items() if self.untraceable_meal(*key)
+                       for p in found if "items" not in log.events[p]}
+        untraceable.update(event["date"] for event in today["events"]
+                           if is_structured(event) and "items" not in event
+                           and self.untraceable_meal(event["kind"], event.get("item_id")))
+        self.untraceable = sorted(untraceable, key=date_key)
+
+        # (history record, corrected record) by date; days with no record
+        # (nothing but zero-calorie items logged) are counted but skipped.
+        self.days, self.missing_days = [], []
+        for date in sorted(deltas, key=date_key):
+            if date == today["date"]:
+                continue
+            record = find_day(store.history, date)
+            if record is None:
+                self.missing_days.append(date)
+                continue
+            corrected = dict(record)
+            corrected.update(rounded({macro: record.get(macro, 0) + change
+                                      for macro, change in zip(MACROS, deltas[date])}))
+            if corrected != record:
+                self.days.append((record, corrected))
+
+    def preview(self, lines=PREVIEW_LINES):
+        # A readable diff of what apply() would change.
+        def diff(before, after):
+            changes = [f"{macro} {before.get(macro, 0):g} -> {after.get(macro, 0):g}"
+                       for macro in MACROS if round(before.get(macro, 0), 1) != round(after.get(macro, 0), 1)]
+            return ", ".join(changes) or "unchanged"
+
+        def section(title, entries):
+            out = [f"{title} ({len(entries)}):"]
+            out += [f"  {entry}" for entry in entries[:lines]]
+            if len(entries) > lines:
+                out.append(f"  ... and {len(entries) - lines} more")
+            return out
+
+        out = [f"Food '{self.food.get('name')}': {diff(self.before, self.after)}"]
+        extra = [key for key in self.values if key not in MACROS and self.before.get(key) != self.values[key]]
+        if extra:
+            out.append("  also changes " + ", ".join(f"{key} {self.before.get(key)!r} -> {self.values[key]!r}"
+                                                     for key in extra))
+        out += section("Saved meals", [f"{meal.get('name')}: {diff(rounded(before), rounded(after))}"
+                                       for meal, _, before, after in self.meals])
+        out += section("Days", [f"{before['date']}: {diff(before, after)}" for before, after in self.days])
+        if self.today_events:
+            out.append(f"Today ({self.store.daily_data['date']}): "
+                       f"{diff(rounded(self.today[0]), rounded(self.today[1]))}")
+        out.append(f"{len(self.events) + len(self.today_events)} logged entries recomputed.")
+        if self.missing_days:
+            out.append(f"{len(self.missing_days)} days have no history record and are left as they are.")
+        if self.untraceable:
+            out += section("Untraceable days (meals logged before their contents were recorded, "
+                           "left as they are)", self.untraceable)
+        return "\n".join(out)
+
+    def apply(self):
+        store = self.store
+        store.update_food(self.food["id"], self.values)
+        store.event_log.update(self.events)
+        if self.today_events:
+            for event, new in self.today_events:
+                event.update(new)
+            store.daily_data["totals"].update(self.today[1])
+            store.save_daily_data(events=True)
+        if self.days:
+            state = store.long_term_aggregates()
+            intact = True
+            for record, corrected in self.days:
+                intact = aggregates.replace_day(state, record, corrected) and intact
+                record.update(corrected)
+            if not intact:
+                store.rebuild_aggregates()
+            store.series_cache.pop("history", None)
+            store.save("history", changed=[record for record, _ in self.days])
+            store.save("aggregates")
+        return self
+
+
+def find_food(store, text):
+    try:
+        food = store.foods_by_id.get(int(text))
+    except ValueError:
+        food = store.foods_by_name.get(text)
+    if food is None:
+        raise ValueError(f"Food '{text}' not found.")
+    return food
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Correct a food's macros and recompute the days and meals using it.")
+    parser.add_argument("food", help="food id or exact name")
+    for macro in MACROS:
+        parser.add_argument(f"--{macro}", type=float)
+    parser.add_argument("--yes", action="store_true", help="apply without asking")
+    parser.add_argument("--workers", type=int, help="worker processes for large histories (default: CPU count)")
+    parser.add_argument("--folder", default=JSON_FOLDER)
+    parser.add_argument("--backend", default=os.environ.get("MACRO_TRACKER_BACKEND", "json"))
+    args = parser.parse_args(argv)
+
+    values = {macro: getattr(args, macro) for macro in MACROS if getattr(args, macro) is not None}
+    if not values:
+        parser.error("nothing to correct; give at least one of --calories, --protein, --carbs, --fats")
+    store = TrackerStore(args.folder, args.backend)
+    try:
+        try:
+            food = find_food(store, args.food)
+        except ValueError as e:
+            parser.error(str(e))
+        correction = Correction(store, food["id"], values, args.workers)
+        print(correction.preview())
+        if args.yes or input("Apply? [y/N] ").strip().lower() in ("y", "yes"):
+            correction.apply()
+            print("Applied.")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+
+from .analytics import Analytics
+from .macros import MACROS
+from .timeseries import MEASUREMENT_FIELDS, day_ordinal
+from .writer import atomic_write, dumps
+
+# Files that make a folder a client's data folder, and the ones a report
+# reads (their mtimes and sizes decide whether a cached summary is reused).
+REPORT_FILES = ("history.json", "profile_history.json", "measurements.json")
+DB_FILES = ("tracker.db", "tracker.db-wal")
+CACHE_FILE = "report_cache.json"
+CACHE_VERSION = 1
+REPORT_DAYS = 7
+# Share of the calorie goal a day may miss by and still count as on target,
+# and the adherence under which a client is flagged.
+TOLERANCE = 0.1
+OFF_TRACK = 0.5
+
+
+# ----- Finding clients -----
+def find_clients(root):
+    # Every folder under root holding tracker data, by path relative to
+    # root. A folder called "json" is named after its parent, so both
+    # root/alice and root/alice/json come out as "alice".
+    clients = {}
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        if any(name in files for name in REPORT_FILES + DB_FILES[:1]):
+            name = os.path.relpath(folder, root)
+            if os.path.basename(name) == "json":
+                name = os.path.dirname(name) or os.path.basename(os.path.abspath(root))
+            clients.setdefault(name, folder)
+            dirs[:] = []
+    return clients
+
+
+def signature(folder, backend="json"):
+    files = DB_FILES if backend == "sqlite" and os.path.exists(os.path.join(folder, DB_FILES[0])) else REPORT_FILES
+    result = []
+    for name in files:
+        try:
+            info = os.stat(os.path.join(folder, name))
+        except FileNotFoundError:
+            continue
+        result.append([name, info.st_mtime_ns, info.st_size])
+    return result
+
+
+def read_client(folder, backend="json"):
+    db_path = os.path.join(folder, DB_FILES[0])
+    if backend == "sqlite" and os.path.exists(db_path):
+        from .sqlite_store import SQLiteStorage
+        db = SQLiteStorage(db_path)
+        try:
+            return {name: db.load_collection(name) for name in ("history", "profile_history", "measurements")}
+        finally:
+            db.close()
+    data = {}
+    for name in ("history", "profile_history", "measurements"):
+        path = os.path.join(folder, f"{name}.json")
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data[name] = json.load(f)
+        else:
+            data[name] = []
+    return data
+
+
+# ----- One client -----
+def mean(values):
+    values = values[~np.isnan(values)]
+    return float(values.mean()) if len(values) else None
+
+
+def change(series, field, start, end):
+    # Last value up to end minus the last value before start.
+    values = series.columns[field]
+    valid = ~np.isnan(values)
+    days = series.days[valid]
+    values = values[valid]
+    hi = np.searchsorted(days, end, "right")
+    if not hi:
+        return None, None
+    latest = float(values[hi - 1])
+    lo = np.searchsorted(days, start, "left")
+    return latest, (latest - float(values[lo - 1]) if lo else None)
+
+
+def summarize_client(folder, end, days=REPORT_DAYS, tolerance=TOLERANCE, backend="json"):
+    # Adherence and trends for the days window ending at day ordinal end,
+    # compared with the window before it. Runs in a worker process, so it
+    # only takes and returns plain data.
+    data = read_client(folder, backend)
+    analytics = Analytics(data["history"], data["profile_history"], data["measurements"])
+    history = analytics.history
+    start = end - days + 1
+    lo, hi = history.window(start, end)
+    prev_lo, _ = history.window(start - days, start - 1)
+    hits = analytics.adherence_mask("calories", tolerance)
+    summary = {
+        "logged_days": int(hi - lo),
+        "adherence": float(hits[lo:hi].sum()) / days,
+        "previous_adherence": float(hits[prev_lo:lo].sum()) / days,
+        "last_logged": date.fromordinal(int(history.days[-1])).strftime("%m/%d/%Y") if len(history) else None,
+        "macros": {macro: {"mean": mean(history.columns[macro][lo:hi]),
+                           "goal": mean(history.columns[f"{macro}_goal"][lo:hi])}
+                   for macro in MACROS},
+    }
+    weight, weight_change = change(analytics.profile, "weight", start, end)
+    summary["weight"] = weight
+    summary["weight_change"] = weight_change
+    summary["bodyfat"], summary["bodyfat_change"] = change(analytics.profile, "bodyfat", start, end)
+    summary["measurements"] = {}
+    for field in MEASUREMENT_FIELDS:
+        latest, delta = change(analytics.measurements, field, start, end)
+        summary["measurements"][field] = {"latest": latest, "change": delta}
+    return summary
+
+
+def run_client(args):
+    folder, end, days, tolerance, backend = args
+    # Any failure reading one client (a damaged database, a malformed
+    # record) marks that client unreadable instead of ending the report.
+    try:
+        return summarize_client(folder, end, days, tolerance, backend)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+# ----- All clients -----
+def load_cache(path):
+    try:
+        with open(path, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache.get("clients", {}) if cache.get("version") == CACHE_VERSION else {}
+
+
+def build_report(root, end=None, days=REPORT_DAYS, tolerance=TOLERANCE, workers=None,
+                 cache_path=None, backend="json"):
+    # One summary per client folder under root, plus totals across them.
+    # Clients whose files are unchanged since the cached summary (and with
+    # the same window) are not read at all; the rest are summarized in a
+    # process pool.
+    end = end or date.today().toordinal()
+    params = [end, days, tolerance, backend]
+    clients = find_clients(root)
+    cache = load_cache(cache_path) if cache_path else {}
+    summaries, stale = {}, []
+    for name, folder in clients.items():
+        sig = signature(folder, backend)
+        entry = cache.get(name)
+        if entry and entry["signature"] == sig and entry["params"] == params:
+            summaries[name] = entry["summary"]
+        else:
+            stale.append((name, folder, sig))
+
+    jobs = [(folder, end, days, tolerance, backend) for _, folder, _ in stale]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+            results = list(pool.map(run_client, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        results = [run_client(job) for job in jobs]
+    for (name, _, sig), summary in zip(stale, results):
+        summaries[name] = summary
+        if "error" not in summary:
+            cache[name] = {"signature": sig, "params": params, "summary": summary}
+        else:
+            cache.pop(name, None)
+
+    if cache_path:
+        cache = {name: entry for name, entry in cache.items() if name in clients}
+        atomic_write(cache_path, dumps({"version": CACHE_VERSION, "clients": cache}))
+
+    ok = {name: s for name, s in summaries.items() if "error" not in s}
+    rates = [s["adherence"] for s in ok.values() if s["logged_days"]]
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "start": date.fromordinal(end - days + 1).strftime("%m/%d/%Y"),
+        "end": date.fromordinal(end).strftime("%m/%d/%Y"),
+        "days": days,
+        "clients": {name: summaries[name] for name in sorted(summaries)},
+        "totals": {
+            "clients": len(summaries),
+            "active": len(rates),
+            "mean_adherence": sum(rates) / len(rates) if rates else None,
+            "off_track": sorted(name for name, s in ok.items() if s["logged_days"] and s["adherence"] < OFF_TRACK),
+            "inactive": sorted(name for name, s in ok.items() if not s["logged_days"]),
+            "errors": sorted(name for name, s in summaries.items() if "error" in s),
+        },
+        "cache": {"reused": len(summaries) - len(stale), "computed": len(stale)},
+    }
+
+
+# ----- Output -----
+def fmt(value, pattern="{:.1f}", signed=False):
+    if value is None:
+        return "-"
+    return ("{:+.1f}" if signed else pattern).format(value)
+
+
+def format_report(report):
+    lines = [f"Report {report['start']} - {report['end']} ({report['days']} days)", ""]
+    header = f"{'Client':24} {'Days':>4} {'On target':>9} {'vs prev':>8} {'Avg kcal':>9} {'Goal':>7} " \
+             f"{'Protein':>8} {'Weight':>7} {'Change':>7} {'Waist':>6} {'Last logged':>11}"
+    lines.append(header)
+    lines.append("-" * len(header))
+    for name, s in report["clients"].items():
+        if "error" in s:
+            lines.append(f"{name:24} error: {s['error']}")
+            continue
+        calories = s["macros"]["calories"]
+        lines.append(f"{name[:24]:24} {s['logged_days']:>4} {s['adherence']:>9.0%} "
+                     f"{(s['adherence'] - s['previous_adherence']) * 100:>+7.0f}% "
+                     f"{fmt(calories['mean'], '{:.0f}'):>9} {fmt(calories['goal'], '{:.0f}'):>7} "
+                     f"{fmt(s['macros']['protein']['mean'], '{:.0f}'):>8} {fmt(s['weight']):>7} "
+                     f"{fmt(s['weight_change'], signed=True):>7} "
+                     f"{fmt(s['measurements']['waist']['change'], signed=True):>6} {s['last_logged'] or '-':>11}")
+    totals = report["totals"]
+    lines.append("")
+    mean_adherence = f"{totals['mean_adherence']:.0%}" if totals["mean_adherence"] is not None else "-"
+    lines.append(f"{totals['clients']} clients, {totals['active']} active, mean adherence {mean_adherence}")
+    for key, label in (("off_track", "Off track"), ("inactive", "No logs"), ("errors", "Unreadable")):
+        if totals[key]:
+            lines.append(f"{label}: {', '.join(totals[key])}")
+    lines.append(f"({report['cache']['computed']} summarized, {report['cache']['reused']} unchanged)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Adherence and trend report across client data folders.")
+    parser.add_argument("root", help="folder holding one data folder per client")
+    parser.add_argument("--days", type=int, default=REPORT_DAYS, help="report window ending at --end")
+    parser.add_argument("--end", help="last day of the window, MM/DD/YYYY (default today)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--backend", default=os.environ.get("MACRO_TRACKER_BACKEND", "json"))
+    parser.add_argument("--cache", help=f"summary cache file (default ROOT/{CACHE_FILE})")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--json", help="also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+    end = day_ordinal(args.end) if args.end else None
+    cache_path = None if args.no_cache else (args.cache or os.path.join(args.root, CACHE_FILE))
+    report = build_report(args.root, end, args.days, args.tolerance, args.workers, cache_path, args.backend)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import bisect
+import heapq
+import itertools
+import operator
+import re
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    # Word index over catalog names. Items are tokenized into words once; the
+    # sorted vocabulary answers prefix lookups with bisect and a trigram ->
+    # word map answers typo-tolerant lookups, so a query only touches the
+    # postings of the words it matches instead of scanning every name.
+    def __init__(self):
+        self.names = {}
+        self.order = {}
+        self.tiebreak = {}
+        self.leading = {}
+        self.postings = {}
+        self.vocab = []
+        self.word_grams = {}
+        self.gram_words = {}
+        self.next_order = 0
+
+    def build(self, entries):
+        self.__init__()
+        for key, name in entries:
+            self.add(key, name)
+
+    def add(self, key, name):
+        if key in self.names:
+            self.remove(key)
+        name = name.lower()
+        self.names[key] = name
+        self.order[key] = self.next_order
+        # Shorter names first, then catalog order, packed into one int so
+        # ranking compares ints rather than tuples.
+        self.tiebreak[key] = len(name) << 40 | self.next_order
+        self.next_order += 1
+        words = tokenize(name)
+        if words:
+            self.leading.setdefault(words[0], set()).add(key)
+        for word in set(words):
+            keys = self.postings.get(word)
+            if keys is None:
+                keys = self.postings[word] = set()
+                bisect.insort(self.vocab, word)
+                grams = trigrams(word)
+                self.word_grams[word] = len(grams)
+                for gram in grams:
+                    self.gram_words.setdefault(gram, set()).add(word)
+            keys.add(key)
+
+    def update(self, key, name):
+        self.add(key, name)
+
+    # The index as plain containers, for saving it in a snapshot instead of
+    # rebuilding it from the names on every start.
+    STATE = ("names", "order", "tiebreak", "leading", "postings", "vocab",
+             "word_grams", "gram_words", "next_order")
+
+    def state(self):
+        return tuple(getattr(self, attr) for attr in self.STATE)
+
+    def restore(self, state):
+        for attr, value in zip(self.STATE, state):
+            setattr(self, attr, value)
+
+    def remove(self, key):
+        name = self.names.pop(key, None)
+        if name is None:
+            return
+        del self.order[key]
+        del self.tiebreak[key]
+        words = tokenize(name)
+        if words:
+            leading = self.leading[words[0]]
+            leading.discard(key)
+            if not leading:
+                del self.leading[words[0]]
+        for word in set(words):
+            keys = self.postings[word]
+            keys.discard(key)
+            if not keys:
+                del self.postings[word]
+                del self.vocab[bisect.bisect_left(self.vocab, word)]
+                del self.word_grams[word]
+                for gram in trigrams(word):
+                    gram_words = self.gram_words[gram]
+                    gram_words.discard(word)
+                    if not gram_words:
+                        del self.gram_words[gram]
+
+    def match_words(self, token):
+        # Vocabulary words matching one query token, scored 1.0 for an exact
+        # word, just under that for a prefix, and lower for typo matches.
+        scores = {}
+        i = bisect.bisect_left(self.vocab, token)
+        while i < len(self.vocab) and self.vocab[i].startswith(token):
+            word = self.vocab[i]
+            scores[word] = 1.0 if word == token else 0.7 + 0.2 * len(token) / len(word)
+            i += 1
+        if len(token) >= 4:
+            grams = trigrams(token)
+            shared = {}
+            for gram in grams:
+                for word in self.gram_words.get(gram, ()):
+                    shared[word] = shared.get(word, 0) + 1
+            max_edits = 1 if len(token) < 7 else 2
+            min_shared = max(2, len(grams) - 3 * max_edits)
+            for word, count in shared.items():
+                if word in scores or count < min_shared or abs(len(word) - len(token)) > max_edits:
+                    continue
+                edits = edit_distance(token, word)
+                if edits <= max_edits:
+                    scores[word] = 0.6 * (1 - edits / len(word))
+        return scores
+
+    def search(self, query, limit=None):
+        tokens = tokenize(query)
+        if not tokens:
+            # names is kept in insertion order, which is catalog order.
+            keys = iter(self.names)
+            return list(keys if limit is None else itertools.islice(keys, limit))
+        # Single letters match nearly every item; they only narrow a query
+        # that has longer words, or else match the start of the name.
+        if len(tokens[0]) == 1 and all(len(token) == 1 for token in tokens):
+            tokens = tokens[:1]
+            postings = self.leading
+        else:
+            tokens = [token for token in tokens if len(token) > 1]
+            postings = self.postings
+        matches = []
+        for token in dict.fromkeys(tokens):
+            words = self.match_words(token)
+            if not words:
+                return []
+            matches.append((sum(len(postings.get(w, ())) for w in words), token, words))
+        if len(matches) == 1:
+            return self.rank_words(matches[0][2], postings, limit)
+        # Intersect starting from the most selective token so later tokens
+        # only score keys that are still candidates. Words are applied in
+        # ascending score order so each key keeps its best word's score.
+        matches.sort(key=lambda m: m[0])
+        scores = None
+        for _, _, words in matches:
+            token_scores = {}
+            for word, score in sorted(words.items(), key=lambda w: w[1]):
+                keys = postings.get(word, set())
+                if scores is not None:
+                    keys = keys & scores.keys()
+                token_scores.update(dict.fromkeys(keys, score))
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {key: scores[key] + score for key, score in token_scores.items()}
+            if not scores:
+                return []
+        # Names whose first word matches the first query word rank first.
+        if postings is not self.leading:
+            leading = next(words for _, token, words in matches if token == tokens[0])
+            for word in leading:
+                for key in self.leading.get(word, set()) & scores.keys():
+                    scores[key] += 1.0
+        ranked = zip(map(operator.neg, scores.values()),
+                     map(self.tiebreak.__getitem__, scores.keys()),
+                     scores.keys())
+        if limit is not None and len(scores) > 10 * limit:
+            ranked = heapq.nsmallest(limit, ranked)
+        else:
+            ranked = sorted(ranked)[:limit]
+        return [key for _, _, key in ranked]
+
+    def rank_words(self, words, postings, limit):
+        # Ranking for a one-word query. Every key scores its best matching
+        # word's score, so keys are taken a score at a time, best first, and
+        # only sorted within one score; the work stops once limit keys are
+        # placed instead of ranking every candidate, which for one or two
+        # letters is a large part of the catalog.
+        levels = {}
+        for word, score in words.items():
+            levels.setdefault(score, []).append(word)
+        levels = [levels[score] for score in sorted(levels, reverse=True)]
+        if postings is self.leading:
+            passes = [None]
+        else:
+            # Names starting with a matching word rank above all others.
+            leading = set().union(*(self.leading.get(word, ()) for word in words))
+            passes = [True, False]
+        ranked, seen = [], set()
+        for first in passes:
+            for level in levels:
+                keys = set().union(*(postings.get(word, ()) for word in level))
+                keys -= seen
+                if first is True:
+                    keys &= leading
+                elif first is False:
+                    keys -= leading
+                seen |= keys
+                ranked.extend(sorted(keys, key=self.tiebreak.__getitem__))
+                if limit is not None and len(ranked) >= limit:
+                    return ranked[:limit]
+        return ranked
+
+
+def edit_distance(a, b):
+    # Optimal string alignment distance: Levenshtein plus adjacent swaps,
+    # so "chikcen" is one edit away from "chicken".
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[len(b)]
@@ -0,0 +1,382 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from datetime import date
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .events import describe, is_structured
+from .macros import MACROS
+from .store import MEASUREMENT_FIELDS, StorageError, TrackerStore
+from .timeseries import day_ordinal, quarter_range
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Open stores kept in the pool; the least recently used one is closed when
+# another user's store has to be opened.
+MAX_OPEN = 32
+MAX_BODY = 1024 * 1024
+USER_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+log = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class StorePool:
+    # One TrackerStore per user, each in its own folder under root. Calls
+    # for the same user run one at a time on a worker thread; different
+    # users run concurrently.
+    def __init__(self, root, backend="json", max_open=MAX_OPEN):
+        self.root = root
+        self.backend = backend
+        self.max_open = max_open
+        self.stores = OrderedDict()
+        self.locks = {}
+
+    def open(self, user):
+        folder = os.path.join(self.root, user)
+        os.makedirs(folder, exist_ok=True)
+        return TrackerStore(folder, self.backend)
+
+    async def run(self, user, fn):
+        if not USER_PATTERN.match(user):
+            raise HTTPError(404, f"Unknown user: {user}")
+        lock = self.locks.setdefault(user, asyncio.Lock())
+        async with lock:
+            store = self.stores.get(user)
+            if store is None:
+                store = await asyncio.to_thread(self.open, user)
+                self.stores[user] = store
+                await self.evict()
+            self.stores.move_to_end(user)
+            return await asyncio.to_thread(self.call, store, fn)
+
+    @staticmethod
+    def call(store, fn):
+        # A server runs across midnight, so each request starts a new day
+        # first if needed.
+        store.rollover()
+        return fn(store)
+
+    async def evict(self):
+        # Close idle stores beyond max_open, oldest first; stores with a
+        # request in flight are skipped. Closing waits for pending writes,
+        # so it runs on a worker thread, holding the user's lock so a new
+        # request for them does not open the folder before it is done.
+        for user in list(self.stores):
+            if len(self.stores) <= self.max_open:
+                return
+            lock = self.locks[user]
+            if user in self.stores and not lock.locked():
+                async with lock:
+                    await asyncio.to_thread(self.stores.pop(user).close)
+
+    def close(self):
+        # One store failing to flush must not keep the others from closing.
+        for user, store in self.stores.items():
+            try:
+                store.close()
+            except Exception:
+                log.exception("Failed to close the store for %s", user)
+        self.stores.clear()
+
+
+# ----- Handlers -----
+def number(body, key, required=True):
+    value = body.get(key)
+    if value is None or value == "":
+        if required:
+            raise ValueError(f"'{key}' is required.")
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{key}' must be a number.")
+
+
+def item_id(body):
+    value = body["id"]
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError("'id' must be an item id.")
+    return value
+
+
+def find_item(catalog, by_id, body, kind):
+    if "id" in body:
+        item = by_id.get(item_id(body))
+    else:
+        item = next((i for i in catalog if i.get("name") == body.get("name")), None)
+    if item is None:
+        raise HTTPError(404, f"Unknown {kind}.")
+    return item
+
+
+def today(store, query, body):
+    events = store.daily_data["events"]
+    return {"date": store.daily_data["date"], "totals": store.daily_totals, "goals": store.goals,
+            "events": [describe(event) for event in events],
+            "records": [event for event in events if is_structured(event)]}
+
+
+def log_food(store, query, body):
+    food = store.foods_by_id.get(item_id(body)) if "id" in body else store.foods_by_name.get(body.get("name"))
+    if food is None:
+        raise HTTPError(404, "Unknown food.")
+    amount = number(body, "amount")
+    return {"consumed": store.record_food(food, amount), "totals": store.daily_totals}
+
+
+def log_drink(store, query, body):
+    drink = find_item(store.drinks, store.drinks_by_id, body, "drink")
+    return {"consumed": store.record_drink(drink), "totals": store.daily_totals}
+
+
+def log_meal(store, query, body):
+    meal = next((m for m in store.saved_meals if m.get("name") == body.get("name")), None)
+    if meal is None:
+        raise HTTPError(404, "Unknown meal.")
+    return {"consumed": store.record_meal(meal), "totals": store.daily_totals}
+
+
+def search_foods(store, query, body):
+    limit = int(query.get("limit", 50))
+    return {"foods": store.search_foods(query.get("q", ""), limit)}
+
+
+def day_bounds(query):
+    # ?days=N (ending today), ?quarter (this quarter) or ?start=/&end=
+    # MM/DD/YYYY, as day ordinals.
+    try:
+        if "quarter" in query:
+            return quarter_range(date.today().toordinal())
+        if "days" in query:
+            end = date.today().toordinal()
+            return end - int(query["days"]) + 1, end
+        return (day_ordinal(query["start"]) if "start" in query else None,
+                day_ordinal(query["end"]) if "end" in query else None)
+    except ValueError:
+        raise ValueError("Dates must be MM/DD/YYYY and days a whole number.")
+
+
+def dated_range(store, name, query):
+    series = store.series(name)
+    lo, hi = series.range(*day_bounds(query))
+    return {name: series.records(lo, hi)}
+
+
+def history(store, query, body):
+    return dated_range(store, "history", query)
+
+
+def measurements(store, query, body):
+    return dated_range(store, "measurements", query)
+
+
+def record_measurements(store, query, body):
+    values = {key: number(body, key) for key in MEASUREMENT_FIELDS}
+    return store.record_measurements(values)
+
+
+def profile(store, query, body):
+    result = dated_range(store, "profile_history", query)
+    result["settings"] = store.profile_settings
+    return result
+
+
+def record_profile(store, query, body):
+    return store.record_profile_update(number(body, "weight"), number(body, "bodyfat", required=False))
+
+
+def update_settings(store, query, body):
+    store.update_profile_settings(int(number(body, "age")), number(body, "height"))
+    return store.profile_settings
+
+
+def update_goals(store, query, body):
+    goals = {macro: number(body, macro) for macro in store.goals if macro in body}
+    store.update_goals(goals)
+    return store.goals
+
+
+def consumption(store, query, body):
+    try:
+        item_id = int(query["id"])
+    except (KeyError, ValueError):
+        raise ValueError("'id' must be an item id.")
+    return store.item_consumption(query.get("kind", "food"), item_id, *day_bounds(query))
+
+
+def top(store, query, body):
+    macro = query.get("macro", "calories")
+    if macro not in MACROS:
+        raise ValueError(f"'macro' must be one of {', '.join(MACROS)}.")
+    start, end = day_bounds(query)
+    return {"items": store.top_items(macro, query.get("kind"), start, end, int(query.get("limit", 10)))}
+
+
+def suggestions(store, query, body):
+    # ?limit=N, ?familiar=1 to prefer items logged before, ?kind=food|drink|meal
+    # and ?plan=N for a greedy combination of N items instead of a ranking.
+    familiar = query.get("familiar", "0") not in ("0", "false", "")
+    try:
+        limit = int(query.get("limit", 10))
+        plan = int(query["plan"]) if "plan" in query else None
+    except ValueError:
+        raise ValueError("'limit' and 'plan' must be whole numbers.")
+    if plan is not None:
+        return {"suggestions": store.suggested_plan(plan, familiar)}
+    kinds = [query["kind"]] if "kind" in query else None
+    return {"suggestions": store.suggestions(limit, familiar, kinds)}
+
+
+def stats(store, query, body):
+    return store.long_term_stats()
+
+
+ROUTES = {
+    ("GET", "today"): today,
+    ("GET", "stats"): stats,
+    ("GET", "consumption"): consumption,
+    ("GET", "top"): top,
+    ("GET", "suggestions"): suggestions,
+    ("POST", "foods/log"): log_food,
+    ("POST", "drinks/log"): log_drink,
+    ("POST", "meals/log"): log_meal,
+    ("GET", "foods"): search_foods,
+    ("GET", "history"): history,
+    ("GET", "measurements"): measurements,
+    ("POST", "measurements"): record_measurements,
+    ("GET", "profile"): profile,
+    ("POST", "profile"): record_profile,
+    ("POST", "profile/settings"): update_settings,
+    ("POST", "goals"): update_goals,
+}
+
+
+class Server:
+    # Minimal HTTP/1.1 JSON server with keep-alive. Paths look like
+    # /users/<user>/<route>; see ROUTES.
+    def __init__(self, pool):
+        self.pool = pool
+        self.requests = 0
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        if parts == ["health"]:
+            return 200, {"status": "ok", "requests": self.requests, "open_stores": len(self.pool.stores)}
+        if len(parts) < 3 or parts[0] != "users":
+            raise HTTPError(404, "Not found.")
+        route = "/".join(parts[2:])
+        handler = ROUTES.get((method, route))
+        if handler is None:
+            if any(r == route for _, r in ROUTES):
+                raise HTTPError(405, "Method not allowed.")
+            raise HTTPError(404, "Not found.")
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        result = await self.pool.run(parts[1], lambda store: handler(store, query, body))
+        return (201 if method == "POST" else 200), result
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # Where the body ends is unknown, so the connection
+                    # cannot be reused.
+                    status, payload, keep_alive = 400, {"error": "Invalid Content-Length."}, False
+                elif length > MAX_BODY:
+                    status, payload, keep_alive = 413, {"error": "Request body too large."}, False
+                else:
+                    raw = await reader.readexactly(length) if length else b""
+                    status, payload = await self.respond(method, target, raw)
+                data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, raw):
+        self.requests += 1
+        try:
+            body = json.loads(raw) if raw else {}
+            if not isinstance(body, dict):
+                raise ValueError("Request body must be a JSON object.")
+            return await self.dispatch(method, target, body)
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except StorageError as e:
+            return 500, {"error": str(e)}
+        except Exception:
+            # A bug in a handler still gets a reply, and the connection
+            # stays usable.
+            log.exception("Error handling %s %s", method, target)
+            return 500, {"error": "Internal server error."}
+
+
+async def serve(root, host=HOST, port=PORT, backend="json", max_open=MAX_OPEN, ready=None):
+    pool = StorePool(root, backend, max_open)
+    server = Server(pool)
+    listener = await asyncio.start_server(server.handle, host, port)
+    if ready is not None:
+        ready.set_result(listener.sockets[0].getsockname()[1])
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the tracker as a local HTTP/JSON API.")
+    parser.add_argument("root", help="folder holding one data folder per user")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--backend", default=os.environ.get("MACRO_TRACKER_BACKEND", "json"))
+    parser.add_argument("--max-open", type=int, default=MAX_OPEN)
+    args = parser.parse_args(argv)
+    print(f"Serving {args.root} on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(serve(args.root, args.host, args.port, args.backend, args.max_open))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
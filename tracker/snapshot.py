@@ -0,0 +1,111 @@
+import gc
+import marshal
+import os
+import struct
+import sys
+import zlib
+
+from .writer import atomic_write
+
+FILENAME = "snapshot.bin"
+
+# File layout, little-endian: header (magic, version, the Python major and
+# minor version that wrote it, CRC-32 of everything after the header, table
+# of contents length), the table of contents, then one marshal blob per
+# section. The table maps each section name to [offset, length, source],
+# where source is the [mtime_ns, size] of the JSON file the section was
+# taken from; a section is only used while that file is unchanged.
+#
+# marshal is used rather than pickle because it only decodes plain data,
+# so a damaged or tampered snapshot cannot run code. Its format may change
+# between Python versions, which is why those are part of the header.
+# VERSION changes whenever a section's layout does.
+MAGIC = b"MTSN"
+VERSION = 2
+HEADER = struct.Struct("<4sHBBII")
+
+
+def file_signature(path):
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [info.st_mtime_ns, info.st_size]
+
+
+class Snapshot:
+    # A snapshot read into memory with one read. Sections are only decoded
+    # when asked for.
+    def __init__(self, toc=None, body=b""):
+        self.toc = toc or {}
+        self.body = memoryview(body)
+
+    @classmethod
+    def read(cls, path):
+        # An empty snapshot when the file is missing; ValueError when it is
+        # damaged or from another format or Python version.
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return cls()
+        return cls.parse(data)
+
+    @classmethod
+    def parse(cls, data):
+        if len(data) < HEADER.size:
+            raise ValueError("Snapshot is truncated.")
+        magic, version, major, minor, checksum, toc_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a snapshot of this version.")
+        if (major, minor) != sys.version_info[:2]:
+            raise ValueError(f"Snapshot was written by Python {major}.{minor}.")
+        view = memoryview(data)[HEADER.size:]
+        if zlib.crc32(view) != checksum:
+            raise ValueError("Snapshot checksum does not match.")
+        toc = marshal.loads(view[:toc_length])
+        return cls(toc, view[toc_length:])
+
+    def __contains__(self, name):
+        return name in self.toc
+
+    def raw(self, name, source):
+        # The encoded section when it was taken from the file as it is now.
+        entry = self.toc.get(name)
+        if entry is None or entry[2] != source:
+            return None
+        offset, length, _ = entry
+        return self.body[offset:offset + length]
+
+    def get(self, name, source):
+        blob = self.raw(name, source)
+        if blob is None:
+            return None
+        # Decoding creates a great many containers at once; pausing the
+        # cyclic collector avoids passes that would find nothing to free.
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return marshal.loads(blob)
+        finally:
+            if enabled:
+                gc.enable()
+
+
+def encode(value):
+    return marshal.dumps(value)
+
+
+def write(path, sections):
+    # sections maps name -> (source signature, encoded blob).
+    toc, blobs, offset = {}, [], 0
+    for name, (source, blob) in sections.items():
+        toc[name] = [offset, len(blob), source]
+        blobs.append(blob)
+        offset += len(blob)
+    toc_data = marshal.dumps(toc)
+    body = b"".join([toc_data, *blobs])
+    major, minor = sys.version_info[:2]
+    atomic_write(path, HEADER.pack(MAGIC, VERSION, major, minor, zlib.crc32(body), len(toc_data)) + body,
+                 binary=True)
+    return len(body) + HEADER.size
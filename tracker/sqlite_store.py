@@ -0,0 +1,263 @@
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from .instrument import stats
+from .events import EventLog
+from .journal import DailyJournal
+
+# Collections stored one row per record. Catalog rows are keyed by the
+# record's "id", so an edited or removed item is one row write; dated rows
+# are keyed by their position in the collection and carry an ISO "day"
+# column so they sort and range-scan chronologically.
+CATALOG_TABLES = ("foods", "drinks", "meals")
+DATED_TABLES = ("history", "measurements", "profile_history")
+SETTINGS = ("goals", "profile_settings", "aggregates")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS foods (id INTEGER PRIMARY KEY, name TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS drinks (id INTEGER PRIMARY KEY, name TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meals (id INTEGER PRIMARY KEY, name TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY, day TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS measurements (id INTEGER PRIMARY KEY, day TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS profile_history (id INTEGER PRIMARY KEY, day TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS daily_events (id INTEGER PRIMARY KEY, day TEXT, event TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, day TEXT, kind TEXT, item_id INTEGER, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS foods_name ON foods (name);
+CREATE INDEX IF NOT EXISTS drinks_name ON drinks (name);
+CREATE INDEX IF NOT EXISTS history_day ON history (day);
+CREATE INDEX IF NOT EXISTS measurements_day ON measurements (day);
+CREATE INDEX IF NOT EXISTS profile_history_day ON profile_history (day);
+CREATE INDEX IF NOT EXISTS daily_events_day ON daily_events (day);
+CREATE INDEX IF NOT EXISTS events_item ON events (kind, item_id);
+CREATE INDEX IF NOT EXISTS events_day ON events (day);
+"""
+# Databases from before rows were keyed by record id or position have
+# user_version 0; their tables are rekeyed once on open.
+SCHEMA_VERSION = 1
+
+
+def iso_day(date_str):
+    try:
+        return datetime.strptime(date_str, "%m/%d/%Y").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return date_str
+
+
+def encode(record):
+    return json.dumps(record, separators=(",", ":"))
+
+
+def encode_event(event):
+    # Daily events are structured dicts, or plain strings on older days.
+    return event if isinstance(event, str) else encode(event)
+
+
+def decode_event(text):
+    if text.startswith("{"):
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    return text
+
+
+class SQLiteStorage:
+    def __init__(self, path):
+        self.path = path
+        # Callers serialize access (the API server runs each user's store
+        # calls one at a time on worker threads).
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Row counts per collection, so saving an in-memory list only
+        # inserts the records appended since the last load or save.
+        self.counts = {}
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            # One transaction, so an interrupted upgrade leaves the old rows.
+            with self.conn:
+                for name in CATALOG_TABLES + DATED_TABLES:
+                    self.write_collection(name, self.load_collection(name))
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self.conn.close()
+
+    # ----- Collections -----
+    def load_collection(self, name):
+        rows = self.conn.execute(f"SELECT data FROM {name} ORDER BY id").fetchall()
+        self.counts[name] = len(rows)
+        return [json.loads(data) for (data,) in rows]
+
+    def row_values(self, name, key, record):
+        if name in DATED_TABLES:
+            return (key, iso_day(record.get("date")), encode(record))
+        return (record.get("id"), record.get("name"), encode(record))
+
+    def insert(self, name, records, start=0):
+        # Write records as rows; start is the position of the first record,
+        # which keys the rows of dated tables.
+        self.write_rows(name, [self.row_values(name, start + i + 1, r) for i, r in enumerate(records)])
+
+    def write_rows(self, name, rows):
+        # Runs in the caller's transaction; callers commit with "with
+        # self.conn:" around this and any deletes that go with it.
+        column = "day" if name in DATED_TABLES else "name"
+        self.conn.executemany(f"INSERT OR REPLACE INTO {name} (id, {column}, data) VALUES (?, ?, ?)", rows)
+        stats.add_bytes(f"sqlite:{name}", sum(len(row[2]) for row in rows))
+        self.counts.pop(name, None)
+
+    def save_collection(self, name, records):
+        if name not in self.counts:
+            self.counts[name] = self.conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+        count = self.counts[name]
+        if len(records) >= count:
+            if len(records) > count:
+                with self.conn:
+                    self.insert(name, records[count:], count)
+                self.counts[name] = len(records)
+            return
+        self.replace_collection(name, records)
+
+    def replace_collection(self, name, records):
+        # The old rows are deleted in the same transaction, so a failed
+        # write leaves them in place rather than an empty table.
+        with self.conn:
+            self.write_collection(name, records)
+
+    def write_collection(self, name, records):
+        self.conn.execute(f"DELETE FROM {name}")
+        self.insert(name, records)
+        self.counts[name] = len(records)
+
+    def update_records(self, name, changed, removed=()):
+        # Catalog records edited in place or added, and removed ones, written
+        # and deleted by id.
+        with self.conn:
+            self.write_rows(name, [self.row_values(name, None, r) for r in changed])
+            self.conn.executemany(f"DELETE FROM {name} WHERE id = ?", [(r.get("id"),) for r in removed])
+
+    def update_positions(self, name, records, positions):
+        # The dated records at the given positions in records are written;
+        # rows past the end of records are dropped.
+        with self.conn:
+            self.write_rows(name, [self.row_values(name, i + 1, records[i]) for i in positions])
+            self.conn.execute(f"DELETE FROM {name} WHERE id > ?", (len(records),))
+
+    # ----- Settings -----
+    def load_setting(self, key, default):
+        row = self.conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def save_setting(self, key, value):
+        data = encode(value)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                              (key, data))
+        stats.add_bytes(f"sqlite:{key}", len(data))
+
+    # ----- Daily Data -----
+    def load_daily(self):
+        daily = self.load_setting("daily", None)
+        if daily is None:
+            return None
+        rows = self.conn.execute("SELECT event FROM daily_events WHERE day = ? ORDER BY id",
+                                 (iso_day(daily["date"]),)).fetchall()
+        daily["events"] = [decode_event(event) for (event,) in rows]
+        return daily
+
+    def save_daily(self, daily):
+        self.save_setting("daily", {"date": daily["date"], "totals": daily["totals"]})
+
+    def replace_daily_events(self, daily):
+        day = iso_day(daily["date"])
+        with self.conn:
+            self.conn.execute("DELETE FROM daily_events WHERE day = ?", (day,))
+            self.conn.executemany("INSERT INTO daily_events (day, event) VALUES (?, ?)",
+                                  [(day, encode_event(event)) for event in daily.get("events", [])])
+
+    def append_daily_entry(self, daily, entry):
+        if entry.get("op") == "event":
+            event = encode_event(entry["event"])
+            with self.conn:
+                self.conn.execute("INSERT INTO daily_events (day, event) VALUES (?, ?)",
+                                  (iso_day(daily["date"]), event))
+            stats.add_bytes("sqlite:daily_events", len(event))
+        else:
+            self.save_daily(daily)
+
+    # ----- Event Log -----
+    def load_events(self):
+        # Row ids and events, oldest first.
+        rows = self.conn.execute("SELECT id, data FROM events ORDER BY id").fetchall()
+        return [row_id for row_id, _ in rows], [json.loads(data) for _, data in rows]
+
+    def last_event(self):
+        row = self.conn.execute("SELECT data FROM events ORDER BY id DESC LIMIT 1").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def append_events(self, events):
+        # Returns the new rows' ids.
+        with self.conn:
+            return self.insert_events(events)
+
+    def replace_events(self, events):
+        with self.conn:
+            self.conn.execute("DELETE FROM events")
+            self.insert_events(events)
+
+    def insert_events(self, events):
+        # Each insert takes the largest id plus one, and this connection is
+        # the only writer, so the new ids run on from the largest id before
+        # the insert.
+        rows = [(iso_day(e.get("date")), e.get("kind"), e.get("item_id"), encode(e)) for e in events]
+        last = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        self.conn.executemany("INSERT INTO events (day, kind, item_id, data) VALUES (?, ?, ?, ?)", rows)
+        stats.add_bytes("sqlite:events", sum(len(row[3]) for row in rows))
+        return list(range(last + 1, last + 1 + len(rows)))
+
+    def update_events(self, changes):
+        # changes are (row id, event) pairs.
+        rows = [(encode(event), row_id) for row_id, event in changes]
+        with self.conn:
+            self.conn.executemany("UPDATE events SET data = ? WHERE id = ?", rows)
+        stats.add_bytes("sqlite:events", sum(len(row[0]) for row in rows))
+
+
+def migrate_from_json(json_folder, db_path):
+    storage = SQLiteStorage(db_path)
+    try:
+        for name in CATALOG_TABLES + DATED_TABLES:
+            filename = os.path.join(json_folder, f"{name}.json")
+            if os.path.exists(filename):
+                with open(filename, "r") as f:
+                    storage.replace_collection(name, json.load(f))
+        for key in SETTINGS:
+            filename = os.path.join(json_folder, f"{key}.json")
+            if os.path.exists(filename):
+                with open(filename, "r") as f:
+                    storage.save_setting(key, json.load(f))
+        filename = os.path.join(json_folder, "daily.json")
+        if os.path.exists(filename):
+            # Replay any journal entries that were not yet compacted.
+            daily = DailyJournal(filename).load()
+            storage.save_daily(daily)
+            storage.replace_daily_events(daily)
+        filename = os.path.join(json_folder, "events.jsonl")
+        if os.path.exists(filename):
+            # Loaded through EventLog so pending corrections are included.
+            log = EventLog(filename)
+            log.load()
+            storage.replace_events(log.events)
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else "json"
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.join(folder, "tracker.db")
+    migrate_from_json(folder, target)
+    print(f"Migrated {folder} into {target}")
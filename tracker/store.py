@@ -0,0 +1,663 @@
+import json
+import os
+from datetime import datetime
+
+from . import aggregates, snapshot
+from .catalog import assign_ids, build_index, build_name_index, normalize_meals, resolve_items
+from .events import EventLog, is_structured, make_event, meal_foods, meal_portion, summarize, top_items
+from .journal import DailyJournal, empty_daily_data
+from .macros import MACROS, add_totals, drink_consumption, empty_totals, macro_vector, scale_vector
+from .search import SearchIndex
+from .sqlite_store import DATED_TABLES, SETTINGS, SQLiteStorage, migrate_from_json
+from .timeseries import MEASUREMENT_FIELDS, SERIES_FIELDS, TimeSeries, day_ordinal
+from .writer import BackgroundWriter, atomic_write, dumps
+
+JSON_FOLDER = "json"
+DEFAULT_GOALS = {"calories": 2000, "protein": 150, "carbs": 250, "fats": 70}
+
+# Persisted collections: file name (without .json) -> store attribute.
+COLLECTIONS = {
+    "foods": "foods",
+    "drinks": "drinks",
+    "history": "history",
+    "profile_history": "profile_history",
+    "profile_settings": "profile_settings",
+    "goals": "goals",
+    "meals": "saved_meals",
+    "measurements": "measurements",
+    "aggregates": "aggregates",
+}
+# Attributes filled in by load_catalog: the catalogs, saved meals and the
+# indexes built over them.
+CATALOG_ATTRS = ("foods", "drinks", "saved_meals", "foods_by_id", "foods_by_name",
+                 "drinks_by_id", "foods_index", "drinks_index", "food_vectors")
+LAZY_COLLECTIONS = {attr: name for name, attr in COLLECTIONS.items() if attr not in CATALOG_ATTRS}
+
+
+class StorageError(Exception):
+    pass
+
+
+def today_str():
+    return datetime.now().strftime("%m/%d/%Y")
+
+
+def default_for(name):
+    if name == "goals":
+        return dict(DEFAULT_GOALS)
+    if name in ("profile_settings", "aggregates"):
+        return {}
+    return []
+
+
+class TrackerStore:
+    # All tracker data and the operations on it, without any GUI. Storage
+    # problems are passed to on_error(message) when given (the GUI shows
+    # them in a message box and carries on with defaults); otherwise they
+    # raise StorageError.
+    #
+    # Collections are read from disk the first time they are used, so
+    # opening a store only costs the daily data (and goals on rollover).
+    #
+    # With background=True, JSON collections are written by a worker thread
+    # (see writer.BackgroundWriter); call poll_errors() now and then and
+    # close() before exiting.
+    #
+    # With snapshot=True, JSON collections and the catalog indexes are read
+    # from snapshot.bin when it is up to date with the JSON files, and the
+    # snapshot is rewritten by close() when anything changed.
+    def __init__(self, folder=JSON_FOLDER, backend="json", journal=True, on_error=None, background=False,
+                 snapshot=True):
+        self.folder = folder
+        self.journal = journal
+        self.on_error = on_error
+        self.use_snapshot = snapshot
+        self.snapshot = None
+        # Whether close() should rewrite the snapshot: something was saved
+        # or had to be read from JSON. Not after a storage error, when the
+        # files may not match memory.
+        self.snapshot_stale = False
+        self.storage_failed = False
+        self.db = None
+        self.writer = None
+        self.series_cache = {}
+        # Saved meal totals by id(meal), and the meals using each food id.
+        self.meal_cache = {}
+        self.meals_by_food = {}
+        # Bumped on every catalog change (see catalog_changed), so derived
+        # data (the suggestion matrix) knows when to update.
+        self.catalog_version = 0
+        self.suggester = None
+        if backend == "sqlite":
+            db_path = self.path("tracker.db")
+            try:
+                if not os.path.exists(db_path):
+                    migrate_from_json(folder, db_path)
+                self.db = SQLiteStorage(db_path)
+            except Exception as e:
+                self.report_error(f"Failed to open {db_path}, using JSON files instead: {e}", e)
+
+        if background and not self.db:
+            self.writer = BackgroundWriter(self.write_json)
+
+        self.event_log = EventLog(self.path("events.jsonl"), self.db)
+        self.daily_journal = DailyJournal(self.path("daily.json"))
+        self.daily_data = self.load_daily_data()
+        self.rollover()
+
+    def __getattr__(self, attr):
+        # Only called for attributes that are not set yet.
+        if attr in CATALOG_ATTRS:
+            self.load_catalog()
+        elif attr in LAZY_COLLECTIONS:
+            setattr(self, attr, self.load(LAZY_COLLECTIONS[attr]))
+        else:
+            raise AttributeError(attr)
+        return self.__dict__[attr]
+
+    def is_loaded(self, name):
+        return COLLECTIONS[name] in self.__dict__
+
+    def path(self, filename):
+        return os.path.join(self.folder, filename)
+
+    def report_error(self, message, exc=None):
+        self.storage_failed = True
+        if self.on_error is None:
+            raise StorageError(message) from exc
+        self.on_error(message)
+
+    @property
+    def daily_totals(self):
+        return self.daily_data["totals"]
+
+    # ----- Persistence -----
+    def load(self, name):
+        default = default_for(name)
+        if self.db:
+            try:
+                if name in SETTINGS:
+                    return self.db.load_setting(name, default)
+                return self.db.load_collection(name)
+            except Exception as e:
+                self.report_error(f"Failed to load {name} from {self.db.path}: {e}", e)
+                return default
+        data = self.from_snapshot(name, name)
+        if data is not None:
+            return data
+        filename = self.path(f"{name}.json")
+        if not os.path.exists(filename):
+            return default
+        try:
+            with open(filename, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            self.report_error(f"Failed to load {filename}: {e}", e)
+            return default
+
+    def save(self, name, rewrite=False, changed=None, removed=()):
+        # With SQLite, settings are a single-row upsert and collections only
+        # insert the records appended since they were loaded unless rewrite
+        # is set. Records edited in place (or added) can be passed as
+        # changed, and catalog records taken out as removed, so only their
+        # rows are written. JSON files are always rewritten whole, on the
+        # writer thread when there is one.
+        if self.db:
+            data = getattr(self, COLLECTIONS[name])
+            try:
+                if name in SETTINGS:
+                    self.db.save_setting(name, data)
+                elif changed is not None and name in DATED_TABLES:
+                    changed = {id(record) for record in changed}
+                    positions = [i for i, record in enumerate(data) if id(record) in changed]
+                    self.db.update_positions(name, data, positions)
+                elif changed is not None:
+                    self.db.update_records(name, changed, removed)
+                elif rewrite:
+                    self.db.replace_collection(name, data)
+                else:
+                    self.db.save_collection(name, data)
+            except Exception as e:
+                self.report_error(f"Failed to save {name} to {self.db.path}: {e}", e)
+            return
+        if self.writer:
+            self.writer.mark(name)
+            self.snapshot_stale = True
+            return
+        self.snapshot_stale = True
+        try:
+            self.write_json(name)
+        except Exception as e:
+            self.report_error(f"Failed to save {self.path(name + '.json')}: {e}", e)
+
+    def write_json(self, name):
+        # Compact dumps use the C encoder, which holds the GIL for the whole
+        # call, so the writer thread sees a consistent copy of the data.
+        atomic_write(self.path(f"{name}.json"), dumps(getattr(self, COLLECTIONS[name])))
+
+    def poll_errors(self):
+        # Report errors from background writes on the calling thread.
+        if self.writer:
+            for name, e in self.writer.pop_errors():
+                self.report_error(f"Failed to save {self.path(name + '.json')}: {e}", e)
+
+    def flush(self):
+        if self.writer:
+            self.writer.flush()
+            self.poll_errors()
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.poll_errors()
+        if self.db:
+            self.db.close()
+        elif self.use_snapshot and self.snapshot_stale and not self.storage_failed:
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                self.report_error(f"Failed to save {self.path(snapshot.FILENAME)}: {e}", e)
+
+    # ----- Snapshot -----
+    def read_snapshot(self):
+        # Read whole on first use; a missing or unusable snapshot just means
+        # everything comes from JSON.
+        if self.snapshot is None:
+            try:
+                self.snapshot = snapshot.Snapshot.read(self.path(snapshot.FILENAME))
+            except (OSError, ValueError):
+                self.snapshot = snapshot.Snapshot()
+        return self.snapshot
+
+    def from_snapshot(self, section, source):
+        # A section of the snapshot, if it was taken from source.json as the
+        # file is now.
+        if self.db or not self.use_snapshot:
+            return None
+        value = self.read_snapshot().get(section, snapshot.file_signature(self.path(f"{source}.json")))
+        if value is None:
+            self.snapshot_stale = True
+        return value
+
+    def write_snapshot(self):
+        # Loaded collections are encoded from memory, which matches the JSON
+        # files once pending writes are flushed; sections of collections
+        # that were never loaded are copied over while still current.
+        self.flush()
+        previous = self.read_snapshot()
+        sections = {}
+        for name, attr in COLLECTIONS.items():
+            source = snapshot.file_signature(self.path(f"{name}.json"))
+            if attr in self.__dict__:
+                sections[name] = (source, snapshot.encode(getattr(self, attr)))
+            else:
+                blob = previous.raw(name, source)
+                if blob is not None:
+                    sections[name] = (source, blob)
+        if "foods_index" in self.__dict__:
+            foods = snapshot.file_signature(self.path("foods.json"))
+            drinks = snapshot.file_signature(self.path("drinks.json"))
+            sections["foods_index"] = (foods, snapshot.encode(self.foods_index.state()))
+            sections["drinks_index"] = (drinks, snapshot.encode(self.drinks_index.state()))
+            sections["food_vectors"] = (foods, snapshot.encode(self.food_vectors))
+        size = snapshot.write(self.path(snapshot.FILENAME), sections)
+        self.snapshot = None
+        self.snapshot_stale = False
+        return size
+
+    def load_daily_data(self):
+        try:
+            if self.db:
+                return self.db.load_daily() or empty_daily_data()
+            if self.journal:
+                return self.daily_journal.load()
+            filename = self.path("daily.json")
+            if not os.path.exists(filename):
+                return empty_daily_data()
+            with open(filename, "r") as f:
+                data = json.load(f)
+            data.setdefault("events", [])
+            return data
+        except Exception as e:
+            self.report_error(f"Failed to load daily data: {e}", e)
+            self.daily_journal.data = empty_daily_data()
+            return self.daily_journal.data
+
+    def save_daily_data(self, events=False):
+        # With SQLite, today's events are kept as rows appended one by one;
+        # events=True replaces them after they were changed in place.
+        try:
+            if self.db:
+                self.db.save_daily(self.daily_data)
+                if events:
+                    self.db.replace_daily_events(self.daily_data)
+            elif self.journal:
+                self.daily_journal.compact()
+            else:
+                atomic_write(self.path("daily.json"), dumps(self.daily_data))
+        except Exception as e:
+            self.report_error(f"Failed to save daily data: {e}", e)
+
+    def append_daily_entry(self, entry):
+        # One journal line or one database row per entry; without the
+        # journal the whole daily file is rewritten.
+        if not self.db and not self.journal:
+            self.save_daily_data()
+            return
+        try:
+            if self.db:
+                self.db.append_daily_entry(self.daily_data, entry)
+            else:
+                self.daily_journal.append(entry)
+        except Exception as e:
+            self.report_error(f"Failed to save daily data: {e}", e)
+
+    # ----- Catalog -----
+    def load_catalog(self):
+        self.foods = self.load("foods")
+        self.drinks = self.load("drinks")
+        self.saved_meals = self.load("meals")
+        self.normalize_catalog()
+        self.foods_index = SearchIndex()
+        state = self.from_snapshot("foods_index", "foods")
+        if state is not None:
+            self.foods_index.restore(state)
+        else:
+            self.foods_index.build((food["id"], food.get("name", "")) for food in self.foods)
+        self.drinks_index = SearchIndex()
+        state = self.from_snapshot("drinks_index", "drinks")
+        if state is not None:
+            self.drinks_index.restore(state)
+        else:
+            self.drinks_index.build((drink["id"], drink.get("name", "")) for drink in self.drinks)
+
+    def normalize_catalog(self):
+        # Catalog items get stable ids; saved meals reference foods by id.
+        foods_changed = assign_ids(self.foods)
+        if assign_ids(self.drinks):
+            self.save("drinks", rewrite=True)
+        meals_changed = normalize_meals(self.saved_meals, self.foods)
+        meals_changed = assign_ids(self.saved_meals) or meals_changed
+        if foods_changed or meals_changed:
+            self.save("foods", rewrite=True)
+        if meals_changed:
+            self.save("meals", rewrite=True)
+        self.foods_by_id = build_index(self.foods)
+        self.foods_by_name = build_name_index(self.foods)
+        self.drinks_by_id = build_index(self.drinks)
+        self.food_vectors = (not foods_changed and self.from_snapshot("food_vectors", "foods")) or \
+            {food["id"]: macro_vector(food) for food in self.foods}
+        self.meal_cache.clear()
+        self.meals_by_food.clear()
+        self.catalog_changed()
+
+    def catalog_changed(self, kind=None, items=()):
+        # Bump the catalog version and pass the changed foods, drinks or
+        # meals on to the suggestion matrix; no kind means the whole catalog
+        # was reloaded.
+        self.catalog_version += 1
+        if self.suggester is not None:
+            self.suggester.changed(kind, items)
+
+    def search_foods(self, query, limit=None):
+        return [self.foods_by_id[key] for key in self.foods_index.search(query, limit)]
+
+    def search_drinks(self, query, limit=None):
+        return [self.drinks_by_id[key] for key in self.drinks_index.search(query, limit)]
+
+    def add_catalog_items(self, kind, items, save=True):
+        # Append new foods or drinks, giving them ids and adding them to the
+        # id, name and search indexes before saving the catalog.
+        if kind == "foods":
+            catalog, by_id, index = self.foods, self.foods_by_id, self.foods_index
+        else:
+            catalog, by_id, index = self.drinks, self.drinks_by_id, self.drinks_index
+        catalog.extend(items)
+        assign_ids(catalog)
+        for item in items:
+            by_id[item["id"]] = item
+            index.add(item["id"], item.get("name", ""))
+            if kind == "foods":
+                self.foods_by_name.setdefault(item.get("name"), item)
+                self.food_vectors[item["id"]] = macro_vector(item)
+        self.catalog_changed("food" if kind == "foods" else "drink", items)
+        if save:
+            self.save(kind)
+        return items
+
+    def meal_items(self, meal):
+        return resolve_items(meal, self.foods_by_id)
+
+    def update_food(self, food_id, values, save=True):
+        # Change a catalog food in place, refreshing its macro vector and
+        # dropping the cached totals of the meals that use it.
+        food = self.foods_by_id[food_id]
+        old_name = food.get("name")
+        food.update(values)
+        self.food_vectors[food_id] = macro_vector(food)
+        for key in self.meals_by_food.pop(food_id, ()):
+            self.meal_cache.pop(key, None)
+        if food.get("name") != old_name:
+            self.foods_index.update(food_id, food.get("name", ""))
+            self.foods_by_name = build_name_index(self.foods)
+        self.catalog_changed("food", [food])
+        if save:
+            self.save("foods", changed=[food])
+        return food
+
+    def update_drink(self, drink_id, values, save=True):
+        drink = self.drinks_by_id[drink_id]
+        old_name = drink.get("name")
+        drink.update(values)
+        if drink.get("name") != old_name:
+            self.drinks_index.update(drink_id, drink.get("name", ""))
+        self.catalog_changed("drink", [drink])
+        if save:
+            self.save("drinks", changed=[drink])
+        return drink
+
+    def meal_refs(self, items):
+        # items are (food name, quantity) pairs.
+        if not items:
+            raise ValueError("Please add at least one food to the meal.")
+        meal_items = []
+        for food_name, qty in items:
+            food = self.foods_by_name.get(food_name)
+            if not food:
+                raise ValueError(f"Food '{food_name}' not found.")
+            meal_items.append({"food_id": food["id"], "quantity": qty})
+        return meal_items
+
+    def add_meal(self, name, items, save=True):
+        if not name:
+            raise ValueError("Please enter a meal name.")
+        meal = {"name": name, "items": self.meal_refs(items)}
+        self.saved_meals.append(meal)
+        assign_ids(self.saved_meals)
+        self.catalog_changed("meal", [meal])
+        if save:
+            self.save("meals")
+        return meal
+
+    def update_meal(self, meal, name=None, items=None, save=True):
+        if name is not None:
+            if not name:
+                raise ValueError("Please enter a meal name.")
+            meal["name"] = name
+        if items is not None:
+            meal["items"] = self.meal_refs(items)
+            self.meal_cache.pop(id(meal), None)
+        self.catalog_changed("meal", [meal])
+        if save:
+            self.save("meals", changed=[meal])
+        return meal
+
+    def remove_meal(self, meal, save=True):
+        self.saved_meals.remove(meal)
+        self.meal_cache.pop(id(meal), None)
+        self.catalog_changed("meal", [meal])
+        if save:
+            self.save("meals", changed=[], removed=[meal])
+
+    def meal_vector(self, meal):
+        # Total macros of a saved meal, computed once and cached until the
+        # meal or one of its foods changes.
+        cached = self.meal_cache.get(id(meal))
+        if cached is not None and cached[0] is meal:
+            return cached[1]
+        total = [0.0] * len(MACROS)
+        for item in meal.get("items", []):
+            vector = self.food_vectors.get(item.get("food_id"))
+            if vector is None:
+                raise ValueError(f"Meal '{meal['name']}' uses a food that is no longer in the catalog.")
+            qty = item.get("quantity", 0)
+            for i, value in enumerate(vector):
+                total[i] += value * qty
+        total = tuple(total)
+        self.meal_cache[id(meal)] = (meal, total)
+        for item in meal.get("items", []):
+            self.meals_by_food.setdefault(item["food_id"], set()).add(id(meal))
+        return total
+
+    # ----- Daily Tracking -----
+    def rollover(self, today=None):
+        # Move the finished day into history and start a new one. Days in
+        # between with nothing logged are counted as missed in the
+        # aggregates; they get no history record, like any empty day.
+        #
+        # The new day is saved last. A rollover cut short before that runs
+        # again on the next start, so each step first checks whether it got
+        # done: the event log and history by their newest day, and the
+        # aggregates by the last day folded into them.
+        today = today or today_str()
+        finished = self.daily_data["date"]
+        if finished == today:
+            return False
+        # A day's events go to the event log in one append, so they are
+        # either all in it or not at all.
+        events = self.daily_data["events"]
+        if any(is_structured(event) for event in events) and self.event_log.last_day() != day_ordinal(finished):
+            self.event_log.extend(events)
+        state = self.long_term_aggregates()
+        totals = self.daily_data["totals"]
+        recorded = bool(self.history) and self.history[-1].get("date") == finished
+        if not recorded and any(totals.values()):
+            record = {"date": finished}
+            for macro in MACROS:
+                record[macro] = round(totals[macro], 1)
+            for macro in MACROS:
+                record[f"{macro}_goal"] = self.goals[macro]
+            self.history.append(record)
+            self.save("history")
+            recorded = True
+        if state.get("last_day") != finished:
+            if recorded:
+                aggregates.add_day(state, self.history[-1])
+            else:
+                aggregates.skip_days(state, 1)
+            try:
+                gap = datetime.strptime(today, "%m/%d/%Y") - datetime.strptime(finished, "%m/%d/%Y")
+                aggregates.skip_days(state, gap.days - 1)
+            except ValueError:
+                pass
+            state["last_day"] = finished
+            self.save("aggregates")
+        self.daily_data["date"] = today
+        self.daily_data["totals"] = empty_totals()
+        self.daily_data["events"] = []
+        self.save_daily_data()
+        return True
+
+    def long_term_aggregates(self):
+        # Running sums, streaks and weight EMA; built from history once if
+        # the data predates them, then only updated incrementally.
+        if self.aggregates.get("version") != aggregates.VERSION:
+            self.rebuild_aggregates()
+            self.save("aggregates")
+        return self.aggregates
+
+    def rebuild_aggregates(self):
+        self.aggregates = aggregates.rebuild(self.history, self.profile_history, self.daily_data["date"])
+
+    def long_term_stats(self):
+        return aggregates.summary(self.long_term_aggregates())
+
+    def add_consumption(self, consumption):
+        add_totals(self.daily_data["totals"], consumption)
+        self.append_daily_entry({"op": "consume", "macros": consumption})
+
+    def log_event(self, event):
+        self.daily_data["events"].append(event)
+        self.append_daily_entry({"op": "event", "event": event})
+
+    def record_food(self, food, amount):
+        vector = self.food_vectors.get(food.get("id"))
+        consumption = scale_vector(vector if vector is not None else macro_vector(food), amount)
+        self.add_consumption(consumption)
+        self.log_event(make_event("food", food, amount, consumption, self.daily_data["date"]))
+        return consumption
+
+    def record_drink(self, drink):
+        consumption = drink_consumption(drink)
+        self.add_consumption(consumption)
+        self.log_event(make_event("drink", drink, 1, consumption, self.daily_data["date"]))
+        return consumption
+
+    def record_meal(self, meal):
+        total = dict(zip(MACROS, self.meal_vector(meal)))
+        items = []
+        for item in meal.get("items", []):
+            food_id, qty = item.get("food_id"), item.get("quantity", 0)
+            items.append((food_id, qty, [value * qty for value in self.food_vectors[food_id]]))
+        self.add_consumption(total)
+        self.log_event(make_event("meal", meal, 1, total, self.daily_data["date"], items=items))
+        return total
+
+    # ----- Consumption Queries -----
+    def consumption_events(self, kind=None, item_id=None, start=None, end=None):
+        # Structured events from past days and today, for one item when
+        # kind and item_id are given; start and end are day ordinals. A
+        # food's events include its share of the saved meals it was eaten in.
+        portions = kind == "food" and item_id is not None
+
+        def wanted(event):
+            if kind is None:
+                return True
+            if event["kind"] == kind:
+                return item_id is None or event.get("item_id") == item_id
+            return portions and item_id in meal_foods(event)
+
+        events = self.event_log.select(kind, item_id, start, end, in_meals=portions)
+        today = day_ordinal(self.daily_data["date"])
+        if (start is None or today >= start) and (end is None or today <= end):
+            events.extend(event for event in self.daily_data["events"] if is_structured(event) and wanted(event))
+        if portions:
+            events = [event if event["kind"] == kind else meal_portion(event, item_id) for event in events]
+        return events
+
+    def item_consumption(self, kind, item_id, start=None, end=None):
+        return summarize(self.consumption_events(kind, item_id, start, end))
+
+    def top_items(self, macro="calories", kind=None, start=None, end=None, limit=10):
+        return top_items(self.consumption_events(kind, None, start, end), macro, limit)
+
+    # ----- Suggestions -----
+    def suggestion_engine(self):
+        # NumPy is only imported when suggestions are first asked for.
+        if self.suggester is None:
+            from .suggest import Suggester
+            self.suggester = Suggester(self)
+        return self.suggester
+
+    def suggestions(self, limit=10, prefer_familiar=False, kinds=None):
+        # Foods, drinks and saved meals that best fill what is left of
+        # today's goals, with quantities; see suggest.Suggester.
+        return self.suggestion_engine().suggest(limit, prefer_familiar, kinds)
+
+    def suggested_plan(self, steps=3, prefer_familiar=False):
+        return self.suggestion_engine().plan(steps, prefer_familiar)
+
+    # ----- Goals, Measurements and Profile -----
+    def update_goals(self, goals):
+        self.goals.update(goals)
+        self.save("goals")
+
+    def record_measurements(self, values, date=None):
+        record = {"date": date or today_str()}
+        for key in MEASUREMENT_FIELDS:
+            record[key] = round(values[key], 1)
+        self.measurements.append(record)
+        self.save("measurements")
+        return record
+
+    def update_profile_settings(self, age, height):
+        self.profile_settings["age"] = age
+        self.profile_settings["height"] = height
+        self.save("profile_settings")
+
+    def record_profile_update(self, weight, bodyfat=None, date=None):
+        record = {
+            "date": date or today_str(),
+            "weight": weight,
+            "bodyfat": bodyfat if bodyfat is not None else ""
+        }
+        self.profile_history.append(record)
+        self.save("profile_history")
+        aggregates.add_weight(self.long_term_aggregates(), weight)
+        self.save("aggregates")
+        return record
+
+    # ----- Time Series -----
+    def series(self, name):
+        # Date-sorted columnar copy of history, measurements or
+        # profile_history for range queries. Built on first use and then
+        # only extended with the records appended since; a collection that
+        # was replaced or shrank is rebuilt.
+        records = getattr(self, COLLECTIONS[name])
+        cached = self.series_cache.get(name)
+        if cached is None or cached["records"] is not records or cached["count"] > len(records):
+            cached = {"records": records, "count": 0, "series": TimeSeries(SERIES_FIELDS[name])}
+            self.series_cache[name] = cached
+        cached["series"].extend(records[cached["count"]:])
+        cached["count"] = len(records)
+        return cached["series"]
@@ -0,0 +1,252 @@
+import numpy as np
+
+from .events import is_structured
+from .macros import MACROS
+
+# Quantity bounds per kind of candidate and the step suggestions are
+# rounded to. Drinks and meals are logged whole, like in the app.
+GRAM_BOUNDS = (10.0, 400.0, 5.0)
+UNIT_BOUNDS = (0.5, 4.0, 0.5)
+FIXED_BOUNDS = (1.0, 1.0, 1.0)
+# How much a food eaten n times before is preferred: its error is divided
+# by 1 + FAMILIAR_WEIGHT * log1p(n).
+FAMILIAR_WEIGHT = 0.5
+
+
+class Suggester:
+    # Scores every food, drink and saved meal against the remaining macro
+    # gap at once. The catalog is held as an (n, 4) matrix of macros per
+    # gram, unit, serving or meal; each candidate's best quantity is the
+    # closed-form least-squares fit of q * m to the gap, clipped to its
+    # bounds, with each macro weighted by 1 / goal so the errors are
+    # relative.
+    #
+    # The matrix is built once; after that the store reports each changed
+    # food, drink or meal (see changed) and only their rows, and those of
+    # the meals using a changed food, are rewritten. New items get rows
+    # appended; removed meals are masked out. A reloaded catalog is built
+    # again from scratch.
+    def __init__(self, store):
+        self.store = store
+        self.version = None
+        self.pending = []
+
+    def changed(self, kind, items):
+        self.pending.append((kind, items))
+
+    def refresh(self):
+        # A build reads the catalog as it is now, which covers any changes
+        # reported while it loads.
+        if self.version is None or any(kind is None for kind, _ in self.pending):
+            self.build()
+        else:
+            self.update(self.pending)
+        self.pending = []
+        self.version = self.store.catalog_version
+
+    def build(self):
+        store = self.store
+        foods, drinks, meals = store.foods, store.drinks, store.saved_meals
+        # food_vectors is kept in catalog order.
+        food_ids = list(store.food_vectors)
+        food_matrix = np.array(list(store.food_vectors.values()), dtype=np.float64).reshape(-1, len(MACROS))
+        per_unit = np.fromiter((food.get("per_unit", False) for food in foods), bool, len(foods))
+        drink_matrix = np.array([[drink.get(macro, 0) for macro in MACROS] for drink in drinks],
+                                dtype=np.float64).reshape(-1, len(MACROS))
+        meal_matrix, meal_ok = self.meal_matrix(meals, food_ids, food_matrix)
+
+        self.matrix = np.concatenate([food_matrix, drink_matrix, meal_matrix[meal_ok]])
+        bounds = np.concatenate([np.where(per_unit[:, None], UNIT_BOUNDS, GRAM_BOUNDS).reshape(-1, 3),
+                                 np.tile(FIXED_BOUNDS, (len(drinks) + int(meal_ok.sum()), 1))])
+        self.lower, self.upper, self.step = bounds[:, 0], bounds[:, 1], bounds[:, 2]
+        meals = [meal for meal, ok in zip(meals, meal_ok) if ok]
+        self.kinds = np.array(["food"] * len(foods) + ["drink"] * len(drinks) + ["meal"] * len(meals))
+        self.items = foods + drinks + meals
+        self.ids = food_ids + [drink["id"] for drink in drinks] + [meal["id"] for meal in meals]
+        self.live = np.ones(len(self.ids), dtype=bool)
+        # Row by (kind, id) and saved meal ids by the foods in them, built
+        # when first needed.
+        self.rows = None
+        self.meals_using = None
+
+    def index(self):
+        if self.rows is None:
+            self.rows = dict(zip(zip(self.kinds.tolist(), self.ids), range(len(self.ids))))
+        if self.meals_using is None:
+            self.meals_using = {}
+            for meal in self.store.saved_meals:
+                self.index_meal(meal)
+
+    def index_meal(self, meal):
+        for item in meal.get("items", []):
+            self.meals_using.setdefault(item.get("food_id"), set()).add(meal.get("id"))
+
+    def update(self, pending):
+        store = self.store
+        self.index()
+        meal_ids, added = set(), []
+        for kind, items in pending:
+            for item in items:
+                if kind == "food":
+                    bounds = UNIT_BOUNDS if item.get("per_unit", False) else GRAM_BOUNDS
+                    self.set_row("food", item, store.food_vectors[item["id"]], bounds, added)
+                    meal_ids |= self.meals_using.get(item["id"], set())
+                elif kind == "drink":
+                    self.set_row("drink", item, [item.get(macro, 0) for macro in MACROS], FIXED_BOUNDS, added)
+                else:
+                    meal_ids.add(item.get("id"))
+        if meal_ids:
+            meals = {meal.get("id"): meal for meal in store.saved_meals}
+            for meal_id in meal_ids:
+                meal, vector = meals.get(meal_id), None
+                if meal is not None:
+                    try:
+                        vector = store.meal_vector(meal)
+                    except ValueError:
+                        # A food in it is no longer in the catalog.
+                        pass
+                if vector is None:
+                    row = self.rows.get(("meal", meal_id))
+                    if row is not None:
+                        self.live[row] = False
+                    continue
+                self.index_meal(meal)
+                self.set_row("meal", meal, vector, FIXED_BOUNDS, added)
+        if added:
+            kinds, items, vectors, bounds = zip(*added)
+            bounds = np.array(bounds, dtype=np.float64)
+            for kind, item in zip(kinds, items):
+                self.rows[(kind, item.get("id"))] = len(self.ids)
+                self.ids.append(item.get("id"))
+                self.items.append(item)
+            self.matrix = np.concatenate([self.matrix, np.array(vectors, dtype=np.float64)])
+            self.lower = np.concatenate([self.lower, bounds[:, 0]])
+            self.upper = np.concatenate([self.upper, bounds[:, 1]])
+            self.step = np.concatenate([self.step, bounds[:, 2]])
+            self.kinds = np.concatenate([self.kinds, np.array(kinds)])
+            self.live = np.concatenate([self.live, np.ones(len(added), dtype=bool)])
+
+    def set_row(self, kind, item, vector, bounds, added):
+        # Rewrite an item's row, or queue a new one in added.
+        row = self.rows.get((kind, item.get("id")))
+        if row is None:
+            added.append((kind, item, vector, bounds))
+            return
+        self.matrix[row] = vector
+        self.lower[row], self.upper[row], self.step[row] = bounds
+        self.items[row] = item
+        self.live[row] = True
+
+    @staticmethod
+    def meal_matrix(meals, food_ids, food_matrix):
+        # Saved meal totals in one pass over all meal items. Meals using a
+        # food that is no longer in the catalog are left out.
+        row_of = dict(zip(food_ids, range(len(food_ids))))
+        meal_index, rows, quantities = [], [], []
+        ok = np.ones(len(meals), dtype=bool)
+        for i, meal in enumerate(meals):
+            for item in meal.get("items", []):
+                row = row_of.get(item.get("food_id"))
+                if row is None:
+                    ok[i] = False
+                    continue
+                meal_index.append(i)
+                rows.append(row)
+                quantities.append(item.get("quantity", 0))
+        totals = np.zeros((len(meals), len(MACROS)))
+        if rows:
+            np.add.at(totals, np.array(meal_index),
+                      food_matrix[np.array(rows)] * np.array(quantities, dtype=np.float64)[:, None])
+        return totals, ok
+
+    def familiarity(self):
+        # Times each candidate was logged, from the event log's item index
+        # plus today's events.
+        self.index()
+        counts = np.zeros(len(self.ids))
+        store = self.store
+        log = store.event_log
+        if log.events is None:
+            log.load()
+        for key, positions in log.by_item.items():
+            row = self.rows.get(key)
+            if row is not None:
+                counts[row] += len(positions)
+        for event in store.daily_data["events"]:
+            if is_structured(event):
+                row = self.rows.get((event["kind"], event.get("item_id")))
+                if row is not None:
+                    counts[row] += 1
+        return counts
+
+    def gap(self):
+        goals = np.array([float(self.store.goals[macro]) for macro in MACROS])
+        totals = np.array([self.store.daily_totals[macro] for macro in MACROS])
+        return goals, np.maximum(goals - totals, 0.0)
+
+    def fit(self, gap, weights):
+        # Best clipped quantity and weighted residual norm per candidate.
+        m = self.matrix * weights
+        g = gap * weights
+        mm = np.einsum("ij,ij->i", m, m)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            q = (m @ g) / mm
+        q = np.clip(np.nan_to_num(q), self.lower, self.upper)
+        residual = np.linalg.norm(m * q[:, None] - g, axis=1)
+        return q, residual
+
+    def suggest(self, limit=10, prefer_familiar=False, kinds=None, gap=None):
+        if self.version != self.store.catalog_version:
+            self.refresh()
+        goals, remaining = self.gap()
+        if gap is not None:
+            remaining = np.asarray(gap, dtype=np.float64)
+        if not len(self.matrix) or not remaining.any():
+            return []
+        weights = 1.0 / np.where(goals > 0, goals, 1.0)
+        q, residual = self.fit(remaining, weights)
+        # Rank by how much of the gap is left, relative to doing nothing.
+        score = residual / np.linalg.norm(remaining * weights)
+        if prefer_familiar:
+            score = score / (1.0 + FAMILIAR_WEIGHT * np.log1p(self.familiarity()))
+        allowed = self.live
+        if kinds is not None:
+            allowed = allowed & np.isin(self.kinds, list(kinds))
+        score = np.where(allowed, score, np.inf)
+        limit = min(limit, int(np.isfinite(score).sum()))
+        if limit <= 0:
+            return []
+        top = np.argpartition(score, limit - 1)[:limit]
+        top = top[np.argsort(score[top], kind="stable")]
+        suggestions = []
+        for row in top:
+            quantity = float(np.clip(np.round(q[row] / self.step[row]) * self.step[row],
+                                     self.lower[row], self.upper[row]))
+            macros = self.matrix[row] * quantity
+            suggestions.append({
+                "kind": str(self.kinds[row]),
+                "item_id": self.ids[row],
+                "name": self.items[row].get("name"),
+                "quantity": quantity,
+                "macros": dict(zip(MACROS, macros.tolist())),
+                "remaining": dict(zip(MACROS, (remaining - macros).tolist())),
+                "score": float(score[row]),
+            })
+        return suggestions
+
+    def plan(self, steps=3, prefer_familiar=False):
+        # Greedy combination: take the best candidate, subtract it from the
+        # gap and repeat, never picking the same item twice.
+        _, remaining = self.gap()
+        chosen, picked = [], set()
+        for _ in range(steps):
+            if not remaining.any():
+                break
+            options = self.suggest(steps + len(picked), prefer_familiar, gap=remaining)
+            option = next((o for o in options if (o["kind"], o["item_id"]) not in picked), None)
+            if option is None:
+                break
+            chosen.append(option)
+            picked.add((option["kind"], option["item_id"]))
+            remaining = np.maximum(np.array([option["remaining"][macro] for macro in MACROS]), 0.0)
+        return chosen
@@ -0,0 +1,503 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlsplit
+from urllib.request import Request, urlopen
+
+from . import snapshot
+from .catalog import build_name_index
+from .store import COLLECTIONS, JSON_FOLDER, TrackerStore
+from .timeseries import day_ordinal
+from .writer import atomic_write, dumps
+
+STATE_FILE = "sync_state.json"
+HOST = "127.0.0.1"
+PORT = 8767
+HTTP_TIMEOUT = 60
+
+# Synced collections, in the order changes are applied (meals refer to
+# foods by name). Each record has a key that is the same on every device:
+#   foods, drinks and meals: the name, case-insensitive;
+#   history: the date, one record per day;
+#   measurements and profile_history: the record's own hash, so records
+#     added on different devices are all kept;
+#   goals and profile_settings: one record each.
+# The daily data, event log and aggregates are not synced; aggregates are
+# rebuilt from the merged history.
+SYNCED = ("foods", "drinks", "meals", "history", "measurements", "profile_history", "goals", "profile_settings")
+BY_NAME = ("foods", "drinks", "meals")
+BY_HASH = ("measurements", "profile_history")
+SETTINGS = ("goals", "profile_settings")
+# Deleting a food or drink by hand is not passed on: meals and past events
+# may still refer to it on the other device.
+KEEP_DELETED = ("foods", "drinks")
+# Files a collection's records are derived from; while they are unchanged
+# since the last sync its records need no rehashing.
+SOURCES = {name: (name,) for name in SYNCED}
+SOURCES["meals"] = ("meals", "foods")
+
+
+HASH_ENCODER = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
+
+
+def record_hash(record):
+    # Local ids differ between devices, so they are left out.
+    if "id" in record:
+        record = dict(record)
+        del record["id"]
+    return hashlib.blake2b(HASH_ENCODER.encode(record).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def name_key(name):
+    return " ".join(str(name or "").lower().split())
+
+
+def keyed(records, key):
+    # {key: record}; repeated keys get "#2", "#3"... in list order.
+    result = {}
+    for record in records:
+        k = base = key(record)
+        n = 1
+        while k in result:
+            n += 1
+            k = f"{base}#{n}"
+        result[k] = record
+    return result
+
+
+def date_order(record):
+    try:
+        return day_ordinal(record.get("date", ""))
+    except ValueError:
+        return 0
+
+
+def local_records(store, name):
+    # {key: record} for a collection, as the store holds them.
+    if name in SETTINGS:
+        return {name: getattr(store, COLLECTIONS[name])}
+    records = getattr(store, COLLECTIONS[name])
+    if name in BY_NAME:
+        return keyed(records, lambda record: name_key(record.get("name")))
+    if name in BY_HASH:
+        return keyed(records, record_hash)
+    return keyed(records, lambda record: record.get("date", ""))
+
+
+def to_wire(store, name, record):
+    # A record in the form sent between devices: catalog items without
+    # their local ids, and meal items naming their food instead of
+    # referring to it by id.
+    if name == "meals":
+        wire = {k: v for k, v in record.items() if k not in ("id", "items")}
+        wire["items"] = [{"food": food.get("name") if food else None, "quantity": qty}
+                         for food, qty in store.meal_items(record)]
+        return wire
+    if name in BY_NAME:
+        return {k: v for k, v in record.items() if k != "id"}
+    return record
+
+
+class Replica:
+    # One data folder's side of a sync. sync_state.json records, per
+    # collection and key, [hash, version, device, seq, fingerprint]: the
+    # content hash (None once deleted), the logical version and the device
+    # that wrote it, the local change sequence number at which it last
+    # changed here, and a cheap checksum of the record as stored here.
+    # Versions come from a Lamport clock, so the newest write wins a
+    # conflict and equal versions fall back to the device id; every device
+    # picks the same winner. Peers are remembered by the last sequence
+    # number received from them, so only later changes are exchanged.
+    def __init__(self, store):
+        self.store = store
+        self.path = store.path(STATE_FILE)
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.state = json.load(f)
+        else:
+            self.state = {"device": uuid.uuid4().hex[:12], "clock": 0, "seq": 0,
+                          "peers": {}, "sources": {}, "records": {}}
+        self.device = self.state["device"]
+        self.lock = threading.Lock()
+        # local_records() by collection, kept until changes are applied.
+        self.indexes = {}
+
+    def index(self, name):
+        if name not in self.indexes:
+            self.indexes[name] = local_records(self.store, name)
+        return self.indexes[name]
+
+    def signatures(self, name):
+        if self.store.db:
+            return None
+        return [snapshot.file_signature(self.store.path(f"{source}.json")) for source in SOURCES[name]]
+
+    def bump(self):
+        self.state["clock"] += 1
+        self.state["seq"] += 1
+        return self.state["clock"], self.state["seq"]
+
+    def scan(self):
+        # Give local edits since the last sync new versions.
+        changed = 0
+        for name in SYNCED:
+            signatures = self.signatures(name)
+            entries = self.state["records"].setdefault(name, {})
+            if signatures is not None and self.state["sources"].get(name) == signatures:
+                continue
+            records = self.index(name)
+            for key, record in records.items():
+                entry = entries.get(key)
+                # A record whose repr is unchanged here needs no rehashing.
+                # Meals are always rehashed, as renaming a food changes them.
+                fingerprint = zlib.crc32(repr(record).encode("utf-8"))
+                if entry is not None and entry[4:] == [fingerprint] and name != "meals":
+                    continue
+                h = record_hash(to_wire(self.store, name, record) if name == "meals" else record)
+                if entry is None or entry[0] != h:
+                    version, seq = self.bump()
+                    entries[key] = [h, version, self.device, seq, fingerprint]
+                    changed += 1
+                else:
+                    entries[key] = entry[:4] + [fingerprint]
+            if name not in KEEP_DELETED:
+                for key, entry in entries.items():
+                    if entry[0] is not None and key not in records:
+                        version, seq = self.bump()
+                        entries[key] = [None, version, self.device, seq]
+                        changed += 1
+            self.state["sources"][name] = signatures
+        return changed
+
+    def changes(self, after, exclude):
+        # {collection: [[key, hash, version, device], ...]} changed here
+        # after seq, leaving out what the peer wrote itself.
+        result = {}
+        for name, entries in self.state["records"].items():
+            found = [[key, *entry[:3]] for key, entry in entries.items() if entry[3] > after and entry[2] != exclude]
+            if found:
+                result[name] = found
+        return result
+
+    def with_records(self, changes):
+        # The same changes with the record appended to each.
+        result = {}
+        for name, found in changes.items():
+            records = self.index(name)
+            result[name] = [[*change, to_wire(self.store, name, records[change[0]]) if change[1] is not None else None]
+                            for change in found]
+        return result
+
+    def wins(self, name, change):
+        # Whether an incoming [key, hash, version, device] should replace
+        # the local record.
+        entry = self.state["records"].get(name, {}).get(change[0])
+        if entry is None:
+            return change[1] is not None
+        if entry[0] == change[1]:
+            return False
+        return (change[2], change[3]) > (entry[1], entry[2])
+
+    # ----- Protocol -----
+    # Three calls from the device starting the sync to its peer: hello,
+    # offer (the keys, hashes and versions of its changes, answered with
+    # the keys the peer wants and the peer's own winning changes with their
+    # records) and push (the wanted records). Records the other side
+    # already has are never sent.
+    def hello(self, message):
+        with self.lock:
+            self.scan()
+            return {"device": self.device, "received": self.state["peers"].get(message["device"], 0)}
+
+    def offer(self, message):
+        with self.lock:
+            offered = message["changes"]
+            want = {name: [change[0] for change in found if self.wins(name, change)]
+                    for name, found in offered.items()}
+            incoming = {name: {change[0]: change for change in found} for name, found in offered.items()}
+            mine, conflicts = {}, []
+            for name, found in self.changes(message["since"], message["device"]).items():
+                kept = []
+                for change in found:
+                    other = incoming.get(name, {}).get(change[0])
+                    if other is not None and other[1] != change[1]:
+                        winner = max((change[2], change[3]), (other[2], other[3]))[1]
+                        conflicts.append([name, change[0], winner])
+                        if winner != self.device:
+                            continue
+                    elif other is not None:
+                        continue
+                    kept.append(change)
+                if kept:
+                    mine[name] = kept
+            return {"device": self.device, "seq": self.state["seq"],
+                    "want": {name: keys for name, keys in want.items() if keys},
+                    "changes": self.with_records(mine), "conflicts": conflicts}
+
+    def push(self, message):
+        with self.lock:
+            applied = self.apply(message["changes"])
+            self.state["peers"][message["device"]] = message["seq"]
+            self.finish()
+            return {"applied": applied}
+
+    def apply(self, changes):
+        # Apply [key, hash, version, device, record] changes that win here.
+        # Returns the number applied.
+        applied = 0
+        for name in SYNCED:
+            found = [change for change in changes.get(name, ()) if self.wins(name, change)]
+            self.state["clock"] = max([self.state["clock"]] + [change[2] for change in changes.get(name, ())])
+            if not found:
+                continue
+            updates = {change[0]: change[4] for change in found}
+            done = apply_records(self.store, name, updates, self.index(name))
+            self.indexes.pop(name, None)
+            if name == "foods":
+                self.indexes.pop("meals", None)
+            entries = self.state["records"].setdefault(name, {})
+            for key, h, version, device, _ in found:
+                if key in done:
+                    self.state["seq"] += 1
+                    entries[key] = [h, version, device, self.state["seq"]]
+                    applied += 1
+        return applied
+
+    def finish(self):
+        # Record the files as written so the next scan can skip them, and
+        # save the state.
+        self.store.flush()
+        for name in SYNCED:
+            self.state["sources"][name] = self.signatures(name)
+        atomic_write(self.path, dumps(self.state))
+
+
+def apply_records(store, name, updates, local):
+    # Write {key: record or None (deleted)} into the store's collection,
+    # whose records by key are local. Returns the keys that were applied;
+    # meals naming a food missing here are skipped.
+    if name in SETTINGS:
+        record = updates.get(name)
+        if record is None:
+            return set()
+        data = getattr(store, COLLECTIONS[name])
+        data.clear()
+        data.update(record)
+        store.save(name)
+        return {name}
+    if name in ("foods", "drinks"):
+        return apply_catalog(store, name, updates, local)
+    if name == "meals":
+        return apply_meals(store, updates, local)
+    current = dict(local)
+    current.update(updates)
+    records = [record for record in current.values() if record is not None]
+    hashes = {id(record): record_hash(record) for record in records}
+    records.sort(key=lambda record: (date_order(record), hashes[id(record)]))
+    # New days mostly land at the end, so only the records from the first
+    # one that moved or changed are written.
+    old = getattr(store, COLLECTIONS[name])
+    start = next((i for i, (a, b) in enumerate(zip(old, records)) if a is not b), min(len(old), len(records)))
+    setattr(store, COLLECTIONS[name], records)
+    store.save(name, changed=records[start:])
+    if name in ("history", "profile_history"):
+        store.rebuild_aggregates()
+        store.save("aggregates")
+    return set(updates)
+
+
+def apply_catalog(store, kind, updates, local):
+    update = store.update_food if kind == "foods" else store.update_drink
+    added, changed, done = [], [], set()
+    for key, record in updates.items():
+        if record is None:
+            continue
+        item = local.get(key)
+        if item is None:
+            added.append(dict(record))
+        else:
+            for field in [field for field in item if field != "id" and field not in record]:
+                del item[field]
+            changed.append(update(item["id"], record, save=False))
+        done.add(key)
+    if added:
+        store.add_catalog_items(kind, added, save=False)
+    if kind == "foods":
+        store.foods_by_name = build_name_index(store.foods)
+    store.save(kind, changed=changed + added)
+    return done
+
+
+def apply_meals(store, updates, local):
+    changed, removed, done = [], [], set()
+    for key, record in updates.items():
+        meal = local.get(key)
+        try:
+            if record is None:
+                if meal is not None:
+                    store.remove_meal(meal, save=False)
+                    removed.append(meal)
+            else:
+                items = [(item["food"], item["quantity"]) for item in record["items"]]
+                if meal is None:
+                    changed.append(store.add_meal(record["name"], items, save=False))
+                else:
+                    changed.append(store.update_meal(meal, record["name"], items, save=False))
+        except ValueError:
+            continue
+        done.add(key)
+    store.save("meals", changed=changed, removed=removed)
+    return done
+
+
+# ----- Transports -----
+def encode(message):
+    return zlib.compress(dumps(message).encode("utf-8"))
+
+
+def decode(data):
+    return json.loads(zlib.decompress(data))
+
+
+class Link:
+    # Counts the bytes of every message, compressed as sent.
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+
+    def call(self, route, message):
+        data = encode(message)
+        self.sent += len(data)
+        reply = self.send(route, data)
+        self.received += len(reply)
+        return decode(reply)
+
+
+class FolderLink(Link):
+    # A peer data folder on this machine (or a mounted share), synced in
+    # process through the same messages the server would get.
+    def __init__(self, store):
+        super().__init__()
+        self.replica = Replica(store)
+
+    def send(self, route, data):
+        return encode(getattr(self.replica, route)(decode(data)))
+
+
+class HTTPLink(Link):
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        super().__init__()
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def send(self, route, data):
+        request = Request(f"{self.url}/sync/{quote(route)}", data=data,
+                          headers={"Content-Type": "application/octet-stream"})
+        with urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+
+def sync(replica, link):
+    # Two-way sync of replica with the peer behind link. Returns counts of
+    # records sent, received and conflicting, and bytes transferred.
+    peer = link.call("hello", {"device": replica.device})
+    replica.scan()
+    peer_device = peer["device"]
+    offered = replica.changes(peer["received"], peer_device)
+    since = replica.state["peers"].get(peer_device, 0)
+    answer = link.call("offer", {"device": replica.device, "since": since, "changes": offered})
+    wanted = {name: set(keys) for name, keys in answer["want"].items()}
+    push = {name: [change for change in found if change[0] in wanted.get(name, ())]
+            for name, found in offered.items()}
+    push = replica.with_records({name: found for name, found in push.items() if found})
+    link.call("push", {"device": replica.device, "seq": replica.state["seq"], "changes": push})
+    received = replica.apply(answer["changes"])
+    replica.state["peers"][peer_device] = answer["seq"]
+    replica.finish()
+    return {"sent": sum(len(found) for found in push.values()), "received": received,
+            "conflicts": answer["conflicts"], "bytes_sent": link.sent, "bytes_received": link.received}
+
+
+# ----- Local stand-in server -----
+def make_handler(replica):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            url = urlsplit(self.path)
+            route = url.path.rsplit("/", 1)[-1]
+            if not url.path.startswith("/sync/") or route not in ("hello", "offer", "push"):
+                self.reply(404, encode({"error": "Not found."}))
+                return
+            try:
+                message = decode(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                self.reply(200, encode(getattr(replica, route)(message)))
+            except (ValueError, KeyError, zlib.error) as e:
+                self.reply(400, encode({"error": str(e)}))
+
+        def reply(self, status, data):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(store, host=HOST, port=PORT):
+    # Serve a data folder for other devices to sync with. Syncs run one at
+    # a time.
+    server = ThreadingHTTPServer((host, port), make_handler(Replica(store)))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync this data folder with another folder or a sync server.")
+    parser.add_argument("--folder", default=JSON_FOLDER)
+    parser.add_argument("--backend", default=os.environ.get("MACRO_TRACKER_BACKEND", "json"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    with_peer = sub.add_parser("with", help="sync with another data folder or an http:// sync server")
+    with_peer.add_argument("peer")
+    server = sub.add_parser("serve", help="serve this data folder for syncing")
+    server.add_argument("--host", default=HOST)
+    server.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    store = TrackerStore(args.folder, args.backend)
+    try:
+        if args.command == "serve":
+            httpd = serve(store, args.host, args.port)
+            print(f"Serving {args.folder} for sync on http://{args.host}:{httpd.server_address[1]}")
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            return
+        if args.peer.startswith(("http://", "https://")):
+            peer_store, link = None, HTTPLink(args.peer)
+        else:
+            peer_store = TrackerStore(args.peer, args.backend)
+            link = FolderLink(peer_store)
+        try:
+            result = sync(Replica(store), link)
+        finally:
+            if peer_store is not None:
+                peer_store.close()
+        print(f"Sent {result['sent']} records, received {result['received']}; "
+              f"{result['bytes_sent']} bytes sent, {result['bytes_received']} bytes received.")
+        for name, key, winner in result["conflicts"]:
+            print(f"Conflict in {name} {key!r}: kept the version from {winner}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
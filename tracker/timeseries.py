@@ -0,0 +1,236 @@
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import date, datetime
+
+from .macros import MACROS
+from .writer import atomic_write
+
+HISTORY_FIELDS = MACROS + tuple(f"{macro}_goal" for macro in MACROS)
+PROFILE_FIELDS = ("weight", "bodyfat")
+MEASUREMENT_FIELDS = ("left_bicep", "right_bicep", "shoulders", "chest", "waist",
+                      "left_thigh", "right_thigh", "left_calf", "right_calf")
+# Dated collections and the numeric fields kept for each.
+SERIES_FIELDS = {
+    "history": HISTORY_FIELDS,
+    "measurements": MEASUREMENT_FIELDS,
+    "profile_history": PROFILE_FIELDS,
+}
+
+# File layout, all little-endian: header (magic, version, field count,
+# record count), the field names as one length-prefixed "\n"-joined string,
+# then an int32 array of day ordinals and one float64 array per field, each
+# starting on an 8-byte boundary so the arrays can be used straight from an
+# mmap.
+MAGIC = b"MTTS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+NAMES_LENGTH = struct.Struct("<I")
+LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def day_ordinal(date_str):
+    return datetime.strptime(date_str, "%m/%d/%Y").toordinal()
+
+
+def date_string(day):
+    return date.fromordinal(day).strftime("%m/%d/%Y")
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def align(offset):
+    return (offset + 7) & ~7
+
+
+def quarter_range(day):
+    # First and last day ordinals of the calendar quarter containing day.
+    d = date.fromordinal(day)
+    first_month = (d.month - 1) // 3 * 3 + 1
+    start = date(d.year, first_month, 1)
+    end = date(d.year + 1, 1, 1) if first_month == 10 else date(d.year, first_month + 3, 1)
+    return start.toordinal(), end.toordinal() - 1
+
+
+class TimeSeries:
+    # Dated records as columns: day ordinals in ascending order and one
+    # float array per field, NaN where a value is missing. Range queries
+    # bisect the day column; nothing is parsed per record after loading.
+    #
+    # Loaded series hold array.array columns and can be appended to; opened
+    # (mmapped) series hold read-only memoryviews over the file.
+    def __init__(self, fields, days=None, columns=None):
+        self.fields = tuple(fields)
+        self.days = days if days is not None else array("i")
+        self.columns = columns if columns is not None else {field: array("d") for field in self.fields}
+        self.mapped = None
+        # Out-of-order inserts so far, so incremental readers know when the
+        # rows they already consumed have shifted.
+        self.inserts = 0
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def from_records(cls, records, fields):
+        series = cls(fields)
+        series.extend(records)
+        return series
+
+    def extend(self, records):
+        # Records without a parseable date are skipped. Appends in date
+        # order are O(1); an older record is inserted at its position.
+        for record in records:
+            try:
+                day = day_ordinal(record.get("date"))
+            except (TypeError, ValueError):
+                continue
+            self.append(day, record)
+
+    def append(self, day, record):
+        if not self.days or day >= self.days[-1]:
+            self.days.append(day)
+            for field in self.fields:
+                self.columns[field].append(to_float(record.get(field)))
+            return
+        position = bisect.bisect_right(self.days, day)
+        self.inserts += 1
+        self.days.insert(position, day)
+        for field in self.fields:
+            self.columns[field].insert(position, to_float(record.get(field)))
+
+    # ----- Queries -----
+    def range(self, start=None, end=None):
+        # Index bounds [lo, hi) of the records with start <= day <= end.
+        lo = 0 if start is None else bisect.bisect_left(self.days, start)
+        hi = len(self.days) if end is None else bisect.bisect_right(self.days, end)
+        return lo, hi
+
+    def last_days(self, days, end=None):
+        # The calendar window of `days` days ending at end (default: the
+        # newest record).
+        if end is None:
+            if not len(self.days):
+                return 0, 0
+            end = self.days[-1]
+        return self.range(end - days + 1, end)
+
+    def quarter(self, day=None):
+        day = day if day is not None else date.today().toordinal()
+        return self.range(*quarter_range(day))
+
+    def column(self, field, lo=0, hi=None):
+        return self.columns[field][lo:hi]
+
+    def records(self, lo=0, hi=None):
+        # Back to the JSON record shape, leaving out missing values.
+        hi = len(self.days) if hi is None else hi
+        out = []
+        for i in range(lo, hi):
+            record = {"date": date_string(self.days[i])}
+            for field in self.fields:
+                value = self.columns[field][i]
+                if not math.isnan(value):
+                    record[field] = value
+            out.append(record)
+        return out
+
+    def numpy(self):
+        # Zero-copy NumPy views of the columns, for the analytics code.
+        import numpy as np
+        days = np.frombuffer(self.days, dtype=np.int32)
+        return days, {field: np.frombuffer(self.columns[field], dtype=np.float64) for field in self.fields}
+
+    # ----- Binary file -----
+    def to_bytes(self):
+        names = "\n".join(self.fields).encode("utf-8")
+        parts = [HEADER.pack(MAGIC, VERSION, len(self.fields), len(self.days)),
+                 NAMES_LENGTH.pack(len(names)), names]
+        offset = sum(len(part) for part in parts)
+        for typecode, column in [("i", self.days)] + [("d", self.columns[field]) for field in self.fields]:
+            column = array(typecode, column)
+            if not LITTLE_ENDIAN:
+                column.byteswap()
+            parts.append(b"\0" * (align(offset) - offset))
+            data = column.tobytes()
+            parts.append(data)
+            offset = align(offset) + len(data)
+        return b"".join(parts)
+
+    def save(self, path):
+        atomic_write(path, self.to_bytes(), binary=True)
+
+    @classmethod
+    def parse(cls, buffer, copy=True):
+        view = memoryview(buffer)
+        magic, version, field_count, count = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a time series file or unsupported version")
+        offset = HEADER.size
+        (names_length,) = NAMES_LENGTH.unpack_from(view, offset)
+        offset += NAMES_LENGTH.size
+        fields = bytes(view[offset:offset + names_length]).decode("utf-8").split("\n") if field_count else []
+        offset += names_length
+        columns = []
+        for typecode, size in [("i", 4)] + [("d", 8)] * field_count:
+            offset = align(offset)
+            chunk = view[offset:offset + count * size]
+            if copy or not LITTLE_ENDIAN:
+                column = array(typecode)
+                column.frombytes(chunk)
+                if not LITTLE_ENDIAN:
+                    column.byteswap()
+            else:
+                column = chunk.cast(typecode)
+            columns.append(column)
+            offset += count * size
+        return cls(fields, columns[0], dict(zip(fields, columns[1:])))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.parse(f.read())
+
+    @classmethod
+    def open(cls, path):
+        # Map the file instead of reading it; the columns are read-only views
+        # and only the pages that queries touch are read from disk.
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        series = cls.parse(mapped, copy=False)
+        series.mapped = mapped
+        return series
+
+
+def convert_json(folder, target=None):
+    # Write <name>.series next to (or into target instead of) each dated
+    # JSON collection in folder.
+    target = target or folder
+    written = {}
+    for name, fields in SERIES_FIELDS.items():
+        filename = os.path.join(folder, f"{name}.json")
+        if not os.path.exists(filename):
+            continue
+        with open(filename, "r") as f:
+            series = TimeSeries.from_records(json.load(f), fields)
+        path = os.path.join(target, f"{name}.series")
+        series.save(path)
+        written[path] = len(series)
+    return written
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else "json"
+    target = sys.argv[2] if len(sys.argv) > 2 else folder
+    for path, count in convert_json(folder, target).items():
+        print(f"Wrote {count} records to {path}")
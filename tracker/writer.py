@@ -0,0 +1,141 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from .instrument import stats
+
+# How long the writer waits after the first save request before writing, so
+# back-to-back saves of the same collection turn into a single write.
+COALESCE_SECONDS = 0.5
+
+
+def dumps(data):
+    return json.dumps(data, separators=(",", ":"))
+
+
+def atomic_write(path, data, binary=False):
+    # Write to a temporary file next to the target and rename it over the
+    # original, so a crash leaves either the old or the new file.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb" if binary else "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    stats.add_bytes(os.path.basename(path), len(data))
+
+
+def read_jsonl(path):
+    # Records of an append-only JSON-lines file. A final line cut short by
+    # an interrupted write is cut off the file, so the next append starts
+    # on a fresh line instead of being glued to the fragment and lost on the
+    # following read; a damaged line with good lines after it is skipped.
+    with open(path, "rb") as f:
+        data = f.read()
+    records, good, offset = [], 0, 0
+    for line in data.splitlines(keepends=True):
+        offset += len(line)
+        if not line.strip():
+            if good == offset - len(line):
+                good = offset
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+        good = offset
+    if good < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(good)
+        data = data[:good]
+    if data and not data.endswith(b"\n"):
+        # A complete last record whose newline was not written.
+        with open(path, "ab") as f:
+            f.write(b"\n")
+    return records
+
+
+class BackgroundWriter:
+    # Persists collections on a worker thread. mark(name) only sets a dirty
+    # flag; the worker picks up everything marked within the coalescing
+    # window and calls write(name) once for each. Errors are queued for the
+    # owning thread to collect with pop_errors(), since they usually end up
+    # in the GUI.
+    def __init__(self, write, delay=COALESCE_SECONDS):
+        self.write = write
+        self.delay = delay
+        self.dirty = {}
+        self.busy = False
+        self.flushing = False
+        self.closed = False
+        self.writes = 0
+        self.errors = queue.Queue()
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="tracker-writer", daemon=True)
+        self.thread.start()
+
+    def mark(self, name):
+        with self.cond:
+            self.dirty[name] = True
+            self.cond.notify_all()
+
+    def take(self):
+        # Wait for something to be marked, then give further saves the rest
+        # of the window to coalesce unless a flush or close cuts it short.
+        with self.cond:
+            while not self.dirty and not self.closed:
+                self.cond.wait()
+            deadline = time.monotonic() + self.delay
+            while self.dirty and not (self.flushing or self.closed):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            names = list(self.dirty)
+            self.dirty.clear()
+            self.busy = bool(names)
+            return names
+
+    def run(self):
+        while True:
+            names = self.take()
+            if not names:
+                return
+            for name in names:
+                try:
+                    self.write(name)
+                except Exception as e:
+                    self.errors.put((name, e))
+            with self.cond:
+                self.busy = False
+                self.writes += len(names)
+                self.cond.notify_all()
+
+    def pending(self):
+        with self.cond:
+            return bool(self.dirty) or self.busy
+
+    def flush(self, timeout=None):
+        # Write everything marked so far without waiting out the window.
+        with self.cond:
+            self.flushing = True
+            self.cond.notify_all()
+            done = self.cond.wait_for(lambda: not self.dirty and not self.busy, timeout)
+            self.flushing = False
+        return done
+
+    def close(self, timeout=None):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+
+    def pop_errors(self):
+        errors = []
+        while True:
+            try:
+                errors.append(self.errors.get_nowait())
+            except queue.Empty:
+                return errors
@@ -0,0 +1,310 @@
+import bisect
+import tkinter as tk
+from collections import OrderedDict
+from datetime import date, datetime
+from tkinter import ttk
+
+from tracker.downsample import BucketedLTTB
+
+ROW_HEIGHT = 46
+PAGE_DAYS = 90
+
+
+def date_ordinal(text):
+    # Records with a missing or malformed date sort before everything else.
+    try:
+        return datetime.strptime(text, "%m/%d/%Y").toordinal()
+    except (TypeError, ValueError):
+        return 1
+
+
+class VirtualList(ttk.Frame):
+    # Scrollable list of "label + action button" rows that only creates
+    # widgets for the rows that fit in the canvas. The same row widgets are
+    # moved and relabelled as the list scrolls, so the cost of showing a
+    # list depends on the window height rather than on len(items).
+    def __init__(self, parent, format_item, button_text, command, row_height=ROW_HEIGHT):
+        super().__init__(parent)
+        self.format_item = format_item
+        self.button_text = button_text
+        self.command = command
+        self.row_height = row_height
+        self.items = []
+        self.rows = []
+        self.canvas = tk.Canvas(self, bg="#2e2e2e", highlightthickness=0,
+                                yscrollincrement=row_height)
+        scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.canvas.bind("<Configure>", lambda e: self.refresh())
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def set_items(self, items):
+        self.items = items
+        self.canvas.yview_moveto(0)
+        self.refresh()
+
+    def create_row(self):
+        frame = ttk.Frame(self.canvas, padding=(10, 5))
+        label = ttk.Label(frame)
+        label.pack(side="left", padx=5)
+        button = ttk.Button(frame, text=self.button_text)
+        button.pack(side="right", padx=5)
+        window = self.canvas.create_window(0, 0, window=frame, anchor="nw",
+                                           height=self.row_height, state="hidden")
+        row = {"frame": frame, "label": label, "button": button, "window": window, "item": None}
+        self.rows.append(row)
+        return row
+
+    def refresh(self):
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        self.canvas.configure(scrollregion=(0, 0, width, len(self.items) * self.row_height))
+        visible = height // self.row_height + 2
+        while len(self.rows) < visible:
+            self.create_row()
+        first = int(self.canvas.canvasy(0)) // self.row_height
+        for offset, row in enumerate(self.rows):
+            index = first + offset
+            if offset >= visible or index >= len(self.items):
+                self.canvas.itemconfigure(row["window"], state="hidden")
+                row["item"] = None
+                continue
+            item = self.items[index]
+            if row["item"] is not item:
+                row["label"].configure(text=self.format_item(item))
+                row["button"].configure(command=lambda i=item: self.command(i))
+                row["item"] = item
+            self.canvas.coords(row["window"], 0, index * self.row_height)
+            self.canvas.itemconfigure(row["window"], state="normal", width=width)
+
+
+class PagedTree(ttk.Frame):
+    # Treeview over a list of dated records that only holds one date range
+    # of rows at a time, newest range first. refresh() indexes records
+    # appended since the last call and inserts or rewrites only the rows
+    # on the page whose values changed, instead of rebuilding the tree.
+    def __init__(self, parent, columns, format_record, page_days=PAGE_DAYS):
+        super().__init__(parent)
+        self.setup_pages(format_record, page_days)
+        nav = ttk.Frame(self)
+        nav.pack(fill="x")
+        ttk.Button(nav, text="< Older", command=self.older).pack(side="left", padx=5)
+        ttk.Button(nav, text="Newer >", command=self.newer).pack(side="left", padx=5)
+        ttk.Button(nav, text="Latest", command=self.latest).pack(side="left", padx=5)
+        self.range_label = ttk.Label(nav)
+        self.range_label.pack(side="left", padx=10)
+        self.tree = ttk.Treeview(self, columns=columns, show="headings")
+        self.tree.pack(fill="both", expand=True, pady=5)
+
+    def setup_pages(self, format_record, page_days):
+        # Paging state, apart from the widgets that show it.
+        self.format_record = format_record
+        self.page_days = page_days
+        self.records = None
+        self.count = 0
+        self.index = []
+        self.shown = {}
+        self.end = None
+        self.lo = self.hi = 0
+
+    def refresh(self, records):
+        if records is not self.records or len(records) < self.count:
+            self.tree.delete(*self.tree.get_children())
+            self.records = records
+            self.count = 0
+            self.index = []
+            self.shown = {}
+        for position in range(self.count, len(records)):
+            bisect.insort(self.index, (date_ordinal(records[position].get("date")), position))
+        self.count = len(records)
+        self.show_page()
+
+    def page_range(self):
+        # The page ends at self.end, or at the newest record when following
+        # the latest entries.
+        end = self.end
+        if end is None:
+            end = self.index[-1][0] if self.index else 1
+        return end - self.page_days + 1, end
+
+    def show_page(self):
+        start, end = self.page_range()
+        self.lo = bisect.bisect_left(self.index, (start, -1))
+        self.hi = bisect.bisect_left(self.index, (end + 1, -1))
+        page = self.index[self.lo:self.hi]
+        keep = {position for _, position in page}
+        for position in [p for p in self.shown if p not in keep]:
+            self.tree.delete(str(position))
+            del self.shown[position]
+        for row, (_, position) in enumerate(page):
+            values = self.format_record(self.records[position])
+            shown = self.shown.get(position)
+            if shown is None:
+                self.tree.insert("", row, iid=str(position), values=values)
+            elif shown != values:
+                self.tree.item(str(position), values=values)
+            self.shown[position] = values
+        first, last = date.fromordinal(max(start, 1)), date.fromordinal(end)
+        self.range_label.configure(text=f"{first:%m/%d/%Y} - {last:%m/%d/%Y}   "
+                                        f"({len(page)} of {len(self.index)} records)")
+
+    def older(self):
+        # Jump to the range ending at the closest older record, skipping gaps.
+        if self.lo > 0:
+            self.end = self.index[self.lo - 1][0]
+            self.show_page()
+
+    def newer(self):
+        if self.hi < len(self.index):
+            end = self.index[self.hi][0] + self.page_days - 1
+            self.end = None if end >= self.index[-1][0] else end
+            self.show_page()
+
+    def latest(self):
+        self.end = None
+        self.show_page()
+
+
+# Zoom levels of a TrendChart: label and days shown, None for everything.
+ZOOM_LEVELS = (("3M", 90), ("1Y", 365), ("5Y", 5 * 365), ("All", None))
+CHART_HEIGHT = 220
+CHART_MARGIN = (50, 10, 10, 25)
+CHART_BACKGROUND = "#2e2e2e"
+CHART_FOREGROUND = "#cccccc"
+# Downsampled series kept per chart, across lines, zoom levels and widths.
+CHART_CACHE = 16
+
+
+class TrendChart(ttk.Frame):
+    # Line chart of TimeSeries columns on a Canvas. Each line is
+    # downsampled to about one point per pixel column with bucketed LTTB
+    # (see tracker.downsample); the sampler for a line at a given number
+    # of days per pixel is cached, so switching zoom levels back and forth
+    # reuses it, and refresh() only feeds it the rows appended since the
+    # last call. Redrawing moves the existing line items; the axes are only
+    # redrawn when their range changes.
+    def __init__(self, parent, lines, zoom="1Y", height=CHART_HEIGHT):
+        super().__init__(parent)
+        self.lines = lines
+        self.series = None
+        self.inserts = 0
+        self.samplers = OrderedDict()
+        self.items = {}
+        self.axes = None
+        controls = ttk.Frame(self)
+        controls.pack(fill="x")
+        self.zoom_var = tk.StringVar(value=zoom)
+        for label, _ in ZOOM_LEVELS:
+            ttk.Radiobutton(controls, text=label, value=label, variable=self.zoom_var,
+                            command=self.redraw).pack(side="left", padx=3)
+        self.legend = ttk.Frame(controls)
+        self.legend.pack(side="left", padx=10)
+        self.canvas = tk.Canvas(self, height=height, background=CHART_BACKGROUND, highlightthickness=0)
+        self.canvas.pack(fill="both", expand=True, pady=5)
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.set_lines(lines)
+
+    def set_lines(self, lines):
+        # lines are (field, label, color) or (field, label, color, dash).
+        self.lines = lines
+        for item in self.items.values():
+            self.canvas.delete(item)
+        self.items = {}
+        for label in self.legend.winfo_children():
+            label.destroy()
+        for line in lines:
+            ttk.Label(self.legend, text=line[1], foreground=line[2]).pack(side="left", padx=5)
+        self.axes = None
+        self.redraw()
+
+    def refresh(self, series):
+        # A different series, or one with rows inserted out of order,
+        # invalidates every cached sampler.
+        if series is not self.series or series.inserts != self.inserts:
+            self.series = series
+            self.inserts = series.inserts
+            self.samplers.clear()
+        self.redraw()
+
+    def sampler(self, field, width):
+        # The cached sampler, brought up to date with the series.
+        key = (field, width)
+        entry = self.samplers.get(key)
+        if entry is None:
+            entry = self.samplers[key] = [BucketedLTTB(width), 0]
+            while len(self.samplers) > CHART_CACHE:
+                self.samplers.popitem(last=False)
+        self.samplers.move_to_end(key)
+        sampler, count = entry
+        days, values = self.series.days, self.series.columns[field]
+        if count < len(days):
+            sampler.extend(zip(days[count:], values[count:]))
+            entry[1] = len(days)
+        return sampler
+
+    def plot_area(self):
+        left, right, top, bottom = CHART_MARGIN
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        return left, top, max(width - right, left + 1), max(height - bottom, top + 1)
+
+    def redraw(self):
+        # Nothing to draw before the canvas has been laid out.
+        if self.series is None or not len(self.series) or self.canvas.winfo_width() <= 1:
+            return
+        x0, y0, x1, y1 = self.plot_area()
+        days = dict(ZOOM_LEVELS)[self.zoom_var.get()]
+        end = self.series.days[-1]
+        start = self.series.days[0] if days is None else max(end - days + 1, self.series.days[0])
+        span = max(end - start + 1, 1)
+        per_pixel = max(1, -(-span // (x1 - x0)))
+        points = {line[0]: self.sampler(line[0], per_pixel).points(start, end) for line in self.lines}
+        values = [y for line in points.values() for _, y in line]
+        if not values:
+            return
+        low, high = min(values), max(values)
+        pad = (high - low) * 0.05 or 1.0
+        low, high = low - pad, high + pad
+        self.draw_axes(start, end, low, high)
+        scale_x = (x1 - x0) / span
+        scale_y = (y1 - y0) / (high - low)
+        for field, label, color, *dash in self.lines:
+            coords = []
+            for day, value in points[field]:
+                coords.append(x0 + (day - start) * scale_x)
+                coords.append(y1 - (value - low) * scale_y)
+            if len(coords) == 2:
+                coords *= 2
+            item = self.items.get(field)
+            if not coords:
+                if item is not None:
+                    self.canvas.coords(item, 0, 0, 0, 0)
+                continue
+            if item is None:
+                self.items[field] = self.canvas.create_line(*coords, fill=color, width=2,
+                                                            dash=dash[0] if dash else None)
+            else:
+                self.canvas.coords(item, *coords)
+
+    def draw_axes(self, start, end, low, high):
+        x0, y0, x1, y1 = self.plot_area()
+        axes = (start, end, low, high, x0, y0, x1, y1)
+        if axes == self.axes:
+            return
+        self.axes = axes
+        self.canvas.delete("axis")
+        self.canvas.create_rectangle(x0, y0, x1, y1, outline="#555555", tags="axis")
+        for i in range(5):
+            y = y1 - (y1 - y0) * i / 4
+            value = low + (high - low) * i / 4
+            self.canvas.create_line(x0, y, x1, y, fill="#444444", tags="axis")
+            self.canvas.create_text(x0 - 5, y, text=f"{value:.1f}", anchor="e",
+                                    fill=CHART_FOREGROUND, tags="axis")
+        for x, day, anchor in ((x0, start, "nw"), (x1, end, "ne")):
+            self.canvas.create_text(x, y1 + 5, text=f"{date.fromordinal(day):%m/%d/%Y}", anchor=anchor,
+                                    fill=CHART_FOREGROUND, tags="axis")
+        self.canvas.tag_lower("axis")